@@ -0,0 +1,278 @@
+import json
+import math
+import os
+import threading
+import time
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Bucket width in seconds, finest first
+GRANULARITIES = {'minute': 60, 'hour': 3600, 'day': 86400}
+DEFAULT_RETENTION_DAYS = {'minute': 2, 'hour': 90, 'day': 1825}
+
+
+def bucket_start(when, granularity):
+    """Epoch start of the bucket holding `when`, aligned to local time like
+    the labels, so day buckets start at local midnight"""
+    if granularity == 'day':
+        midnight = datetime.fromtimestamp(when).replace(hour=0, minute=0, second=0, microsecond=0)
+        return int(midnight.timestamp())
+    width = GRANULARITIES[granularity]
+    offset = time.localtime(when).tm_gmtoff
+    return int((when + offset) // width * width - offset)
+
+
+def bucket_starts(start, end, granularity):
+    """Starts of the buckets overlapping [start, end)"""
+    current = bucket_start(start, granularity)
+    while current < end:
+        yield current
+        # Half a bucket past the next start, as local days are not always 24h
+        current = bucket_start(current + GRANULARITIES[granularity] * 1.5, granularity)
+
+
+class LatencySketch:
+    """Quantile sketch over log-spaced buckets (as in DDSketch).
+
+    Any quantile is within `accuracy` relative error of the true value, the
+    size depends on the spread of values rather than their number, and two
+    sketches merge by adding their bucket counts, which is what lets hourly
+    and daily rollups be built from minutes and ranges be answered by
+    merging buckets.
+    """
+
+    MIN_VALUE = 0.001  # values below this land in a single zero bucket
+
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.bins = {}  # bucket index -> count
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        if value < self.MIN_VALUE:
+            self.zeros += 1
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other):
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+
+    def quantiles(self, qs):
+        """Values at each of the ascending quantiles `qs`, in one pass"""
+        if not self.count:
+            return [None] * len(qs)
+        results = []
+        pending = iter(qs)
+        q = next(pending, None)
+        seen = self.zeros
+        while q is not None and q * (self.count - 1) < seen:
+            results.append(0.0)
+            q = next(pending, None)
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            while q is not None and q * (self.count - 1) < seen:
+                results.append(round(2 * self._gamma ** index / (self._gamma + 1), 3))
+                q = next(pending, None)
+            if q is None:
+                break
+        return results + [None] * (len(qs) - len(results))
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+    def summary(self):
+        p50, p95, p99 = self.quantiles([0.50, 0.95, 0.99])
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'p50': p50,
+            'p95': p95,
+            'p99': p99
+        }
+
+    def to_dict(self):
+        return {'bins': {str(index): count for index, count in self.bins.items()},
+                'zeros': self.zeros, 'count': self.count, 'total': self.total}
+
+    @classmethod
+    def from_dict(cls, data, accuracy=0.01):
+        sketch = cls(accuracy)
+        sketch.bins = {int(index): count for index, count in data.get('bins', {}).items()}
+        sketch.zeros = data.get('zeros', 0)
+        sketch.count = data.get('count', 0)
+        sketch.total = data.get('total', 0.0)
+        return sketch
+
+
+class Rollup:
+    """Counts by status, retries and latency sketches for one time bucket"""
+
+    def __init__(self):
+        self.counts = {}
+        self.retries = 0
+        self.latencies = {}  # name -> LatencySketch
+
+    def add(self, status=None, retries=0, **latencies):
+        if status is not None:
+            self.counts[status] = self.counts.get(status, 0) + 1
+        self.retries += retries
+        for name, value in latencies.items():
+            if value is not None:
+                self.latencies.setdefault(name, LatencySketch()).add(value)
+
+    def merge(self, other):
+        for status, count in other.counts.items():
+            self.counts[status] = self.counts.get(status, 0) + count
+        self.retries += other.retries
+        for name, sketch in other.latencies.items():
+            self.latencies.setdefault(name, LatencySketch()).merge(sketch)
+
+    def summary(self):
+        total = sum(self.counts.values())
+        finished = self.counts.get('success', 0) + self.counts.get('failed', 0) + self.counts.get('error', 0)
+        return {
+            'total': total,
+            'counts': dict(self.counts),
+            'success_rate': round(self.counts.get('success', 0) / finished, 4) if finished else None,
+            'retries': self.retries,
+            'latency': {name: sketch.summary() for name, sketch in self.latencies.items()}
+        }
+
+    def to_dict(self):
+        return {'counts': self.counts, 'retries': self.retries,
+                'latencies': {name: sketch.to_dict() for name, sketch in self.latencies.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        rollup = cls()
+        rollup.counts = dict(data.get('counts', {}))
+        rollup.retries = data.get('retries', 0)
+        rollup.latencies = {name: LatencySketch.from_dict(sketch)
+                            for name, sketch in data.get('latencies', {}).items()}
+        return rollup
+
+
+class AnalyticsStore:
+    """Minute, hour and day rollups per series, updated as sends finish.
+
+    Recording touches one bucket per granularity, and a range query merges
+    at most a bounded number of buckets, so neither depends on how much
+    history exists. Buckets older than their granularity's retention are
+    dropped. The rollups are written to `path` by save(), which only does
+    any work when something changed.
+    """
+
+    MAX_QUERY_BUCKETS = 1500
+
+    def __init__(self, path='analytics.json', retention_days=None):
+        self.path = path
+        self.retention_days = dict(DEFAULT_RETENTION_DAYS, **(retention_days or {}))
+        self._series = {}  # series -> granularity -> {bucket_start: Rollup}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def record(self, series, when=None, status=None, retries=0, **latencies):
+        """Count one finished send (and/or latencies) at epoch time `when`"""
+        when = time.time() if when is None else when
+        with self._lock:
+            granularities = self._series.setdefault(series, {name: {} for name in GRANULARITIES})
+            for name in GRANULARITIES:
+                buckets = granularities[name]
+                start = bucket_start(when, name)
+                rollup = buckets.get(start)
+                if rollup is None:
+                    rollup = buckets[start] = Rollup()
+                    self._prune(buckets, name, when)
+                rollup.add(status, retries, **latencies)
+            self._dirty = True
+
+    def _prune(self, buckets, granularity, now):
+        cutoff = now - self.retention_days[granularity] * 86400
+        for start in [start for start in buckets if start < cutoff]:
+            del buckets[start]
+
+    def choose_granularity(self, start, end):
+        """Finest granularity that still covers `start` and fits the bucket limit"""
+        now = time.time()
+        for name, width in GRANULARITIES.items():
+            if start >= now - self.retention_days[name] * 86400 and (end - start) / width <= self.MAX_QUERY_BUCKETS:
+                return name
+        return 'day'
+
+    def query(self, series, start, end, granularity=None):
+        """Per-bucket summaries between epoch times start and end, plus their merged total"""
+        granularity = granularity or self.choose_granularity(start, end)
+        width = GRANULARITIES[granularity]
+        if (end - start) / width > self.MAX_QUERY_BUCKETS:
+            raise ValueError(f'Range too large for {granularity} buckets, use a coarser granularity')
+
+        total = Rollup()
+        results = []
+        with self._lock:
+            buckets = self._series.get(series, {}).get(granularity, {})
+            for start_time in bucket_starts(start, end, granularity):
+                rollup = buckets.get(start_time)
+                if rollup is None:
+                    continue
+                total.merge(rollup)
+                results.append(dict(rollup.summary(),
+                                    start=datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S')))
+        return {'granularity': granularity, 'buckets': results, 'total': total.summary()}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {series: {name: {str(start): rollup.to_dict() for start, rollup in buckets.items()}
+                             for name, buckets in granularities.items()}
+                    for series, granularities in self._series.items()}
+            self._dirty = False
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            self._dirty = True
+            raise
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error("Could not load analytics rollups from %s: %s", self.path, e)
+            return
+        now = time.time()
+        with self._lock:
+            for series, granularities in data.items():
+                target = self._series.setdefault(series, {name: {} for name in GRANULARITIES})
+                for name, buckets in granularities.items():
+                    if name not in GRANULARITIES:
+                        continue
+                    target[name] = {}
+                    for start, rollup in buckets.items():
+                        # Buckets saved before they were aligned to local time
+                        # are folded into the local bucket holding their start
+                        aligned = bucket_start(int(start), name)
+                        if aligned in target[name]:
+                            target[name][aligned].merge(Rollup.from_dict(rollup))
+                        else:
+                            target[name][aligned] = Rollup.from_dict(rollup)
+                    self._prune(target[name], name, now)
+        logger.info("Loaded analytics rollups for %s series", len(data))
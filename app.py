@@ -1,39 +1,267 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import json
+import math
 import os
-from datetime import datetime
-import threading
-from whatsapp_auto import WhatsAppBot
-import schedule
+import bisect
+import hmac
+import csv
+import io
+import zlib
+from datetime import datetime, timedelta
+from whatsapp_auto import WhatsAppBot, WHATSAPP_WEB_URL
+from scheduler import ScheduleEngine, SCHEDULE_TYPES, compute_next_fire, spread_offset, smoothing_window
+from rate_limiter import TokenBucket
+from dispatcher import SendDispatcher, QueueFull
+from campaigns import CampaignManager
+from request_status import RequestStatusStore, IdempotencyCache
+from events import EventHub
+from webhooks import WebhookNotifier, callback_target_error
+from receipts import ReceiptTracker
+from metrics import MetricsRegistry
+from tracing import tracer, Trace
+from timeouts import AdaptiveTimeouts
+from analytics import AnalyticsStore, GRANULARITIES
+from archive import HistoryArchive, ARCHIVED_KINDS
+from profiler import SamplingProfiler, CallTimer
 import time
 import uuid
+import threading
 import logging
-from logging.handlers import RotatingFileHandler
+from structured_logging import LogPipeline
 import signal
 import sys
-from queue import Queue
 import atexit
 
 app = Flask(__name__)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(name)s %(message)s',
-    handlers=[
-        RotatingFileHandler('whatsapp_otp_service.log', maxBytes=10485760, backupCount=5),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging: every thread enqueues, one listener thread owns the log file
+log_pipeline = LogPipeline('whatsapp_otp_service.log', max_bytes=10485760, backup_count=5)
+log_pipeline.install()
+atexit.register(log_pipeline.stop)  # runs after cleanup_service, so its messages are written
 logger = logging.getLogger(__name__)
 
 # Global variables for OTP service
 bot = None
-bot_thread = None
+bot_factory = WhatsAppBot  # Called with the bot's settings; benchmarks swap in a stub sender
 is_bot_running = False
 is_service_running = True
-otp_queue = Queue()
-otp_processor_thread = None
+send_rate_limiter = TokenBucket(60)
+dispatcher = SendDispatcher(send_rate_limiter)  # Sole owner of the browser
+otp_status_store = RequestStatusStore()
+idempotency_cache = IdempotencyCache()
+status_events = EventHub()  # Push feed of OTP status transitions
+dashboard_events = EventHub(maxlen=2000)  # Change feed patched into open dashboards
+webhook_notifier = WebhookNotifier()
+wait_timeouts = AdaptiveTimeouts()  # Learned browser wait limits, kept across bot restarts
+analytics_store = AnalyticsStore()  # Minute/hour/day rollups behind /api/analytics
+history_archive = HistoryArchive()  # Compressed segments of history older than the hot window
+sampling_profiler = SamplingProfiler()  # On-demand all-thread stack sampling
+bot_call_timer = CallTimer()  # Per-function timings of bot sends while switched on
+
+# In-process metrics, scraped from /metrics without touching config.json
+metrics = MetricsRegistry()
+otp_enqueued_total = metrics.counter('whatsapp_otp_enqueued_total', 'OTP requests accepted into the queue')
+otp_rejected_total = metrics.counter('whatsapp_otp_rejected_total', 'OTP requests shed by admission control',
+                                     ['reason'])
+otp_results_total = metrics.counter('whatsapp_otp_results_total', 'Finished OTP requests by final status',
+                                    ['status'])
+otp_retries_total = metrics.counter('whatsapp_otp_retries_total', 'OTP send attempts that had to be retried')
+otp_failures_total = metrics.counter('whatsapp_otp_failures_total', 'Failed OTP send attempts by cause', ['cause'])
+messages_total = metrics.counter('whatsapp_messages_total', 'Non-OTP messages sent by status', ['status'])
+browser_starts_total = metrics.counter('whatsapp_browser_starts_total', 'Browser (re)starts by outcome', ['result'])
+send_duration_seconds = metrics.histogram('whatsapp_send_duration_seconds',
+                                          'Browser time per send by the strategy that delivered it', ['strategy'])
+receipt_latency_seconds = metrics.histogram('whatsapp_receipt_latency_seconds',
+                                            'Time from send to each receipt tick', ['stage'],
+                                            buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 3600))
+metrics.gauge('whatsapp_dispatch_queue_depth', 'Jobs waiting per dispatcher lane', ['lane'],
+              callback=lambda: {(lane,): stats['depth'] for lane, stats in dispatcher.stats().items()})
+metrics.gauge('whatsapp_dispatch_service_estimate_seconds', 'Recent browser time per job per lane', ['lane'],
+              callback=lambda: {(lane,): stats['service_estimate'] for lane, stats in dispatcher.stats().items()})
+metrics.gauge('whatsapp_wait_timeout_seconds', 'Current learned timeout per browser wait', ['wait'],
+              callback=lambda: {(name,): wait['timeout'] for name, wait in wait_timeouts.stats().items()})
+metrics.gauge('whatsapp_bot_running', 'Whether the WhatsApp browser session is up',
+              callback=lambda: 1 if is_bot_running else 0)
+metrics.gauge('whatsapp_webhook_backlog', 'Webhook events waiting for delivery',
+              callback=lambda: webhook_notifier.stats()['backlog'])
+metrics.gauge('whatsapp_receipts_watching', 'Sent messages still being watched for receipts',
+              callback=lambda: receipt_tracker.stats()['watching'])
+metrics.gauge('whatsapp_process_start_time_seconds', 'Start time of the service since the epoch',
+              callback=lambda: metrics.started_at)
+metrics.counter('whatsapp_log_records_total', 'Log records emitted by level', ['level'],
+                callback=lambda: {(level,): count for level, count in log_pipeline.stats()['records'].items()})
+metrics.counter('whatsapp_log_dropped_total', 'Log records dropped because the log queue was full',
+                callback=lambda: log_pipeline.stats()['dropped'])
+metrics.gauge('whatsapp_log_queue_depth', 'Log records waiting for the writer thread',
+              callback=lambda: log_pipeline.queue.qsize())
+log_handler_seconds = metrics.histogram('whatsapp_log_handler_seconds', 'Writer-thread time per log record',
+                                        buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01, 0.1))
+log_pipeline.on_handled = log_handler_seconds.observe
+
+# Durable stats and history are buffered here and written to config.json
+# every stats_flush_interval_seconds rather than once per message
+stats_lock = threading.Lock()
+service_stats = {}  # running totals, seeded from config.json at startup
+stats_deltas = {}  # increments not yet flushed
+pending_history = {'otp_history': [], 'message_history': []}
+pending_otp_updates = {}  # request_id -> fields to merge into its otp_history entry
+stats_flush_stop = threading.Event()
+dashboard_publisher_stop = threading.Event()
+
+def bump_stats(*keys):
+    with stats_lock:
+        for key in keys:
+            service_stats[key] = service_stats.get(key, 0) + 1
+            stats_deltas[key] = stats_deltas.get(key, 0) + 1
+
+def current_stats():
+    """Running totals, including changes not yet flushed to config.json"""
+    with stats_lock:
+        if service_stats:
+            return dict(service_stats)
+    return load_config()['stats']
+
+def flush_stats():
+    """Write buffered stats and history to config.json in a single load/save"""
+    with stats_lock:
+        if not (stats_deltas or pending_otp_updates or any(pending_history.values())):
+            return
+        deltas = dict(stats_deltas)
+        histories = {kind: list(entries) for kind, entries in pending_history.items()}
+        updates = dict(pending_otp_updates)
+        stats_deltas.clear()
+        pending_otp_updates.clear()
+        for entries in pending_history.values():
+            entries.clear()
+    
+    try:
+        with config_lock:
+            config = load_config()
+            for key, delta in deltas.items():
+                config['stats'][key] = config['stats'].get(key, 0) + delta
+            archived_messages = config.get('history_offsets', {}).get('message_history', 0)
+            for history_entry in histories['message_history']:
+                history_entry['id'] = archived_messages + len(config['message_history'])
+                config['message_history'].append(history_entry)
+            config['otp_history'].extend(histories['otp_history'])
+            for otp_entry in reversed(config['otp_history']):
+                if not updates:
+                    break
+                fields = updates.pop(otp_entry.get('request_id'), None)
+                if fields:
+                    otp_entry.update(fields)
+            save_config(config)
+    except Exception:
+        # Put everything back for the next attempt
+        with stats_lock:
+            for key, delta in deltas.items():
+                stats_deltas[key] = stats_deltas.get(key, 0) + delta
+            for kind, entries in histories.items():
+                pending_history[kind][:0] = entries
+            for request_id, fields in updates.items():
+                pending_otp_updates[request_id] = dict(fields, **pending_otp_updates.get(request_id, {}))
+        raise
+
+def archive_history(hot_days):
+    """Move history older than the hot window from config.json into archive segments.
+    
+    Runs on the stats-flusher thread so it never interleaves with a flush.
+    config['history_offsets'] counts the entries moved out, which keeps
+    history cursors and message ids absolute.
+    """
+    cutoff = (datetime.now() - timedelta(days=hot_days)).strftime('%Y-%m-%d 00:00:00')
+    with config_lock:
+        config = load_config()
+        offsets = config.setdefault('history_offsets', {})
+        moved = {}
+        for kind in ARCHIVED_KINDS:
+            entries = config.get(kind, [])
+            split = bisect.bisect_left([entry.get('timestamp', '') for entry in entries], cutoff)
+            if not split:
+                continue
+            history_archive.append(kind, offsets.get(kind, 0), entries[:split])
+            del entries[:split]
+            offsets[kind] = offsets.get(kind, 0) + split
+            moved[kind] = split
+        if moved:
+            save_config(config)
+    if moved:
+        logger.info("Archived history older than %s: %s", cutoff, moved)
+    return moved
+
+def run_stats_flusher(interval, hot_days=30, archive_interval=3600):
+    last_archive = 0
+    while not stats_flush_stop.wait(interval):
+        try:
+            flush_stats()
+        except Exception as e:
+            logger.error("Error flushing stats: %s", e)
+        try:
+            analytics_store.save()
+        except Exception as e:
+            logger.error("Error saving analytics rollups: %s", e)
+        if hot_days and time.time() - last_archive >= archive_interval:
+            last_archive = time.time()
+            try:
+                archive_history(hot_days)
+            except Exception as e:
+                logger.error("Error archiving history: %s", e)
+
+def dashboard_state():
+    """Stats, bot status and queue depth shown at the top of the dashboard"""
+    lanes = {lane: stats['depth'] for lane, stats in dispatcher.stats().items()}
+    return {
+        'stats': current_stats(),
+        'bot_running': is_bot_running,
+        'queue_depth': sum(lanes.values()),
+        'lanes': lanes
+    }
+
+def run_dashboard_publisher(interval):
+    """Publish dashboard_state() whenever it differs from the last one sent.
+    
+    One comparison per interval no matter how many dashboards are open;
+    idle dashboards see nothing until something actually changes.
+    """
+    last_state = None
+    while not dashboard_publisher_stop.wait(interval):
+        try:
+            state = dashboard_state()
+            if state != last_state:
+                dashboard_events.publish('state', state)
+                last_state = state
+        except Exception as e:
+            logger.error("Error publishing dashboard state: %s", e)
+
+def publish_otp_status(record):
+    """Status-store listener: fan transitions out to SSE streams and webhooks"""
+    event = RequestStatusStore.public(record)
+    status_events.publish('otp_status', event)
+    if record.get('callback_url') and record['status'] not in ('queued', 'sending'):
+        webhook_notifier.notify(record['callback_url'], event)
+
+otp_status_store.listeners.append(publish_otp_status)
+
+def apply_delivery_receipts(updates):
+    """Receipt-tracker callback: move requests through sent/delivered/read"""
+    for request_id, fields in updates:
+        otp_status_store.update(request_id, status=fields['delivery'],
+                                **{k: v for k, v in fields.items() if k != 'delivery'})
+        for stage in ('sent', 'delivered', 'read'):
+            if f'time_to_{stage}' in fields:
+                receipt_latency_seconds.observe(fields[f'time_to_{stage}'], stage=stage)
+        analytics_store.record('otp', **{k: v for k, v in fields.items() if k.startswith('time_to_')})
+        with stats_lock:
+            pending_otp_updates.setdefault(request_id, {}).update(fields)
+
+receipt_tracker = ReceiptTracker(apply_delivery_receipts)
+
+def poll_delivery_receipts():
+    """Dispatcher housekeeping: pick up receipt ticks seen since the last poll"""
+    if bot and bot.is_running:
+        receipt_tracker.poll(bot)
+
+dispatcher.housekeeping = poll_delivery_receipts
 
 def load_config():
     try:
@@ -51,7 +279,43 @@ def load_config():
                 'otp_message_template': "Your OTP verification code is: {otp_code}",
                 'rate_limit_per_minute': 60,
                 'max_retries': 3,
-                'retry_delay': 5
+                'retry_delay': 5,
+                'schedule_misfire_grace_seconds': 3600,
+                'schedule_spread_window_seconds': 60,
+                'dispatch_policy': 'strict',
+                'campaign_max_in_flight': 10,
+                'otp_batch_max_size': 500,
+                'idempotency_ttl_seconds': 900,
+                'coalesce_otps': True,
+                'otp_ttl_seconds': 300,
+                'otp_queue_capacity': 1000,
+                'otp_max_estimated_wait_seconds': 120,
+                'default_client_weight': 1,
+                'default_client_quota': 500,
+                'api_clients': {},
+                'webhook_workers': 4,
+                'webhook_max_attempts': 5,
+                'webhook_allowed_hosts': [],
+                'receipt_tracking': True,
+                'receipt_poll_interval_seconds': 2,
+                'receipt_timeout_seconds': 300,
+                'stats_flush_interval_seconds': 5,
+                'trace_buffer_size': 2000,
+                'trace_slowest_count': 50,
+                'wait_timeout_quantile': 0.99,
+                'wait_timeout_multiplier': 2.0,
+                'wait_timeout_limits': {},
+                'history_page_size': 50,
+                'dashboard_poll_timeout_seconds': 25,
+                'dashboard_state_interval_seconds': 1,
+                'analytics_retention_days': {'minute': 2, 'hour': 90, 'day': 1825},
+                'history_hot_days': 30,
+                'archive_partition': 'day',
+                'archive_interval_seconds': 3600,
+                'log_level': 'INFO',
+                'log_format': 'json',
+                'admin_token': '',
+                'whatsapp_web_url': WHATSAPP_WEB_URL
             },
             'stats': {
                 'total_messages': 0,
@@ -60,104 +324,190 @@ def load_config():
                 'pending': 0,
                 'otp_requests': 0,  # New: OTP specific stats
                 'otp_successful': 0,
-                'otp_failed': 0
+                'otp_failed': 0,
+                'otp_superseded': 0,
+                'otp_expired': 0
             }
         }
 
+_config_cache = {'mtime': None, 'config': None}
+_config_cache_lock = threading.Lock()
+
+def cached_config():
+    """Parsed config.json, re-read only when the file has changed.
+    
+    Shared between callers, so treat it as read-only; use load_config()
+    for anything that will be modified and saved.
+    """
+    try:
+        mtime = os.stat('config.json').st_mtime_ns
+    except FileNotFoundError:
+        return load_config()
+    with _config_cache_lock:
+        if _config_cache['mtime'] != mtime:
+            _config_cache['config'] = load_config()
+            _config_cache['mtime'] = mtime
+        return _config_cache['config']
+
+# Held around every load_config -> save_config update so that concurrent
+# writers (stats flusher, schedule engine, dashboard routes) don't drop each
+# other's changes
+config_lock = threading.RLock()
+
 def save_config(config):
-    with open('config.json', 'w') as f:
+    # Write-then-rename so readers on other threads never see a partial file
+    tmp_path = f'config.json.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
         json.dump(config, f, indent=4)
+    os.replace(tmp_path, 'config.json')
 
-def process_otp_queue():
-    """Continuously process OTP requests from the queue"""
-    global bot, is_service_running
+def send_via_bot(phone_number, message):
+    """Send through the running bot and record browser time by strategy.
     
-    logger.info("OTP queue processor started")
-    
-    while is_service_running:
+    Sends outside an OTP trace (scheduled, quick and campaign) get a trace
+    of their own, starting from when their dispatcher job was released.
+    """
+    job = dispatcher.current_job
+    with tracer.activate(kind=job.lane if job else 'send', queued_at=job.release_at if job else None,
+                         phone_number=phone_number):
+        started = time.time()
         try:
-            if not otp_queue.empty():
-                otp_request = otp_queue.get(timeout=1)
-                process_single_otp(otp_request)
-            else:
-                time.sleep(0.1)  # Short sleep when queue is empty
-        except Exception as e:
-            logger.error(f"Error in OTP queue processor: {str(e)}")
-            time.sleep(1)
-    
-    logger.info("OTP queue processor stopped")
+            with bot_call_timer.measure():
+                success = bot.send_message_to_number(phone_number, message)
+        except Exception:
+            send_duration_seconds.observe(time.time() - started, strategy='error')
+            raise
+        strategy = bot.last_send_strategy or 'failed'
+        send_duration_seconds.observe(time.time() - started, strategy=strategy)
+        tracer.annotate(strategy=strategy)
+        return success
 
 def process_single_otp(otp_request):
-    """Process a single OTP request"""
+    """Process a single OTP request (runs on the dispatcher thread)"""
+    with tracer.activate(otp_request['request_id'], kind='otp', phone_number=otp_request['phone_number']) as trace:
+        success = deliver_otp(otp_request)
+        record = otp_status_store.get(otp_request['request_id'])
+        trace.attrs['status'] = record['status'] if record else ('success' if success else 'failed')
+        return success
+
+def deliver_otp(otp_request):
+    """Send one OTP through the browser, with retries, and record the outcome"""
     global bot
     
     phone_number = otp_request['phone_number']
     otp_code = otp_request['otp_code']
     request_id = otp_request['request_id']
     
-    config = load_config()
+    config = cached_config()
     service_config = config['service_config']
     
     # Format the OTP message
     message = service_config['otp_message_template'].format(otp_code=otp_code)
     
-    logger.info(f"Processing OTP request {request_id} for {phone_number}")
+    # A newer OTP for the same number arrived while this one was queued
+    if not otp_status_store.mark_sending(request_id):
+        logger.info("Skipping superseded OTP request %s for %s", request_id, phone_number)
+        record = otp_status_store.get(request_id) or {}
+        record_otp_result(otp_request, message, 'superseded', 0, superseded_by=record.get('superseded_by'))
+        return False
+    
+    # Codes that are already stale are not worth any browser time
+    if otp_expired(otp_request, service_config):
+        logger.info("Dropping expired OTP request %s for %s", request_id, phone_number)
+        record_otp_result(otp_request, message, 'expired', 0)
+        return False
+    
+    logger.info("Processing OTP request %s for %s", request_id, phone_number)
     
     success = False
+    expired = False
+    tracked = False
     retries = 0
     max_retries = service_config['max_retries']
     retry_delay = service_config['retry_delay']
     
     while retries < max_retries and not success:
+        if retries and otp_expired(otp_request, service_config):
+            logger.info("OTP request %s expired after %s attempts, not retrying", request_id, retries)
+            expired = True
+            break
+        
         try:
             # Ensure bot is running
             if not bot or not bot.is_running:
                 logger.warning("Bot not running, attempting to restart...")
                 if not start_bot_internal():
                     logger.error("Failed to start bot for OTP processing")
+                    otp_failures_total.inc(cause='bot_unavailable')
                     break
             
-            success = bot.send_message_to_number(phone_number, message)
+            success = send_via_bot(phone_number, message)
             
             if success:
-                logger.info(f"OTP sent successfully to {phone_number}")
+                logger.info("OTP sent successfully to %s", phone_number)
+                if service_config.get('receipt_tracking', True):
+                    with tracer.span('receipts.track'):
+                        tracked = receipt_tracker.track(bot, request_id, phone_number)
             else:
-                logger.warning(f"Failed to send OTP to {phone_number}, attempt {retries + 1}")
+                logger.warning("Failed to send OTP to %s, attempt %s", phone_number, retries + 1)
+                otp_failures_total.inc(cause='send_failed')
                 
         except Exception as e:
-            logger.error(f"Error sending OTP to {phone_number}: {str(e)}")
+            logger.error("Error sending OTP to %s: %s", phone_number, e)
+            otp_failures_total.inc(cause='exception')
         
         if not success:
             retries += 1
             if retries < max_retries:
-                time.sleep(retry_delay)
+                otp_retries_total.inc()
+                with tracer.span('retry_delay', attempt=retries):
+                    time.sleep(retry_delay)
     
-    # Update statistics and history
-    config = load_config()
+    status = 'success' if success else ('expired' if expired else 'failed')
+    tracer.annotate(retries=retries)
+    record_otp_result(otp_request, message, status, retries, delivery='pending' if tracked else None)
+    
+    return success
+
+def otp_expired(otp_request, service_config):
+    """True once an OTP is older than its ttl_seconds (or the service default)"""
+    ttl_seconds = otp_request.get('ttl_seconds') or service_config.get('otp_ttl_seconds', 300)
+    if not ttl_seconds:
+        return False
+    age = (datetime.now() - datetime.fromisoformat(otp_request['timestamp'])).total_seconds()
+    return age > ttl_seconds
+
+def record_otp_result(otp_request, message, status, retries, **extra):
+    """Update statistics and history with the final outcome of an OTP request"""
     otp_history_entry = {
-        'request_id': request_id,
-        'phone_number': phone_number,
-        'otp_code': otp_code,
+        'request_id': otp_request['request_id'],
+        'phone_number': otp_request['phone_number'],
+        'otp_code': otp_request['otp_code'],
         'message': message,
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'status': 'success' if success else 'failed',
+        'status': status,
         'retries': retries
     }
+    otp_history_entry.update({k: v for k, v in extra.items() if v is not None})
     
-    config['otp_history'].append(otp_history_entry)
-    config['stats']['otp_requests'] += 1
+    with stats_lock:
+        pending_history['otp_history'].append(otp_history_entry)
+    otp_status_store.update(otp_request['request_id'], status=status, retries=retries)
+    otp_results_total.inc(status=status)
     
-    if success:
-        config['stats']['otp_successful'] += 1
-        config['stats']['successful'] += 1
-    else:
-        config['stats']['otp_failed'] += 1
-        config['stats']['failed'] += 1
-    
-    config['stats']['total_messages'] += 1
-    save_config(config)
+    # Time from acceptance to the message leaving the browser
+    latency = None
+    if status == 'success':
+        latency = time.time() - datetime.fromisoformat(otp_request['timestamp']).timestamp()
+    analytics_store.record('otp', status=status, retries=retries, delivery_time=latency)
     
-    return success
+    if status == 'success':
+        bump_stats('otp_requests', 'otp_successful', 'successful', 'total_messages')
+    elif status == 'failed':
+        bump_stats('otp_requests', 'otp_failed', 'failed', 'total_messages')
+    else:
+        # Dropped without any browser work
+        bump_stats('otp_requests', f'otp_{status}')
 
 def start_bot_internal():
     """Internal function to start the bot"""
@@ -168,19 +518,24 @@ def start_bot_internal():
             return True
             
         logger.info("Starting WhatsApp bot...")
-        bot = WhatsAppBot()
+        service_config = cached_config()['service_config']
+        bot = bot_factory(timeouts=wait_timeouts,
+                          base_url=service_config.get('whatsapp_web_url', WHATSAPP_WEB_URL))
         success = bot.start()
         
         if success:
             is_bot_running = True
+            browser_starts_total.inc(result='success')
             logger.info("Bot started successfully")
             return True
         else:
+            browser_starts_total.inc(result='failure')
             logger.error("Failed to start bot")
             return False
             
     except Exception as e:
-        logger.error(f"Error starting bot: {str(e)}")
+        browser_starts_total.inc(result='failure')
+        logger.error("Error starting bot: %s", e)
         return False
 
 def ensure_bot_running():
@@ -194,18 +549,33 @@ def ensure_bot_running():
 # Signal handlers for graceful shutdown
 def signal_handler(signum, frame):
     global is_service_running
-    logger.info(f"Received signal {signum}, shutting down gracefully...")
+    logger.info("Received signal %s, shutting down gracefully...", signum)
     is_service_running = False
     cleanup_service()
     sys.exit(0)
 
 def cleanup_service():
     """Cleanup resources before shutdown"""
-    global bot, is_bot_running, otp_processor_thread
+    global bot, is_bot_running
     
     logger.info("Cleaning up service...")
     is_service_running = False
     
+    campaign_manager.stop(timeout=1)
+    webhook_notifier.stop(timeout=1)
+    dispatcher.stop(timeout=5)
+    
+    stats_flush_stop.set()
+    dashboard_publisher_stop.set()
+    try:
+        flush_stats()
+    except Exception as e:
+        logger.error("Error flushing stats on shutdown: %s", e)
+    try:
+        analytics_store.save()
+    except Exception as e:
+        logger.error("Error saving analytics rollups on shutdown: %s", e)
+    
     if bot:
         try:
             bot.driver.quit()
@@ -214,136 +584,554 @@ def cleanup_service():
         bot = None
         is_bot_running = False
     
-    if otp_processor_thread and otp_processor_thread.is_alive():
-        otp_processor_thread.join(timeout=5)
+    schedule_engine.stop(timeout=1)
 
 # Register signal handlers
 signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 atexit.register(cleanup_service)
 
-def update_stats(config, status):
-    config['stats']['total_messages'] += 1
+def update_stats(status):
+    messages_total.inc(status=status)
+    analytics_store.record('messages', status=status)
     if status == 'success':
-        config['stats']['successful'] += 1
+        bump_stats('total_messages', 'successful')
     elif status == 'error':
-        config['stats']['failed'] += 1
+        bump_stats('total_messages', 'failed')
     else:
-        config['stats']['pending'] += 1
-    save_config(config)
+        bump_stats('total_messages', 'pending')
 
-def add_to_history(config, recipient, phone, message, status):
+def add_to_history(recipient, phone, message, status):
+    """Buffer a history entry; its id is assigned when it is flushed"""
     history_entry = {
-        'id': len(config['message_history']),
         'recipient': recipient,
         'phone': phone,
         'content': message,
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'status': status
     }
-    config['message_history'].append(history_entry)
-    update_stats(config, status)
-    save_config(config)
+    with stats_lock:
+        pending_history['message_history'].append(history_entry)
+    update_stats(status)
+    dashboard_events.publish('history', history_entry)
 
-def run_scheduled_messages():
-    global bot
-    while is_bot_running:
+def enqueue_scheduled_batch(batch):
+    """Fire callback for the schedule engine: spread due jobs over the smoothing window"""
+    service_config = load_config().get('service_config', {})
+    window = 0
+    if len(batch) > 1:
+        window = smoothing_window(len(batch),
+                                  service_config.get('rate_limit_per_minute', 60),
+                                  service_config.get('schedule_spread_window_seconds', 60))
+    now = time.time()
+    for schedule_item, fire_time in batch:
+        release_at = now + spread_offset(schedule_item['id'], fire_time, window)
+        dispatcher.submit('scheduled', send_fired_schedule, (schedule_item, fire_time), release_at=release_at)
+    logger.info("Queued %s scheduled sends over a %.0fs window", len(batch), window)
+
+def send_fired_schedule(item):
+    return send_scheduled_message(*item)
+
+def send_scheduled_message(schedule_item, fire_time):
+    """Send one fired schedule and record it in history"""
+    try:
+        config = load_config()
         try:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
-        except Exception as e:
-            print(f"Error in scheduled messages: {str(e)}")
-            time.sleep(5)  # Wait before retrying
+            recipient = config['recipients'][schedule_item['recipient_id']]
+            template = config['message_templates'][schedule_item['template_id']]
+        except (IndexError, KeyError):
+            logger.error("Schedule %s references a missing recipient or template", schedule_item['id'])
+            return
 
-def send_scheduled_message(recipient, template):
-    if bot and bot.is_running:
         message = template['content'].format(name=recipient['name'])
-        success = bot.send_message_to_number(recipient['phone'], message)
-        config = load_config()
-        add_to_history(config, recipient['name'], recipient['phone'], message, 
+        logger.info("Sending scheduled message %s (due %s)", schedule_item['id'], fire_time.isoformat())
+
+        success = False
+        if ensure_bot_running():
+            success = send_via_bot(recipient['phone'], message)
+        add_to_history(recipient['name'], recipient['phone'], message,
                       'success' if success else 'error')
+        return success
+    finally:
+        # A schedule with no further firings is only completed once its
+        # last send has run, whatever the outcome
+        if compute_next_fire(schedule_item, fire_time) is None:
+            persist_schedule_state([(schedule_item['id'], None, 'completed')])
 
-def setup_scheduled_message(schedule_item, recipient, template):
-    """Set up a scheduled message with the schedule library"""
-    schedule_type = schedule_item['schedule_type']
-    message = template['content'].format(name=recipient['name'])
-
-    job = None
-    if schedule_type == 'one_time':
-        # Parse the datetime string to get time
-        dt = datetime.fromisoformat(schedule_item['datetime'])
-        job = schedule.every().day.at(dt.strftime('%H:%M')).do(
-            send_scheduled_message, recipient, template
-        ).tag(f"schedule_{schedule_item['id']}")
-        
-    elif schedule_type == 'daily':
-        job = schedule.every().day.at(schedule_item['time']).do(
-            send_scheduled_message, recipient, template
-        ).tag(f"schedule_{schedule_item['id']}")
-        
-    elif schedule_type == 'weekly':
-        for day in schedule_item['days']:
-            job = schedule.every().week.days(day.lower()).at(schedule_item['time']).do(
-                send_scheduled_message, recipient, template
-            ).tag(f"schedule_{schedule_item['id']}")
-            
-    elif schedule_type == 'monthly':
-        time_parts = schedule_item['time'].split(':')
-        job = schedule.every().month.at(f"{schedule_item['day_of_month']}:{time_parts[0]}:{time_parts[1]}").do(
-            send_scheduled_message, recipient, template
-        ).tag(f"schedule_{schedule_item['id']}")
+def persist_schedule_state(updates):
+    """Write next-fire state back to config so restarts resume where we left off"""
+    with config_lock:
+        config = load_config()
+        by_id = {item['id']: item for item in config.get('scheduled_messages', [])}
+        for schedule_id, next_run, status in updates:
+            schedule_item = by_id.get(schedule_id)
+            if schedule_item is None:
+                continue
+            schedule_item['next_run'] = next_run
+            schedule_item['status'] = status
+        save_config(config)
 
-    return job is not None
+schedule_engine = ScheduleEngine(enqueue_scheduled_batch, persist_schedule_state)
 
-def setup_all_schedules():
-    """Set up all scheduled messages from config"""
-    config = load_config()
-    for schedule_item in config['scheduled_messages']:
-        if schedule_item['status'] == 'active':
-            try:
-                recipient = config['recipients'][schedule_item['recipient_id']]
-                template = config['message_templates'][schedule_item['template_id']]
-                setup_scheduled_message(schedule_item, recipient, template)
-            except Exception as e:
-                print(f"Error setting up schedule {schedule_item['id']}: {str(e)}")
+# History entries are append-only, so a position in the list is a stable cursor
+HISTORY_PHONE_FIELDS = {'message_history': 'phone', 'otp_history': 'phone_number'}
+OTP_HISTORY_HIDDEN_FIELDS = ('otp_code', 'message')
+
+class HistoryView:
+    """Durable history plus the entries still waiting to be flushed, as one
+    indexable sequence without copying the durable part"""
+    
+    def __init__(self, kind):
+        config = cached_config()
+        self.kind = kind
+        self.archived = config.get('history_offsets', {}).get(kind, 0)
+        self.durable = config.get(kind, [])
+        with stats_lock:
+            self.pending = list(pending_history[kind])
+            self.updates = dict(pending_otp_updates) if kind == 'otp_history' else {}
+        self.phone_field = HISTORY_PHONE_FIELDS[kind]
+    
+    def __len__(self):
+        return self.archived + len(self.durable) + len(self.pending)
+    
+    def __getitem__(self, position):
+        if position < self.archived:
+            return history_archive.entry_at(self.kind, position)
+        position -= self.archived
+        if position < len(self.durable):
+            entry = self.durable[position]
+        else:
+            entry = self.pending[position - len(self.durable)]
+        if entry.get('request_id') in self.updates:
+            # Receipt changes not flushed yet
+            entry = dict(entry, **self.updates[entry['request_id']])
+        return entry
+    
+    def first_since(self, since, start):
+        """Position of the first hot entry at or after `since`, by binary search"""
+        lo = start - self.archived
+        hi = len(self.durable)
+        if lo >= hi:
+            return start
+        lo = max(0, lo)
+        # bisect_left by timestamp, written out since bisect's key= needs Python 3.10
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.durable[mid].get('timestamp', '') < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return self.archived + lo
+    
+    def matches(self, entry, status=None, phone=None):
+        if status and status not in (entry.get('status'), entry.get('delivery')):
+            return False
+        if phone and phone not in ''.join(filter(str.isdigit, str(entry.get(self.phone_field, '')))):
+            return False
+        return True
+
+def paginate_history(kind, cursor=None, limit=50, status=None, phone=None, since=None, until=None):
+    """One page of history, newest first, and the cursor of the next older page.
+    
+    Walks backwards from `cursor` (exclusive) over the durable history and
+    the entries still waiting to be flushed, so the cost depends on the
+    page size and the filters, not on how long the history is.
+    """
+    history = HistoryView(kind)
+    position = len(history) if cursor is None else min(cursor, len(history))
+    
+    items = []
+    while position > 0 and len(items) < limit:
+        position -= 1
+        entry = history[position]
+        timestamp = entry.get('timestamp', '')
+        if until and timestamp > until:
+            continue
+        if since and timestamp < since:
+            # History is chronological: nothing older can match
+            position = 0
+            break
+        if history.matches(entry, status, phone):
+            items.append(entry)
+    return items, (str(position) if position > 0 else None)
+
+def iter_history(kind, cursor=0, status=None, phone=None, since=None, until=None):
+    """Yield (cursor, entry) oldest first from position `cursor`.
+    
+    Each cursor is where to resume after that entry. Entries added after
+    the call are not included.
+    """
+    history = HistoryView(kind)
+    position, end = cursor, len(history)
+    if position < history.archived:
+        # The archive index skips segments outside the date range
+        for archived_position, entry in history_archive.iter_records(kind, position, since, until):
+            if archived_position >= history.archived:
+                break
+            timestamp = entry.get('timestamp', '')
+            if until and timestamp > until:
+                return
+            if (not since or timestamp >= since) and history.matches(entry, status, phone):
+                yield archived_position + 1, entry
+        position = history.archived
+    if since:
+        position = history.first_since(since, position)
+    while position < end:
+        entry = history[position]
+        position += 1
+        if until and entry.get('timestamp', '') > until:
+            break
+        if history.matches(entry, status, phone):
+            yield position, entry
+
+def parse_history_args(args):
+    """Validate paging and filter query parameters; returns (kwargs, error)"""
+    max_page = load_config().get('service_config', {}).get('history_page_size', 50) * 10
+    try:
+        cursor = int(args['cursor']) if args.get('cursor') else None
+        limit = int(args.get('limit', 50))
+    except ValueError:
+        return None, 'Invalid cursor or limit'
+    if (cursor is not None and cursor < 0) or not 0 < limit <= max_page:
+        return None, f'limit must be between 1 and {max_page}'
+    
+    bounds = {}
+    for name in ('since', 'until'):
+        value = args.get(name)
+        if not value:
+            continue
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None, f'Invalid {name}, expected YYYY-MM-DD or YYYY-MM-DD HH:MM:SS'
+        if name == 'until' and len(value) == 10:
+            # A bare date includes the whole day
+            parsed = parsed.replace(hour=23, minute=59, second=59)
+        bounds[name] = parsed.strftime('%Y-%m-%d %H:%M:%S')
+    
+    phone = ''.join(filter(str.isdigit, args.get('phone', '')))
+    return {'cursor': cursor, 'limit': limit, 'status': args.get('status') or None,
+            'phone': phone or None, **bounds}, None
+
+@app.route('/api/history', methods=['GET'])
+def get_message_history():
+    """Cursor-paginated message history, newest first"""
+    kwargs, error = parse_history_args(request.args)
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+    items, next_cursor = paginate_history('message_history', **kwargs)
+    return jsonify({'status': 'success', 'items': items, 'next_cursor': next_cursor}), 200
+
+@app.route('/api/otp-history', methods=['GET'])
+def get_otp_history():
+    """Cursor-paginated OTP history, newest first; codes are never returned"""
+    kwargs, error = parse_history_args(request.args)
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+    items, next_cursor = paginate_history('otp_history', **kwargs)
+    items = [{k: v for k, v in item.items() if k not in OTP_HISTORY_HIDDEN_FIELDS} for item in items]
+    return jsonify({'status': 'success', 'items': items, 'next_cursor': next_cursor}), 200
+
+EXPORT_KINDS = {'history': 'message_history', 'otp-history': 'otp_history'}
+EXPORT_COLUMNS = {
+    'message_history': ['cursor', 'id', 'timestamp', 'recipient', 'phone', 'content', 'status'],
+    'otp_history': ['cursor', 'request_id', 'timestamp', 'phone_number', 'status', 'retries', 'delivery',
+                    'sent_at', 'delivered_at', 'read_at', 'time_to_sent', 'time_to_delivered', 'time_to_read',
+                    'superseded_by']
+}
+EXPORT_CHUNK_BYTES = 65536
+
+def generate_export(kind, fmt, compress, **filters):
+    """Encode iter_history() as NDJSON or CSV, a chunk at a time"""
+    columns = EXPORT_COLUMNS[kind]
+    compressor = zlib.compressobj(wbits=31) if compress else None  # gzip container
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, columns, extrasaction='ignore') if fmt == 'csv' else None
+    if writer:
+        writer.writeheader()
+    
+    def drain(final=False):
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        if compressor:
+            data = compressor.compress(data) + (compressor.flush() if final else b'')
+        return data
+    
+    for cursor, entry in iter_history(kind, **filters):
+        if kind == 'otp_history':
+            entry = {k: v for k, v in entry.items() if k not in OTP_HISTORY_HIDDEN_FIELDS}
+        row = dict(entry, cursor=cursor)
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row) + '\n')
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            chunk = drain()
+            if chunk:
+                yield chunk
+    yield drain(final=True)
+
+@app.route('/api/export/<kind>', methods=['GET'])
+def export_history(kind):
+    """Stream history oldest first as NDJSON or CSV, optionally gzipped"""
+    if kind not in EXPORT_KINDS:
+        return jsonify({'status': 'error', 'message': 'Unknown export, use history or otp-history'}), 404
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'status': 'error', 'message': 'format must be ndjson or csv'}), 400
+    kwargs, error = parse_history_args(request.args)
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+    kwargs.pop('limit')
+    kwargs['cursor'] = kwargs['cursor'] or 0
+    compress = request.args.get('gzip') == '1'
+    
+    filename = f"{EXPORT_KINDS[kind]}.{fmt}" + ('.gz' if compress else '')
+    mimetype = 'application/gzip' if compress else ('text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    return Response(stream_with_context(generate_export(EXPORT_KINDS[kind], fmt, compress, **kwargs)),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Accel-Buffering': 'no'})
 
 @app.route('/')
 def index():
-    config = load_config()
+    # Taken first so nothing added while rendering can be missed by the feed
+    dashboard_version = dashboard_events.version
+    config = cached_config()
+    page_size = config.get('service_config', {}).get('history_page_size', 50)
+    history, history_cursor = paginate_history('message_history', limit=page_size)
     return render_template('index.html', 
                          recipients=config['recipients'],
                          templates=config['message_templates'],
                          scheduled_messages=config['scheduled_messages'],
-                         message_history=config['message_history'],
-                         stats=config['stats'])
+                         message_history=list(reversed(history)),
+                         history_cursor=history_cursor,
+                         history_page_size=page_size,
+                         dashboard_version=dashboard_version,
+                         stats=current_stats())
+
+def send_quick_message(item):
+    """Interactive-lane handler for /send_message"""
+    phone_number, message = item
+    
+    # Check if bot is running, if not start it
+    if not ensure_bot_running():
+        return None
+    
+    success = send_via_bot(phone_number, message)
+    
+    # Add to history only once with the final status
+    add_to_history("Quick Send", phone_number, message, 
+                  'success' if success else 'error')
+    return success
 
 @app.route('/send_message', methods=['POST'])
 def send_message():
-    global bot
     try:
-        # Check if bot is running, if not start it
-        if not ensure_bot_running():
-            return jsonify({'status': 'error', 'message': 'Failed to start bot'})
-        
         phone_number = request.form['phone']
         message = request.form['message']
         
-        success = bot.send_message_to_number(phone_number, message)
-        
-        # Add to history only once with the final status
-        config = load_config()
-        add_to_history(config, "Quick Send", phone_number, message, 
-                      'success' if success else 'error')
+        job = dispatcher.submit('interactive', send_quick_message, (phone_number, message))
+        if not job.wait(timeout=120):
+            return jsonify({'status': 'success', 'message': 'Message queued, still waiting for the browser'})
         
+        success = job.result
+        if success is None:
+            return jsonify({'status': 'error', 'message': 'Failed to start bot'})
         if success:
             return jsonify({'status': 'success', 'message': 'Message sent successfully'})
         else:
             return jsonify({'status': 'error', 'message': 'Failed to send message'})
             
     except Exception as e:
-        logger.error(f"Error sending message: {str(e)}")
+        logger.error("Error sending message: %s", e)
         return jsonify({'status': 'error', 'message': str(e)})
 
+# Longest per-request ttl_seconds accepted; an OTP older than this is useless
+MAX_OTP_TTL_SECONDS = 86400
+
+def build_otp_request(data, client_ip):
+    """Validate and normalize one OTP submission; returns (otp_request, error_message)"""
+    if not isinstance(data, dict):
+        return None, 'Invalid JSON data'
+    
+    # Validate required fields
+    phone_number = data.get('phone_number')
+    otp_code = data.get('otp_code')
+    
+    if not phone_number or not otp_code:
+        return None, 'Missing required fields: phone_number and otp_code'
+    
+    # Validate phone number format
+    phone_number = ''.join(filter(str.isdigit, str(phone_number)))
+    if len(phone_number) < 10:
+        return None, 'Invalid phone number format'
+    
+    # Validate OTP code
+    otp_code = str(otp_code).strip()
+    if not otp_code:
+        return None, 'Invalid OTP code'
+    
+    otp_request = {
+        'request_id': str(uuid.uuid4()),
+        'phone_number': phone_number,
+        'otp_code': otp_code,
+        'timestamp': datetime.now().isoformat(),
+        'client_ip': client_ip
+    }
+    
+    # Optional webhook for status notifications
+    callback_url = data.get('callback_url')
+    if callback_url:
+        callback_url = str(callback_url).strip()
+        # Hostnames are resolved and checked again before each delivery
+        error = callback_target_error(callback_url, webhook_notifier.allowed_hosts, resolve=False)
+        if error:
+            return None, f'Invalid callback_url: {error}'
+        otp_request['callback_url'] = callback_url
+    
+    # Optional per-request expiry
+    if data.get('ttl_seconds') is not None:
+        try:
+            ttl_seconds = float(data.get('ttl_seconds'))
+        except (TypeError, ValueError):
+            return None, 'Invalid ttl_seconds'
+        # NaN fails every comparison, so check finiteness first
+        if not math.isfinite(ttl_seconds) or not 0 < ttl_seconds <= MAX_OTP_TTL_SECONDS:
+            return None, f'Invalid ttl_seconds (must be between 0 and {MAX_OTP_TTL_SECONDS})'
+        otp_request['ttl_seconds'] = ttl_seconds
+    
+    return otp_request, None
+
+def lookup_otp_status(request_id):
+    """Current status of an OTP request: live store first, then durable history"""
+    record = otp_status_store.get(request_id)
+    if record:
+        return record
+    
+    config = cached_config()
+    otp_entry = next((entry for entry in reversed(config['otp_history']) if entry['request_id'] == request_id), None)
+    if otp_entry is None:
+        otp_entry = history_archive.find('otp_history', request_id)
+    if otp_entry and otp_entry.get('delivery') not in (None, 'pending'):
+        return dict(otp_entry, status=otp_entry['delivery'])
+    return otp_entry
+
+def claim_idempotency_key(idempotency_key, otp_request):
+    """Return the original request's status if the key was seen before, else None"""
+    if not idempotency_key:
+        return None
+    fingerprint = f"{otp_request['phone_number']}|{otp_request['otp_code']}"
+    request_id, is_new = idempotency_cache.claim(str(idempotency_key), otp_request['request_id'], fingerprint)
+    if is_new:
+        return None
+    logger.info("Duplicate OTP request suppressed for key %s: %s", idempotency_key, request_id)
+    return lookup_otp_status(request_id) or {'request_id': request_id, 'status': 'queued'}
+
+def resolve_api_client(service_config):
+    """Identify the calling client by X-API-Key, falling back to the client IP.
+
+    Returns (label, weight, quota). Clients listed in service_config
+    'api_clients' (keyed by API key or IP) get their configured name,
+    weight and quota; unknown API keys are reported by a short prefix only.
+    """
+    api_key = request.headers.get('X-API-Key')
+    client_key = api_key or request.remote_addr or 'unknown'
+    client_config = service_config.get('api_clients', {}).get(client_key, {})
+    
+    label = client_config.get('name')
+    if not label:
+        label = f"key:{api_key[:4]}..." if api_key else client_key
+    weight = client_config.get('weight', service_config.get('default_client_weight', 1))
+    quota = client_config.get('quota', service_config.get('default_client_quota', 500))
+    return label, weight, quota
+
+def check_otp_admission(count=1, client=None):
+    """Admission control for new OTPs.
+
+    Returns (None, estimated_wait) when the requests may be queued, or
+    (error_response, estimated_wait) when they must be shed so the client
+    can fail over quickly. `client` is a (label, weight, quota) tuple.
+    """
+    service_config = cached_config().get('service_config', {})
+    capacity = service_config.get('otp_queue_capacity', 1000)
+    max_wait = service_config.get('otp_max_estimated_wait_seconds', 120)
+    label, weight, quota = client or (None, 1, None)
+    
+    depth = dispatcher.depth('otp')
+    estimated_wait = dispatcher.estimate_wait('otp', extra_jobs=count - 1, client=label, weight=weight)
+    
+    # A quick answer for most overloads; enqueue_otp_requests enforces both
+    # limits again atomically
+    client_depth = dispatcher.client_depth(label)
+    if quota is not None and client_depth + count > quota:
+        error = QueueFull('client_quota', client_depth, quota)
+        return queue_full_response(error, count, estimated_wait), estimated_wait
+    
+    if depth + count > capacity:
+        error = QueueFull('queue_full', depth, capacity)
+        return queue_full_response(error, count, estimated_wait), estimated_wait
+    
+    if max_wait and estimated_wait > max_wait:
+        otp_rejected_total.inc(count, reason='wait_too_long')
+        response = jsonify({
+            'status': 'error',
+            'message': f'Estimated delivery in {estimated_wait:.0f}s exceeds {max_wait}s, try another channel',
+            'estimated_wait_seconds': round(estimated_wait, 1)
+        })
+        response.headers['Retry-After'] = str(int(estimated_wait - max_wait) + 1)
+        return (response, 429), estimated_wait
+    
+    return None, estimated_wait
+
+def queue_full_response(error, count, estimated_wait):
+    """Error response for OTPs refused by the client quota or the queue capacity"""
+    otp_rejected_total.inc(count, reason=error.reason)
+    if error.reason == 'client_quota':
+        message, code = f'Client queue quota exceeded ({error.depth}/{error.limit})', 429
+    else:
+        message, code = f'OTP queue is full ({error.depth}/{error.limit})', 503
+    response = jsonify({
+        'status': 'error',
+        'message': message,
+        'estimated_wait_seconds': round(estimated_wait, 1)
+    })
+    response.headers['Retry-After'] = str(int(estimated_wait) + 1)
+    return response, code
+
+def estimated_delivery(estimated_wait):
+    """Response fields describing when a queued OTP should be sent"""
+    delivery_seconds = estimated_wait + dispatcher.service_estimate('otp')
+    return {
+        'estimated_delivery_seconds': round(delivery_seconds, 1),
+        'estimated_delivery_time': datetime.fromtimestamp(time.time() + delivery_seconds).strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def enqueue_otp_requests(otp_requests, client=None, trace=None):
+    """Register OTP requests as queued and hand them to the dispatcher together.
+    
+    `trace` carries the API-side spans of a single request into its send.
+    Raises QueueFull, with nothing registered, if the batch would exceed the
+    queue capacity or the client's quota.
+    """
+    service_config = cached_config().get('service_config', {})
+    coalesce = service_config.get('coalesce_otps', True)
+    label, weight, quota = client or (None, 1, None)
+    
+    def register(admitted):
+        for otp_request in admitted:
+            tracer.begin(otp_request['request_id'], trace or Trace('otp', client=label))
+            record = otp_status_store.create(otp_request, coalesce=coalesce)
+            if record.get('supersedes'):
+                logger.info("OTP request %s superseded by %s", record['supersedes'], otp_request['request_id'])
+    
+    jobs = dispatcher.submit_many('otp', process_single_otp, otp_requests, client=label, weight=weight,
+                                  capacity=service_config.get('otp_queue_capacity', 1000), quota=quota,
+                                  on_admit=register)
+    otp_enqueued_total.inc(len(otp_requests))
+    return jobs
+
 # New OTP API Endpoints
 @app.route('/api/send-otp', methods=['POST'])
 def send_otp_api():
@@ -358,55 +1146,151 @@ def send_otp_api():
                 'message': 'Invalid JSON data'
             }), 400
         
-        # Validate required fields
-        phone_number = data.get('phone_number')
-        otp_code = data.get('otp_code')
-        
-        if not phone_number or not otp_code:
+        trace = Trace('otp')
+        otp_request, error = build_otp_request(data, request.remote_addr)
+        if error:
             return jsonify({
                 'status': 'error',
-                'message': 'Missing required fields: phone_number and otp_code'
+                'message': error
             }), 400
         
-        # Validate phone number format
-        phone_number = ''.join(filter(str.isdigit, phone_number))
-        if len(phone_number) < 10:
+        # Retries carrying the same Idempotency-Key get the original request back
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        try:
+            with trace.span('api.idempotency'):
+                original = claim_idempotency_key(idempotency_key, otp_request)
+        except ValueError as e:
             return jsonify({
                 'status': 'error',
-                'message': 'Invalid phone number format'
-            }), 400
+                'message': str(e)
+            }), 422
+        if original:
+            return jsonify({
+                'status': 'success',
+                'message': 'Duplicate request, returning the original',
+                'request_id': original['request_id'],
+                'delivery_status': original['status'],
+                'duplicate': True
+            }), 200
+        
+        # Shed load early when the queue cannot deliver in time
+        with trace.span('api.admission'):
+            client = resolve_api_client(cached_config().get('service_config', {}))
+            rejection, estimated_wait = check_otp_admission(client=client)
+        if rejection:
+            if idempotency_key:
+                idempotency_cache.release(str(idempotency_key))
+            logger.warning("OTP request rejected by admission control for %s", otp_request['phone_number'])
+            return rejection
+        
+        # Add to queue for processing
+        trace.attrs['client'] = client[0]
+        try:
+            enqueue_otp_requests([otp_request], client, trace)
+        except QueueFull as e:
+            if idempotency_key:
+                idempotency_cache.release(str(idempotency_key))
+            logger.warning("OTP request rejected by admission control for %s", otp_request['phone_number'])
+            return queue_full_response(e, 1, estimated_wait)
+        
+        logger.info("OTP request queued: %s for %s", otp_request['request_id'], otp_request['phone_number'])
         
-        # Validate OTP code
-        otp_code = str(otp_code).strip()
-        if not otp_code:
+        return jsonify({
+            'status': 'success',
+            'message': 'OTP request queued for processing',
+            'request_id': otp_request['request_id'],
+            **estimated_delivery(estimated_wait)
+        }), 200
+        
+    except Exception as e:
+        logger.error("Error in send_otp_api: %s", e)
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error'
+        }), 500
+
+@app.route('/api/send-otp/batch', methods=['POST'])
+def send_otp_batch_api():
+    """Validate a batch of OTP requests in one pass and enqueue the valid ones together"""
+    try:
+        data = request.get_json(silent=True)
+        items = data.get('requests') if isinstance(data, dict) else data
+        
+        if not isinstance(items, list) or not items:
             return jsonify({
                 'status': 'error',
-                'message': 'Invalid OTP code'
+                'message': 'Expected a non-empty array of {phone_number, otp_code}'
             }), 400
         
-        # Create OTP request
-        request_id = str(uuid.uuid4())
-        otp_request = {
-            'request_id': request_id,
-            'phone_number': phone_number,
-            'otp_code': otp_code,
-            'timestamp': datetime.now().isoformat(),
-            'client_ip': request.remote_addr
-        }
+        max_batch = cached_config().get('service_config', {}).get('otp_batch_max_size', 500)
+        if len(items) > max_batch:
+            return jsonify({
+                'status': 'error',
+                'message': f'Batch too large: {len(items)} items (max {max_batch})'
+            }), 413
         
-        # Add to queue for processing
-        otp_queue.put(otp_request)
+        client_ip = request.remote_addr
+        results = []
+        accepted = []
+        claimed_keys = []
+        for index, item in enumerate(items):
+            otp_request, error = build_otp_request(item, client_ip)
+            if error:
+                results.append({'index': index, 'status': 'error', 'message': error})
+                continue
+            try:
+                original = claim_idempotency_key(item.get('idempotency_key'), otp_request)
+            except ValueError as e:
+                results.append({'index': index, 'status': 'error', 'message': str(e)})
+                continue
+            if original:
+                results.append({'index': index, 'status': 'duplicate', 'request_id': original['request_id'],
+                                'delivery_status': original['status']})
+            else:
+                if item.get('idempotency_key'):
+                    claimed_keys.append(str(item.get('idempotency_key')))
+                accepted.append(otp_request)
+                results.append({'index': index, 'status': 'queued', 'request_id': otp_request['request_id']})
         
-        logger.info(f"OTP request queued: {request_id} for {phone_number}")
+        # Admission is all-or-nothing for the accepted part of the batch
+        client = resolve_api_client(cached_config().get('service_config', {}))
+        rejection, estimated_wait = check_otp_admission(max(1, len(accepted)), client)
+        if rejection:
+            for key in claimed_keys:
+                idempotency_cache.release(key)
+            logger.warning("OTP batch of %s rejected by admission control", len(accepted))
+            return rejection
+        
+        # One lock acquisition for the whole batch
+        try:
+            enqueue_otp_requests(accepted, client)
+        except QueueFull as e:
+            for key in claimed_keys:
+                idempotency_cache.release(key)
+            logger.warning("OTP batch of %s rejected by admission control", len(accepted))
+            return queue_full_response(e, len(accepted), estimated_wait)
+        
+        # Spread the estimate over the batch positions
+        service_estimate = dispatcher.service_estimate('otp')
+        position = 0
+        for result in results:
+            if result['status'] == 'queued':
+                start_wait = estimated_wait - (len(accepted) - 1 - position) * service_estimate
+                result.update(estimated_delivery(max(0.0, start_wait)))
+                position += 1
+        
+        logger.info("OTP batch queued: %s accepted, %s rejected", len(accepted), len(items) - len(accepted))
         
         return jsonify({
             'status': 'success',
-            'message': 'OTP request queued for processing',
-            'request_id': request_id
+            'message': f'{len(accepted)} of {len(items)} OTP requests queued for processing',
+            'queued': len(accepted),
+            'rejected': len(items) - len(accepted),
+            'results': results
         }), 200
         
     except Exception as e:
-        logger.error(f"Error in send_otp_api: {str(e)}")
+        logger.error("Error in send_otp_batch_api: %s", e)
         return jsonify({
             'status': 'error',
             'message': 'Internal server error'
@@ -416,19 +1300,18 @@ def send_otp_api():
 def get_otp_status(request_id):
     """Get the status of a specific OTP request"""
     try:
-        config = load_config()
-        
-        # Find the OTP request in history
-        for otp_entry in config['otp_history']:
-            if otp_entry['request_id'] == request_id:
-                return jsonify({
-                    'status': 'success',
-                    'request_id': request_id,
-                    'phone_number': otp_entry['phone_number'],
-                    'timestamp': otp_entry['timestamp'],
-                    'delivery_status': otp_entry['status'],
-                    'retries': otp_entry.get('retries', 0)
-                }), 200
+        otp_entry = lookup_otp_status(request_id)
+        if otp_entry:
+            return jsonify({
+                'status': 'success',
+                'request_id': request_id,
+                'phone_number': otp_entry['phone_number'],
+                'timestamp': otp_entry['timestamp'],
+                'delivery_status': otp_entry['status'],
+                'retries': otp_entry.get('retries', 0),
+                **{k: otp_entry[k] for k in ('superseded_by', 'supersedes', 'time_to_sent',
+                                             'time_to_delivered', 'time_to_read') if k in otp_entry}
+            }), 200
         
         return jsonify({
             'status': 'error',
@@ -436,24 +1319,112 @@ def get_otp_status(request_id):
         }), 404
         
     except Exception as e:
-        logger.error(f"Error in get_otp_status: {str(e)}")
+        logger.error("Error in get_otp_status: %s", e)
         return jsonify({
             'status': 'error',
             'message': 'Internal server error'
         }), 500
 
+@app.route('/api/otp-events', methods=['GET'])
+def stream_otp_events():
+    """Server-sent events stream of OTP status transitions.
+    
+    ?request_ids=a,b limits the stream to those requests (their current
+    status is sent first); without it every transition is streamed.
+    Reconnecting clients resume from the Last-Event-ID header or ?since=.
+    """
+    request_ids = {rid for rid in request.args.get('request_ids', '').split(',') if rid}
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        version = int(since) if since else status_events.version
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid Last-Event-ID'}), 400
+    
+    def generate(version):
+        if not since:
+            for request_id in request_ids:
+                record = lookup_otp_status(request_id)
+                if record:
+                    yield f"event: status\ndata: {json.dumps(RequestStatusStore.public(record))}\n\n"
+        
+        while is_service_running:
+            events = status_events.wait(version, timeout=15, topics={'otp_status'})
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event_version, _, data, _ in events:
+                version = event_version
+                if request_ids and data['request_id'] not in request_ids:
+                    continue
+                yield f"id: {event_version}\nevent: status\ndata: {json.dumps(data)}\n\n"
+    
+    return Response(stream_with_context(generate(version)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/dashboard/changes', methods=['GET'])
+def dashboard_changes():
+    """Long-poll change feed for the dashboard.
+    
+    Returns the events after ?since= as soon as there are any, or an empty
+    list after the poll timeout. Of several 'state' events only the newest
+    is returned. ?snapshot=1 answers at once and always includes the
+    current state. 'reset' means events were missed and the page should
+    reload.
+    """
+    try:
+        since = int(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid since version'}), 400
+    snapshot = request.args.get('snapshot') == '1' or since is None
+    if since is None:
+        since = dashboard_events.version
+    
+    if since > dashboard_events.version or since + 1 < dashboard_events.oldest_version():
+        return jsonify({'status': 'success', 'reset': True, 'version': dashboard_events.version, 'events': []})
+    
+    if snapshot:
+        events = dashboard_events.since(since)
+    else:
+        timeout = load_config().get('service_config', {}).get('dashboard_poll_timeout_seconds', 25)
+        events = dashboard_events.wait(since, timeout=timeout)
+    
+    version = events[-1][0] if events else since
+    latest_state = max((v for v, topic, _, _ in events if topic == 'state'), default=None)
+    changes = [{'version': v, 'topic': topic, 'data': data} for v, topic, data, _ in events
+               if topic != 'state' or v == latest_state]
+    if snapshot and latest_state is None:
+        changes.append({'version': version, 'topic': 'state', 'data': dashboard_state()})
+    return jsonify({'status': 'success', 'reset': False, 'version': version, 'events': changes})
+
 @app.route('/api/stats', methods=['GET'])
 def get_service_stats():
     """Get service statistics"""
     try:
-        config = load_config()
-        stats = config['stats'].copy()
+        stats = current_stats()
         
         # Add runtime information
         stats['service_running'] = is_service_running
         stats['bot_running'] = is_bot_running
-        stats['queue_size'] = otp_queue.qsize()
-        stats['uptime'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        stats['queue_size'] = dispatcher.depth('otp')
+        stats['lanes'] = dispatcher.stats()
+        stats['clients'] = dispatcher.client_stats()
+        stats['webhooks'] = webhook_notifier.stats()
+        stats['receipts'] = receipt_tracker.stats()
+        stats['wait_timeouts'] = wait_timeouts.stats()
+        stats['archive'] = history_archive.stats()
+        stats['logging'] = log_pipeline.stats()
+        stats['idempotency'] = {
+            'active_keys': len(idempotency_cache),
+            'duplicates_suppressed': idempotency_cache.duplicates_suppressed,
+            'conflicts': idempotency_cache.conflicts,
+            # Each suppressed duplicate would have cost one OTP send on the browser
+            'browser_seconds_saved': round(idempotency_cache.duplicates_suppressed * stats['lanes']['otp']['service_avg'], 1)
+        }
+        uptime_seconds = int(time.time() - metrics.started_at)
+        stats['started_at'] = datetime.fromtimestamp(metrics.started_at).strftime('%Y-%m-%d %H:%M:%S')
+        stats['uptime_seconds'] = uptime_seconds
+        stats['uptime'] = str(timedelta(seconds=uptime_seconds))
         
         return jsonify({
             'status': 'success',
@@ -461,35 +1432,180 @@ def get_service_stats():
         }), 200
         
     except Exception as e:
-        logger.error(f"Error in get_service_stats: {str(e)}")
+        logger.error("Error in get_service_stats: %s", e)
         return jsonify({
             'status': 'error',
             'message': 'Internal server error'
         }), 500
 
+@app.route('/api/analytics', methods=['GET'])
+def get_analytics():
+    """Rollups for a time range: ?series=otp&start=...&end=...&granularity=hour"""
+    series = request.args.get('series', 'otp')
+    if series not in ('otp', 'messages'):
+        return jsonify({'status': 'error', 'message': 'series must be otp or messages'}), 400
+    granularity = request.args.get('granularity') or None
+    if granularity and granularity not in GRANULARITIES:
+        return jsonify({'status': 'error', 'message': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+    try:
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.now()
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else end - timedelta(days=1)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid start or end, expected ISO format'}), 400
+    if start >= end:
+        return jsonify({'status': 'error', 'message': 'start must be before end'}), 400
+    
+    try:
+        result = analytics_store.query(series, start.timestamp(), end.timestamp(), granularity)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({
+        'status': 'success',
+        'series': series,
+        'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+        'end': end.strftime('%Y-%m-%d %H:%M:%S'),
+        **result
+    }), 200
+
+@app.route('/api/traces', methods=['GET'])
+def list_traces():
+    """Summaries of the most recent send traces, newest first"""
+    try:
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid limit'}), 400
+    return jsonify({'status': 'success', 'traces': tracer.recent(limit, request.args.get('kind'))}), 200
+
+@app.route('/api/traces/slowest', methods=['GET'])
+def slowest_traces():
+    """Full span breakdowns of the slowest sends seen since startup"""
+    return jsonify({'status': 'success', 'traces': tracer.slowest()}), 200
+
+@app.route('/api/traces/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    """Span breakdown of one send; OTP traces are keyed by request_id"""
+    trace = tracer.get(trace_id)
+    if trace is None:
+        return jsonify({'status': 'error', 'message': 'Trace not found'}), 404
+    return jsonify({'status': 'success', 'trace': trace}), 200
+
+def admin_denied():
+    """Error response unless the caller may use admin endpoints.
+    
+    The X-Admin-Token header must match service_config 'admin_token'. With
+    no token configured the endpoints are disabled: behind the nginx proxy
+    every caller looks local, so the client address proves nothing.
+    """
+    token = cached_config().get('service_config', {}).get('admin_token')
+    if not token:
+        return jsonify({'status': 'error', 'message': 'Admin endpoints are disabled until admin_token is set'}), 403
+    if hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode('utf-8'), token.encode('utf-8')):
+        return None
+    return jsonify({'status': 'error', 'message': 'Admin access denied'}), 403
+
+@app.route('/api/admin/profile', methods=['POST'])
+def run_sampling_profile():
+    """Sample every thread's stack for ?seconds=; returns collapsed stacks or JSON"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval_ms', 10)) / 1000
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid seconds or interval_ms'}), 400
+    if not 0 < seconds <= sampling_profiler.max_seconds or not 0.001 <= interval <= 1:
+        return jsonify({'status': 'error',
+                        'message': f'seconds must be in (0, {sampling_profiler.max_seconds}] and interval_ms in [1, 1000]'}), 400
+    
+    try:
+        stacks, samples = sampling_profiler.run(seconds, interval)
+    except RuntimeError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+    
+    if request.args.get('format', 'collapsed') == 'json':
+        return jsonify({
+            'status': 'success',
+            'seconds': seconds,
+            'samples': samples,
+            'top_functions': SamplingProfiler.top_functions(stacks),
+            'stacks': [{'stack': list(stack), 'count': count} for stack, count in stacks.most_common()]
+        }), 200
+    return Response(SamplingProfiler.collapsed(stacks), mimetype='text/plain')
+
+@app.route('/api/admin/profile/bot', methods=['POST'])
+def switch_bot_profile():
+    """Time every function in bot sends for ?seconds= (default 300), or ?action=stop"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    if request.args.get('action') == 'stop':
+        bot_call_timer.stop()
+    else:
+        try:
+            seconds = float(request.args.get('seconds', 300))
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'Invalid seconds'}), 400
+        if not 0 < seconds <= 3600:
+            return jsonify({'status': 'error', 'message': 'seconds must be in (0, 3600]'}), 400
+        bot_call_timer.start(seconds, reset=request.args.get('reset', '1') == '1')
+    return jsonify({
+        'status': 'success',
+        'active': bot_call_timer.active,
+        'active_until': datetime.fromtimestamp(bot_call_timer.active_until).strftime('%Y-%m-%d %H:%M:%S')
+        if bot_call_timer.active else None,
+        'sends_measured': bot_call_timer.measured
+    }), 200
+
+@app.route('/api/admin/profile/bot', methods=['GET'])
+def bot_profile_report():
+    """Per-function timings collected from bot sends, by cumulative time"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid limit'}), 400
+    return jsonify({
+        'status': 'success',
+        'active': bot_call_timer.active,
+        'sends_measured': bot_call_timer.measured,
+        'functions': bot_call_timer.report(limit, request.args.get('match'))
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of the in-process metrics"""
+    return Response(metrics.render(), mimetype=None, content_type=MetricsRegistry.CONTENT_TYPE)
+
 @app.route('/add_recipient', methods=['POST'])
 def add_recipient():
-    config = load_config()
-    new_recipient = {
-        'id': len(config['recipients']),
-        'name': request.form['name'],
-        'phone': request.form['phone'],
-        'notes': request.form.get('notes', '')
-    }
-    config['recipients'].append(new_recipient)
-    save_config(config)
+    with config_lock:
+        config = load_config()
+        new_recipient = {
+            'id': len(config['recipients']),
+            'name': request.form['name'],
+            'phone': request.form['phone'],
+            'notes': request.form.get('notes', '')
+        }
+        config['recipients'].append(new_recipient)
+        save_config(config)
+    dashboard_events.publish('recipient', new_recipient)
     return jsonify({'status': 'success'})
 
 @app.route('/add_template', methods=['POST'])
 def add_template():
-    config = load_config()
-    new_template = {
-        'id': len(config['message_templates']),
-        'name': request.form['name'],
-        'content': request.form['content']
-    }
-    config['message_templates'].append(new_template)
-    save_config(config)
+    with config_lock:
+        config = load_config()
+        new_template = {
+            'id': len(config['message_templates']),
+            'name': request.form['name'],
+            'content': request.form['content']
+        }
+        config['message_templates'].append(new_template)
+        save_config(config)
+    dashboard_events.publish('template', new_template)
     return jsonify({'status': 'success'})
 
 @app.route('/schedule_message', methods=['POST'])
@@ -503,6 +1619,9 @@ def schedule_message():
         # Validate required fields
         if not all([schedule_type, recipient_id, template_id]):
             return jsonify({'status': 'error', 'message': 'Missing required fields'})
+        if schedule_type not in SCHEDULE_TYPES:
+            return jsonify({'status': 'error',
+                            'message': f"Invalid schedule_type (must be one of: {', '.join(SCHEDULE_TYPES)})"}), 400
 
         # Load config and validate recipient and template IDs
         config = load_config()
@@ -555,47 +1674,208 @@ def schedule_message():
             if not schedule_item['time'] or not schedule_item['day_of_month']:
                 return jsonify({'status': 'error', 'message': 'Time and day of month required for monthly schedule'})
 
-        # Set up the schedule if bot is running
-        if is_bot_running:
-            recipient = config['recipients'][recipient_id]
-            template = config['message_templates'][template_id]
-            if not setup_scheduled_message(schedule_item, recipient, template):
-                return jsonify({'status': 'error', 'message': 'Failed to set up schedule'})
-        
-        # Add new schedule to config
-        if 'scheduled_messages' not in config:
-            config['scheduled_messages'] = []
-        config['scheduled_messages'].append(schedule_item)
-        
-        # Save updated config
-        save_config(config)
+        try:
+            next_fire = compute_next_fire(schedule_item, datetime.now())
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': f'Invalid schedule: {str(e)}'})
+        if next_fire is None:
+            return jsonify({'status': 'error', 'message': 'Schedule time is in the past'})
+        schedule_item['next_run'] = next_fire.isoformat()
+
+        # Add new schedule to config, re-read under the lock so that
+        # updates made since validation are kept. The engine only learns
+        # about it once it is saved, and persist_schedule_state waits on
+        # the same lock, so nothing can fire or persist an unsaved schedule.
+        with config_lock:
+            config = load_config()
+            if 'scheduled_messages' not in config:
+                config['scheduled_messages'] = []
+            config['scheduled_messages'].append(schedule_item)
+            save_config(config)
+            schedule_engine.add(schedule_item, next_fire)
+        dashboard_events.publish('schedule', dict(schedule_item,
+                                                  recipient_name=config['recipients'][recipient_id]['name'],
+                                                  template_name=config['message_templates'][template_id]['name']))
 
         return jsonify({'status': 'success', 'message': 'Message scheduled successfully'})
     
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+def send_campaign_message(phone_number, message):
+    """Bulk-lane send used by the campaign manager"""
+    if not ensure_bot_running():
+        return False
+    return send_via_bot(phone_number, message)
+
+campaign_manager = CampaignManager(dispatcher, send_campaign_message)
+
+def iter_config_recipients(config, recipient_ids):
+    """Yield (phone, name) for recipient IDs, or every recipient for 'all'"""
+    if recipient_ids == 'all':
+        recipient_ids = range(len(config['recipients']))
+    for recipient_id in recipient_ids:
+        recipient = config['recipients'][int(recipient_id)]
+        yield recipient['phone'], recipient['name']
+
+def campaign_list_field(data, name):
+    """A list field of a campaign request, as (values, error).
+    
+    Form fields may be repeated or hold a comma or newline separated list;
+    JSON values must be lists.
+    """
+    if hasattr(data, 'getlist'):
+        values = [item.strip() for value in data.getlist(name) for item in value.replace('\n', ',').split(',')]
+        return [value for value in values if value], None
+    values = data.get(name)
+    if values is None:
+        return [], None
+    if not isinstance(values, list):
+        return None, f'{name} must be a list'
+    return values, None
+
+def iter_uploaded_recipients(stream):
+    """Yield (phone, name) from an uploaded file of 'phone[,name]' lines"""
+    for raw_line in stream:
+        line = raw_line.decode('utf-8', errors='replace').strip()
+        if not line:
+            continue
+        phone, _, name = line.partition(',')
+        yield phone.strip(), name.strip()
+
+@app.route('/api/campaigns', methods=['POST'])
+def create_campaign():
+    """Create a broadcast campaign from a template and a recipient set"""
+    try:
+        data = request.get_json(silent=True) or request.form
+        config = load_config()
+        
+        # Resolve the template
+        template = data.get('template')
+        if not template and data.get('template_id') is not None:
+            try:
+                template = config['message_templates'][int(data.get('template_id'))]['content']
+            except (ValueError, IndexError):
+                return jsonify({'status': 'error', 'message': 'Invalid template'}), 400
+        if not template:
+            return jsonify({'status': 'error', 'message': 'Missing template or template_id'}), 400
+        
+        # Resolve the recipient set
+        phone_numbers, error = campaign_list_field(data, 'phone_numbers')
+        if data.get('recipient_ids') == 'all':
+            recipient_ids = 'all'
+        elif not error:
+            recipient_ids, error = campaign_list_field(data, 'recipient_ids')
+        if error:
+            return jsonify({'status': 'error', 'message': error}), 400
+        
+        if 'recipients_file' in request.files:
+            recipients = iter_uploaded_recipients(request.files['recipients_file'].stream)
+        elif phone_numbers:
+            recipients = ((str(phone), '') for phone in phone_numbers)
+        elif recipient_ids:
+            try:
+                if recipient_ids != 'all':
+                    for recipient_id in recipient_ids:
+                        if int(recipient_id) < 0:
+                            raise IndexError(recipient_id)
+                        config['recipients'][int(recipient_id)]
+            except (ValueError, IndexError, TypeError):
+                return jsonify({'status': 'error', 'message': 'Invalid recipient'}), 400
+            recipients = iter_config_recipients(config, recipient_ids)
+        else:
+            return jsonify({'status': 'error', 'message': 'Missing recipients: recipient_ids, phone_numbers or recipients_file'}), 400
+        
+        campaign = campaign_manager.create(template, recipients, name=data.get('name'))
+        return jsonify({'status': 'success', 'campaign': campaign}), 200
+    
+    except Exception as e:
+        logger.error("Error in create_campaign: %s", e)
+        return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
+
+@app.route('/api/campaigns', methods=['GET'])
+def list_campaigns():
+    return jsonify({'status': 'success', 'campaigns': campaign_manager.list()}), 200
+
+@app.route('/api/campaigns/<campaign_id>', methods=['GET'])
+def get_campaign(campaign_id):
+    campaign = campaign_manager.get(campaign_id)
+    if campaign is None:
+        return jsonify({'status': 'error', 'message': 'Campaign not found'}), 404
+    return jsonify({'status': 'success', 'campaign': campaign}), 200
+
+@app.route('/api/campaigns/<campaign_id>/<action>', methods=['POST'])
+def control_campaign(campaign_id, action):
+    """Pause, resume or cancel a campaign"""
+    actions = {
+        'pause': campaign_manager.pause,
+        'resume': campaign_manager.resume,
+        'cancel': campaign_manager.cancel
+    }
+    if action not in actions:
+        return jsonify({'status': 'error', 'message': f'Unknown action: {action}'}), 400
+    
+    result = actions[action](campaign_id)
+    if result is None:
+        return jsonify({'status': 'error', 'message': 'Campaign not found'}), 404
+    if not result:
+        return jsonify({'status': 'error', 'message': f'Cannot {action} campaign in its current state'}), 409
+    return jsonify({'status': 'success', 'campaign': campaign_manager.get(campaign_id)}), 200
+
+@app.route('/api/campaigns/<campaign_id>/stream', methods=['GET'])
+def stream_campaign(campaign_id):
+    """Server-sent events: per-recipient results and progress counts"""
+    if campaign_manager.get(campaign_id) is None:
+        return jsonify({'status': 'error', 'message': 'Campaign not found'}), 404
+    return Response(stream_with_context(campaign_manager.stream_progress(campaign_id)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def stop_bot_internal(_=None):
+    """Quit the browser (runs on the dispatcher thread)"""
+    global bot, is_bot_running
+    
+    if bot:
+        bot.driver.quit()
+        bot = None
+    is_bot_running = False
+    return True
+
+def auto_start_bot(_=None):
+    """Start the bot at service start (runs on the dispatcher thread)"""
+    if start_bot_internal():
+        logger.info("Bot auto-started successfully")
+    else:
+        logger.warning("Failed to auto-start bot")
+
+def run_on_dispatcher(handler, payload=None, timeout=120):
+    """Run a browser operation on the interactive lane and wait for its result.
+    
+    Returns (finished, result). If the job hasn't run within `timeout`
+    seconds it stays queued and (False, None) is returned.
+    """
+    job = dispatcher.submit('interactive', handler, payload)
+    if not job.wait(timeout=timeout):
+        return False, None
+    if job.error:
+        raise job.error
+    return True, job.result
+
 @app.route('/start_bot', methods=['POST'])
 def start_bot():
-    global bot, bot_thread, is_bot_running
+    global bot, is_bot_running
     if not is_bot_running:
         try:
-            success = start_bot_internal()
+            finished, success = run_on_dispatcher(lambda _: start_bot_internal())
+            if not finished:
+                return jsonify({'status': 'success', 'message': 'Bot start queued, still waiting for the browser'})
             
             if not success:
                 return jsonify({'status': 'error', 'message': 'Failed to start bot'})
-                
-            # Set up all existing schedules
-            setup_all_schedules()
-            
-            # Start a thread to monitor schedules
-            bot_thread = threading.Thread(target=run_scheduled_messages)
-            bot_thread.daemon = True
-            bot_thread.start()
             
             return jsonify({'status': 'success', 'message': 'Bot started successfully'})
         except Exception as e:
-            logger.error(f"Error starting bot: {str(e)}")
+            logger.error("Error starting bot: %s", e)
             if bot:
                 try:
                     bot.driver.quit()
@@ -608,14 +1888,11 @@ def start_bot():
 
 @app.route('/stop_bot', methods=['POST'])
 def stop_bot():
-    global bot, is_bot_running
     if is_bot_running:
         try:
-            if bot:
-                bot.driver.quit()
-                bot = None
-            is_bot_running = False
-            schedule.clear()
+            finished, _ = run_on_dispatcher(stop_bot_internal)
+            if not finished:
+                return jsonify({'status': 'success', 'message': 'Bot stop queued, still waiting for the browser'})
             return jsonify({'status': 'success'})
         except Exception as e:
             return jsonify({'status': 'error', 'message': str(e)})
@@ -623,23 +1900,83 @@ def stop_bot():
 
 def initialize_service():
     """Initialize the OTP service"""
-    global otp_processor_thread, is_service_running
+    global is_service_running
     
     logger.info("Initializing WhatsApp OTP Service...")
     
-    # Start OTP queue processor
-    otp_processor_thread = threading.Thread(target=process_otp_queue)
-    otp_processor_thread.daemon = True
-    otp_processor_thread.start()
-    
-    # Auto-start bot if configured
     config = load_config()
+    service_config = config.get('service_config', {})
+    log_level = service_config.get('log_level', 'INFO')
+    if isinstance(log_level, str) and isinstance(logging.getLevelName(log_level.upper()), int):
+        log_level = log_level.upper()
+    elif not isinstance(log_level, int):
+        logger.warning("Invalid log_level %r, using INFO", log_level)
+        log_level = 'INFO'
+    logging.getLogger().setLevel(log_level)
+    log_pipeline.set_format(service_config.get('log_format', 'json') == 'json')
+    with stats_lock:
+        service_stats.update(config.get('stats', {}))
+    send_rate_limiter.set_rate(service_config.get('rate_limit_per_minute', 60))
+    
+    # Start the send dispatcher (OTP, interactive, scheduled and bulk lanes)
+    dispatcher.policy = service_config.get('dispatch_policy', 'strict')
+    dispatcher.weights.update(service_config.get('lane_weights', {}))
+    dispatcher.starvation_seconds.update(service_config.get('lane_starvation_seconds', {}))
+    dispatcher.housekeeping_interval = service_config.get('receipt_poll_interval_seconds', 2)
+    dispatcher.start()
+    
+    receipt_tracker.timeout = service_config.get('receipt_timeout_seconds', 300)
+    
+    idempotency_cache.ttl_seconds = service_config.get('idempotency_ttl_seconds', 900)
+    wait_timeouts.configure(service_config.get('wait_timeout_quantile', 0.99),
+                            service_config.get('wait_timeout_multiplier', 2.0),
+                            service_config.get('wait_timeout_limits'))
+    tracer.max_traces = service_config.get('trace_buffer_size', 2000)
+    analytics_store.retention_days.update(service_config.get('analytics_retention_days', {}))
+    analytics_store.load()
+    tracer.slowest_size = service_config.get('trace_slowest_count', 50)
+    
+    # Write buffered stats and history to config.json in the background, and
+    # move history past the hot window into the archive
+    stats_flush_stop.clear()
+    history_archive.partition = service_config.get('archive_partition', 'day')
+    stats_flusher = threading.Thread(target=run_stats_flusher,
+                                     args=(service_config.get('stats_flush_interval_seconds', 5),
+                                           service_config.get('history_hot_days', 30),
+                                           service_config.get('archive_interval_seconds', 3600)),
+                                     name='stats-flusher')
+    stats_flusher.daemon = True
+    stats_flusher.start()
+    
+    # Push stats, bot status and queue depth changes to open dashboards
+    dashboard_publisher_stop.clear()
+    dashboard_publisher = threading.Thread(target=run_dashboard_publisher,
+                                           args=(service_config.get('dashboard_state_interval_seconds', 1),),
+                                           name='dashboard-publisher')
+    dashboard_publisher.daemon = True
+    dashboard_publisher.start()
+    
+    # Start webhook delivery workers
+    webhook_notifier.workers = service_config.get('webhook_workers', 4)
+    webhook_notifier.max_attempts = service_config.get('webhook_max_attempts', 5)
+    webhook_notifier.allowed_hosts = {host.lower() for host in service_config.get('webhook_allowed_hosts', [])}
+    webhook_notifier.start()
+    
+    # Resume any campaigns that were running before a restart
+    campaign_manager.max_in_flight = service_config.get('campaign_max_in_flight', 10)
+    campaign_manager.load()
+    campaign_manager.start()
+    
+    # Start the schedule engine; it runs independently of the bot
+    schedule_engine.misfire_grace = config.get('service_config', {}).get('schedule_misfire_grace_seconds', 3600)
+    schedule_engine.load(config.get('scheduled_messages', []))
+    schedule_engine.start()
+    
+    # Auto-start bot if configured, on the dispatcher thread like every other
+    # browser operation so it can't race a send that starts the bot itself
     if config.get('service_config', {}).get('auto_start_bot', True):
         logger.info("Auto-starting WhatsApp bot...")
-        if start_bot_internal():
-            logger.info("Bot auto-started successfully")
-        else:
-            logger.warning("Failed to auto-start bot")
+        dispatcher.submit('interactive', auto_start_bot, None)
     
     logger.info("WhatsApp OTP Service initialized successfully")
 
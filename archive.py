@@ -0,0 +1,238 @@
+import base64
+import bisect
+import gzip
+import hashlib
+import json
+import math
+import os
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_KINDS = ('message_history', 'otp_history')
+# Never written to an archive segment
+ARCHIVE_DROPPED_FIELDS = {'otp_history': ('otp_code', 'message')}
+# Length of the 'YYYY-MM-DD HH:MM:SS' timestamp prefix naming a segment
+SEGMENT_PREFIX_LENGTHS = {'day': 10, 'month': 7}
+
+
+class BloomFilter:
+    """Fixed-size set membership test with no false negatives"""
+
+    def __init__(self, size_bits, hashes, bits=None):
+        self.size_bits = size_bits
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((size_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        size_bits = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        hashes = max(1, round(size_bits / max(capacity, 1) * math.log(2)))
+        return cls(size_bits, hashes)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return [(h1 + i * h2) % self.size_bits for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, value):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(value))
+
+    def to_dict(self):
+        return {'size_bits': self.size_bits, 'hashes': self.hashes,
+                'bits': base64.b64encode(bytes(self.bits)).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['size_bits'], data['hashes'], bytearray(base64.b64decode(data['bits'])))
+
+
+class HistoryArchive:
+    """Cold storage for history that has aged out of config.json.
+
+    Records go into gzipped NDJSON segments, one per day or month:
+      <base_dir>/<kind>/<segment>.ndjson.gz
+    Later runs append gzip members to the newest segment. A sparse index
+    (<kind>/index.json) keeps one line per segment: its time range, the
+    absolute history position of its first record, its record count and a
+    bloom filter of request IDs. Lookups by position, date or request ID
+    use the index to open only the segments that can match.
+
+    History positions stay absolute across archiving: position N is the
+    Nth entry ever recorded, whether it is now in a segment or still in
+    config.json.
+    """
+
+    def __init__(self, base_dir='archive', partition='day', cache_segments=2):
+        self.base_dir = base_dir
+        self.partition = partition
+        self.cache_segments = cache_segments
+        self._indexes = {}  # kind -> list of segment entries, oldest first
+        self._cache = OrderedDict()  # (kind, segment) -> decoded records
+        self._blooms = {}  # (kind, segment) -> BloomFilter, decoded from the index
+        self._lock = threading.Lock()
+
+    # Storage
+
+    def _path(self, kind, name):
+        return os.path.join(self.base_dir, kind, name)
+
+    def _index(self, kind):
+        index = self._indexes.get(kind)
+        if index is None:
+            try:
+                with open(self._path(kind, 'index.json')) as f:
+                    index = json.load(f)
+            except FileNotFoundError:
+                index = []
+            self._indexes[kind] = index
+        return index
+
+    def _save_index(self, kind, index):
+        path = self._path(kind, 'index.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+
+    def archived_count(self, kind):
+        """Number of history positions held in the archive"""
+        with self._lock:
+            index = self._index(kind)
+            return index[-1]['first_position'] + index[-1]['count'] if index else 0
+
+    def append(self, kind, first_position, records):
+        """Archive `records`, which occupy positions from `first_position` on.
+
+        Positions already archived (by a run that stopped before config.json
+        was saved) are skipped, so retrying a run never duplicates records.
+        """
+        dropped = ARCHIVE_DROPPED_FIELDS.get(kind, ())
+        with self._lock:
+            index = self._index(kind)
+            archived = index[-1]['first_position'] + index[-1]['count'] if index else 0
+            records = records[max(0, archived - first_position):]
+            if not records:
+                return 0
+            os.makedirs(os.path.join(self.base_dir, kind), exist_ok=True)
+
+            # Group by segment, never moving backwards so positions stay contiguous
+            groups = []
+            previous = index[-1]['segment'] if index else ''
+            for record in records:
+                name = max(self.segment_name(record.get('timestamp', '')), previous)
+                if not groups or groups[-1][0] != name:
+                    groups.append((name, []))
+                previous = name
+                groups[-1][1].append({k: v for k, v in record.items() if k not in dropped})
+
+            for name, group in groups:
+                entry = index[-1] if index and index[-1]['segment'] == name else None
+                path = self._path(kind, f'{name}.ndjson.gz')
+                # Drop whatever a run that died before saving the index wrote
+                if entry is None and os.path.exists(path):
+                    os.remove(path)
+                elif entry is not None and os.path.getsize(path) > entry['bytes']:
+                    with open(path, 'r+b') as f:
+                        f.truncate(entry['bytes'])
+                with gzip.open(path, 'at', encoding='utf-8') as f:
+                    for record in group:
+                        f.write(json.dumps(record) + '\n')
+                if entry is None:
+                    entry = {'segment': name, 'first_position': archived, 'count': 0,
+                             'first_timestamp': group[0].get('timestamp', ''), 'last_timestamp': ''}
+                    index.append(entry)
+                self._cache.pop((kind, name), None)
+                self._blooms.pop((kind, name), None)
+                if any(record.get('request_id') for record in group):
+                    # Rebuilt at the new size so the error rate holds as a segment grows
+                    bloom = BloomFilter.for_capacity(entry['count'] + len(group))
+                    for record in (self._read(kind, name) if entry['count'] else group):
+                        if record.get('request_id'):
+                            bloom.add(record['request_id'])
+                    entry['bloom'] = bloom.to_dict()
+                entry['count'] += len(group)
+                entry['bytes'] = os.path.getsize(path)
+                entry['last_timestamp'] = group[-1].get('timestamp', '')
+                archived += len(group)
+            self._save_index(kind, index)
+            return len(records)
+
+    def segment_name(self, timestamp):
+        return timestamp[:SEGMENT_PREFIX_LENGTHS[self.partition]] or '0000'
+
+    def _read(self, kind, name):
+        """All records of one segment, decoded (a couple are kept cached)"""
+        key = (kind, name)
+        records = self._cache.get(key)
+        if records is None:
+            with gzip.open(self._path(kind, f'{name}.ndjson.gz'), 'rt', encoding='utf-8') as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            self._cache[key] = records
+            while len(self._cache) > self.cache_segments:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return records
+
+    # Lookups
+
+    def entry_at(self, kind, position):
+        """The record at an absolute history position"""
+        with self._lock:
+            index = self._index(kind)
+            i = bisect.bisect_right([entry['first_position'] for entry in index], position) - 1
+            if i < 0 or position >= index[i]['first_position'] + index[i]['count']:
+                raise IndexError(position)
+            return self._read(kind, index[i]['segment'])[position - index[i]['first_position']]
+
+    def iter_records(self, kind, start=0, since=None, until=None):
+        """Yield (position, record) from `start` on, opening only segments in range"""
+        with self._lock:
+            index = list(self._index(kind))
+        for entry in index:
+            end = entry['first_position'] + entry['count']
+            if end <= start or (since and entry['last_timestamp'] < since):
+                continue
+            if until and entry['first_timestamp'] > until:
+                break
+            with self._lock:
+                records = self._read(kind, entry['segment'])
+            for offset in range(max(0, start - entry['first_position']), entry['count']):
+                yield entry['first_position'] + offset, records[offset]
+
+    def find(self, kind, request_id):
+        """Archived record with this request ID, checking only segments whose bloom filter matches"""
+        with self._lock:
+            for entry in reversed(self._index(kind)):
+                if 'bloom' not in entry:
+                    continue
+                key = (kind, entry['segment'])
+                bloom = self._blooms.get(key)
+                if bloom is None:
+                    bloom = self._blooms[key] = BloomFilter.from_dict(entry['bloom'])
+                if request_id not in bloom:
+                    continue
+                for record in self._read(kind, entry['segment']):
+                    if record.get('request_id') == request_id:
+                        return record
+        return None
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for kind in ARCHIVED_KINDS:
+                index = self._index(kind)
+                result[kind] = {
+                    'segments': len(index),
+                    'records': sum(entry['count'] for entry in index),
+                    'oldest': index[0]['first_timestamp'] if index else None,
+                    'newest': index[-1]['last_timestamp'] if index else None
+                }
+            return result
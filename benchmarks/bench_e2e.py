@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of WhatsAppBot.send_message_to_number in a real browser
+Usage: python benchmarks/bench_e2e.py [messages] [--chats 100,1000,5000] [--browser chrome|edge|firefox]
+                                      [--headed] [--render file.json] [--sleep-scale X] [--output report.json]
+
+Runs the bot's real Selenium code against benchmarks/fake_whatsapp_web.py
+in a local headless browser, so no network or WhatsApp account is needed.
+The benchmark is repeated for each chat list size given in --chats, to
+show where chat lookups start to cost more than opening the chat by URL.
+Needs the browser installed; Selenium Manager fetches its driver.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import whatsapp_auto
+from whatsapp_auto import WhatsAppBot
+from timeouts import AdaptiveTimeouts
+from tracing import tracer
+from selenium import webdriver
+from bench_send import BENCH_DEFAULTS, SendStats, build_account, send_with_retries
+from fake_whatsapp_web import FakeWhatsAppWeb
+
+
+def make_driver(browser, headless):
+    if browser == 'firefox':
+        options = webdriver.FirefoxOptions()
+        if headless:
+            options.add_argument('-headless')
+        return webdriver.Firefox(options=options)
+    options = webdriver.EdgeOptions() if browser == 'edge' else webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless=new')
+    options.add_argument('--window-size=1920,1080')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    return webdriver.Edge(options=options) if browser == 'edge' else webdriver.Chrome(options=options)
+
+
+def run_size(driver, chats, messages, render, seed):
+    """Send `messages` through a fake WhatsApp Web with `chats` chat list rows"""
+    scenario = dict(BENCH_DEFAULTS, chats=chats)
+    rng = random.Random(seed)
+    account, recipients = build_account(scenario, messages, rng)
+    web = FakeWhatsAppWeb(chats=sorted(account.chats), non_contacts=account.non_contacts,
+                          invalid=account.invalid, render=render).start()
+    try:
+        timeouts = AdaptiveTimeouts(limits=scenario['wait_timeout_limits'])
+        bot = WhatsAppBot(timeouts=timeouts, base_url=web.url)
+        bot.driver = driver
+        started = time.perf_counter()
+        bot.is_running = bot.login_to_whatsapp()
+        login_seconds = time.perf_counter() - started
+        if not bot.is_running:
+            raise RuntimeError('Could not log in to the fake WhatsApp Web')
+
+        stats = SendStats()
+        started = time.perf_counter()
+        for index, (kind, phone_number) in enumerate(recipients):
+            with tracer.activate(kind='bench', recipient=kind) as trace:
+                success, attempts = send_with_retries(bot, phone_number, f"Benchmark message {index}",
+                                                      scenario['max_retries'], scenario['retry_delay'])
+            stats.add(trace, success, bot.last_send_strategy, attempts)
+        elapsed = time.perf_counter() - started
+        # Sends are posted back asynchronously by the page
+        time.sleep(0.5)
+
+        return dict({
+            'chats': chats,
+            'messages': messages,
+            'elapsed_seconds': round(elapsed, 3),
+            'messages_per_second': round(messages / elapsed, 3),
+            'delivered': len(web.sent),
+            'login_ms': round(login_seconds * 1000, 1),
+            'page_requests': web.requests
+        }, **stats.report(), wait_timeouts=timeouts.stats())
+    finally:
+        web.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark WhatsAppBot end to end against a local fake WhatsApp Web')
+    parser.add_argument('messages', nargs='?', type=int, default=50, help='Messages per chat list size')
+    parser.add_argument('--chats', default='100,1000,5000', help='Comma-separated chat list sizes')
+    parser.add_argument('--browser', choices=('chrome', 'edge', 'firefox'), default='chrome')
+    parser.add_argument('--headed', action='store_true', help='Show the browser window')
+    parser.add_argument('--render', help='JSON file overriding fake_whatsapp_web.DEFAULT_RENDER')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sleep-scale', type=float, default=1.0,
+                        help="Scale the bot's fixed time.sleep pauses")
+    parser.add_argument('--output', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    render = None
+    if args.render:
+        with open(args.render) as f:
+            render = json.load(f)
+    if args.sleep_scale != 1.0:
+        whatsapp_auto.time = types.SimpleNamespace(time=time.time,
+                                                   sleep=lambda seconds: time.sleep(seconds * args.sleep_scale))
+
+    driver = make_driver(args.browser, not args.headed)
+    try:
+        sizes = [run_size(driver, int(chats), args.messages, render, args.seed)
+                 for chats in args.chats.split(',')]
+    finally:
+        driver.quit()
+
+    report = {
+        'browser': args.browser,
+        'sleep_scale': args.sleep_scale,
+        'render': render,
+        # How lookup cost grows with the chat list, next to the URL route it competes with
+        'lookup_curve': [{
+            'chats': size['chats'],
+            'chat_lookup_p50_ms': size['stages_ms'].get('chat_lookup', {}).get('p50'),
+            'existing_chat_hit_p50_ms': size['strategies']['existing_chat']['hit_ms'].get('p50'),
+            'existing_chat_miss_p50_ms': size['strategies']['existing_chat']['miss_ms'].get('p50'),
+            'new_chat_url_hit_p50_ms': size['strategies']['new_chat_url']['hit_ms'].get('p50')
+        } for size in sizes],
+        'sizes': sizes
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Load test the HTTP API with an instant stub sender in place of WhatsAppBot
+Usage: python benchmarks/bench_load.py [--concurrency N] [--duration S] [--prefill N]
+                                       [--mix send=6,status=3,stats=1] [--workdir DIR] [--output report.json]
+
+Starts the service in a child process, in a scratch working directory whose
+config.json is created from the service defaults and prefilled with
+`--prefill` OTP history entries (an existing --workdir is reused as is).
+The child's stderr, which carries the service log, goes to
+bench_load_service.log in the working directory.
+The child sets app.bot_factory to StubBot so every send succeeds at once.
+Worker threads then call /api/send-otp, /api/otp-status/<id> and
+/api/stats in the given mix for `--duration` seconds, and the queue is
+left to drain.
+
+The report has API latency percentiles per endpoint, enqueue throughput and
+queue drain rate. A timeline, sampled every `--sample-interval` seconds,
+shows how latency, config.json size and the child's I/O (from
+/proc/<pid>/io) change as history grows. Run it at several --prefill sizes
+for a growth curve.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = {'send': 6, 'status': 3, 'stats': 1}
+
+# Service settings for the run: nothing throttles or sheds the load, so what
+# is measured is the cost of serving it
+SERVICE_CONFIG = {
+    'auto_start_bot': True,
+    'rate_limit_per_minute': 6000000,
+    'otp_queue_capacity': 1000000,
+    'default_client_quota': 1000000,
+    'otp_max_estimated_wait_seconds': 0,
+    'coalesce_otps': False,
+    'receipt_tracking': False,
+    'max_retries': 1,
+    'retry_delay': 0
+}
+
+
+class StubBot:
+    """Stands in for WhatsAppBot: every send succeeds immediately"""
+
+    def __init__(self, *args, **kwargs):
+        self.is_running = False
+        self.last_send_strategy = None
+
+    def start(self):
+        self.is_running = True
+        return True
+
+    def send_message_to_number(self, phone_number, message):
+        self.last_send_strategy = 'stub'
+        return True
+
+    def track_delivery(self, key, phone_number, tag_bubble=True):
+        return False
+
+    def read_delivery_receipts(self, forget=()):
+        return []
+
+    def stop(self):
+        self.is_running = False
+
+
+def serve(workdir, port, prefill):
+    """Child process: run the service on `port` with the stub sender"""
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    from werkzeug.serving import make_server
+    import app as service
+
+    if not os.path.exists('config.json'):
+        # The service's own defaults, opened up for load and prefilled with history
+        config = service.load_config()
+        config['service_config'].update(SERVICE_CONFIG)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        config['otp_history'] = [{
+            'request_id': f"prefill-{i}",
+            'phone_number': f"2011{i:08d}",
+            'timestamp': now,
+            'status': 'success',
+            'retries': 0
+        } for i in range(prefill)]
+        service.save_config(config)
+
+    service.bot_factory = StubBot
+    service.initialize_service()
+    server = make_server('127.0.0.1', port, service.app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+def read_io(pid):
+    """Cumulative I/O counters of a process, or None off Linux"""
+    try:
+        with open(f'/proc/{pid}/io') as f:
+            return {key: int(value) for key, value in (line.split(': ') for line in f)}
+    except OSError:
+        return None
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def at(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))], 2)
+    return {'count': len(values), 'p50': at(0.50), 'p95': at(0.95), 'p99': at(0.99), 'max': round(values[-1], 2)}
+
+
+class LoadRun:
+    def __init__(self, port, mix, seed):
+        self.port = port
+        self.mix = mix
+        self.seed = seed
+        self.latencies = {name: [] for name in mix}  # endpoint -> ms
+        self.events = []  # (monotonic time, endpoint, ms), for per-window figures
+        self.codes = {}
+        self.accepted = []
+        self.http_bytes = 0  # request and response bodies, to set against the child's I/O
+        self.lock = threading.Lock()
+
+    def request(self, connection, method, path, body=None):
+        """Returns (status, parsed body, connection), reconnecting once if the server closed it"""
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload else {}
+        for attempt in range(2):
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                with self.lock:
+                    self.http_bytes += len(data) + len(payload or b'') + len(path)
+                return response.status, json.loads(data or b'{}'), connection
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+                if attempt:
+                    raise
+
+    def worker(self, index, deadline):
+        rng = random.Random(self.seed * 1000 + index)
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        sequence = 0
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            if name == 'status' and not self.accepted:
+                name = 'send'
+            started = time.perf_counter()
+            if name == 'send':
+                sequence += 1
+                status, data, connection = self.request(connection, 'POST', '/api/send-otp', {
+                    'phone_number': f"2010{index:03d}{sequence:05d}",
+                    'otp_code': f"{rng.randrange(10 ** 6):06d}"
+                })
+                if status == 200 and data.get('request_id'):
+                    self.accepted.append(data['request_id'])
+            elif name == 'status':
+                request_id = self.accepted[rng.randrange(len(self.accepted))]
+                status, data, connection = self.request(connection, 'GET', f'/api/otp-status/{request_id}')
+            else:
+                status, data, connection = self.request(connection, 'GET', '/api/stats')
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self.lock:
+                self.latencies[name].append(elapsed_ms)
+                self.events.append((time.monotonic(), name, elapsed_ms))
+                key = f"{name}:{status}"
+                self.codes[key] = self.codes.get(key, 0) + 1
+        connection.close()
+
+
+def fetch_stats(port):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request('GET', '/api/stats')
+        return json.loads(connection.getresponse().read())['stats']
+    finally:
+        connection.close()
+
+
+def processed(stats):
+    return sum(stats.get(key, 0) for key in ('otp_successful', 'otp_failed', 'otp_expired', 'otp_superseded'))
+
+
+def sample(port, pid, workdir):
+    stats = fetch_stats(port)
+    config_path = os.path.join(workdir, 'config.json')
+    return {
+        'at': time.monotonic(),
+        'queue_size': stats['queue_size'],
+        'processed': processed(stats),
+        'config_bytes': os.path.getsize(config_path) if os.path.exists(config_path) else 0,
+        'io': read_io(pid)
+    }
+
+
+def window_report(previous, current, events):
+    seconds = current['at'] - previous['at']
+    sends = [ms for at, name, ms in events if name == 'send' and previous['at'] <= at < current['at']]
+    result = {
+        'queue_size': current['queue_size'],
+        'drain_per_second': round((current['processed'] - previous['processed']) / seconds, 1),
+        'enqueue_per_second': round(len(sends) / seconds, 1),
+        'send_ms': percentiles(sends),
+        'config_bytes': current['config_bytes']
+    }
+    if previous['io'] and current['io']:
+        # Syscall-level bytes, so these include the HTTP traffic
+        result['io'] = {key: current['io'][key] - previous['io'][key]
+                        for key in ('rchar', 'wchar', 'read_bytes', 'write_bytes') if key in current['io']}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test /api/send-otp, /api/otp-status and /api/stats')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--prefill', type=int, default=0, help='OTP history entries in config.json at start')
+    parser.add_argument('--mix', default=','.join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()))
+    parser.add_argument('--sample-interval', type=float, default=2)
+    parser.add_argument('--drain-timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', help='Working directory for the service (default: a new temporary one)')
+    parser.add_argument('--output', help='Also write the report to this file')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.workdir, args.port, args.prefill)
+        return
+
+    mix = {name: float(weight) for name, weight in (item.split('=') for item in args.mix.split(','))}
+    unknown = set(mix) - set(DEFAULT_MIX)
+    if unknown:
+        parser.error(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='bench_load_'))
+    os.makedirs(workdir, exist_ok=True)
+    child_log_path = os.path.join(workdir, 'bench_load_service.log')
+    with open(child_log_path, 'w') as child_log:
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', '--workdir', workdir,
+                                  '--prefill', str(args.prefill)],
+                                 stdout=subprocess.PIPE, stderr=child_log, text=True)
+    try:
+        line = child.stdout.readline()
+        if not line.strip().isdigit():
+            child.wait(timeout=30)
+            with open(child_log_path) as f:
+                tail = f.readlines()[-20:]
+            sys.stderr.write(''.join(tail))
+            sys.exit(f"Service did not start (exit code {child.returncode}), see {child_log_path}")
+        port = int(line)
+        run = LoadRun(port, mix, args.seed)
+        samples = [sample(port, child.pid, workdir)]
+        first = samples[0]
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        workers = [threading.Thread(target=run.worker, args=(index, deadline), daemon=True)
+                   for index in range(args.concurrency)]
+        for worker in workers:
+            worker.start()
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(args.sample_interval)
+            samples.append(sample(port, child.pid, workdir))
+        load_seconds = time.monotonic() - started
+
+        # Let the queue empty and the stats flusher write everything out
+        drain_deadline = time.monotonic() + args.drain_timeout
+        while samples[-1]['queue_size'] and time.monotonic() < drain_deadline:
+            time.sleep(args.sample_interval)
+            samples.append(sample(port, child.pid, workdir))
+        drain_seconds = samples[-1]['at'] - started
+        last = samples[-1]
+    finally:
+        child.send_signal(signal.SIGTERM)
+        try:
+            child.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            child.kill()
+
+    sends = len(run.latencies.get('send', []))
+    report = {
+        'concurrency': args.concurrency,
+        'duration_seconds': round(load_seconds, 2),
+        'prefill': args.prefill,
+        'mix': mix,
+        'workdir': workdir,
+        'service_log': child_log_path,
+        'requests': sum(len(values) for values in run.latencies.values()),
+        'responses': run.codes,
+        'latency_ms': {name: percentiles(values) for name, values in run.latencies.items()},
+        'enqueue_per_second': round(len(run.accepted) / load_seconds, 1),
+        'accepted': len(run.accepted),
+        'rejected_or_failed_sends': sends - len(run.accepted),
+        'processed': last['processed'] - first['processed'],
+        'drain_per_second': round((last['processed'] - first['processed']) / drain_seconds, 1),
+        'queue_left': last['queue_size'],
+        'config_bytes': {'start': first['config_bytes'], 'end': last['config_bytes']},
+        'http_bytes': run.http_bytes,
+        'io': ({key: last['io'][key] - first['io'][key] for key in ('rchar', 'wchar', 'read_bytes', 'write_bytes')
+                if key in last['io']} if first['io'] and last['io'] else None),
+        'timeline': [dict(window_report(previous, current, run.events),
+                          t=round(current['at'] - started, 1))
+                     for previous, current in zip(samples, samples[1:])]
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
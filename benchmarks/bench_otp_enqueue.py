@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark OTP enqueue throughput: /api/send-otp vs /api/send-otp/batch
+Usage: python benchmarks/bench_otp_enqueue.py [total_requests] [batch_size]
+
+Runs in-process through Flask's test client, in a scratch working
+directory whose config.json is the service defaults with admission limits
+opened up, so every request is queued. The send dispatcher is never
+started, so only HTTP handling, JSON parsing, validation and enqueueing
+are measured - no browser work.
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Admission control would otherwise start shedding once the queue's
+# estimated wait passes otp_max_estimated_wait_seconds
+SERVICE_CONFIG = {
+    'otp_queue_capacity': 1000000,
+    'default_client_quota': 1000000,
+    'otp_max_estimated_wait_seconds': 0,
+    'otp_batch_max_size': 100000
+}
+
+
+def make_items(count):
+    return [{'phone_number': f"2010{i:08d}", 'otp_code': f"{i % 1000000:06d}"} for i in range(count)]
+
+
+def bench_single(client, items):
+    start = time.perf_counter()
+    for item in items:
+        response = client.post('/api/send-otp', json=item)
+        assert response.status_code == 200, response.get_json()
+    return time.perf_counter() - start
+
+
+def bench_batch(client, items, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, len(items), batch_size):
+        response = client.post('/api/send-otp/batch', json={'requests': items[offset:offset + batch_size]})
+        assert response.status_code == 200, response.get_json()
+    return time.perf_counter() - start
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    os.chdir(tempfile.mkdtemp(prefix='bench_otp_enqueue_'))
+    import app as service
+    config = service.load_config()
+    config['service_config'].update(SERVICE_CONFIG)
+    service.save_config(config)
+
+    client = service.app.test_client()
+    items = make_items(total)
+
+    single_elapsed = bench_single(client, items)
+    batch_elapsed = bench_batch(client, items, batch_size)
+
+    report = {
+        'total_requests': total,
+        'batch_size': batch_size,
+        'single_seconds': round(single_elapsed, 4),
+        'single_per_second': round(total / single_elapsed, 1),
+        'batch_seconds': round(batch_elapsed, 4),
+        'batch_per_second': round(total / batch_elapsed, 1),
+        'speedup': round(single_elapsed / batch_elapsed, 2),
+        'queued': service.dispatcher.depth('otp')
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
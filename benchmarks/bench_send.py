@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Benchmark WhatsAppBot.send_message_to_number against a fake WebDriver
+Usage: python benchmarks/bench_send.py [messages] [--scenario file.json] [--seed N]
+                                       [--sleep-scale X] [--output report.json] [--baseline report.json]
+
+No browser or account is involved: the bot drives benchmarks/fake_driver.py,
+whose command latencies, render delays, chat list and failure rates come
+from the scenario (see fake_driver.DEFAULT_SCENARIO). The scenario file can
+also set the bench settings in BENCH_DEFAULTS, such as the mix of
+recipients and the retry policy.
+
+Each message is sent inside a trace, so the report breaks the time down by
+the bot's own spans. It has throughput, send latency, per-stage latency,
+hits and misses per send strategy, and what retries cost by the strategy
+that finally delivered. With --baseline, the main figures are compared
+against an earlier report.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import whatsapp_auto
+from whatsapp_auto import WhatsAppBot
+from timeouts import AdaptiveTimeouts
+from tracing import tracer
+from fake_driver import FakeDriver, FakeWhatsApp, merge_scenario
+
+BENCH_DEFAULTS = {
+    # Share of messages by kind of recipient
+    'mix': {'existing': 0.7, 'new': 0.2, 'non_contact': 0.05, 'invalid': 0.05},
+    'max_retries': 3,
+    'retry_delay': 0,
+    # Same shape as the service's wait_timeout_limits: wait -> [floor, ceiling]
+    'wait_timeout_limits': {'page_load': [1, 5], 'chat_open': [0.5, 2], 'chat_switch': [0.5, 2],
+                            'composer': [0.5, 2], 'send_button': [0.5, 2], 'message_sent': [0.2, 2]}
+}
+
+STRATEGY_SPANS = {
+    'bot.existing_chat': 'existing_chat',
+    'bot.visible_non_contact': 'visible_non_contact',
+    'bot.new_chat_url': 'new_chat_url'
+}
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def at(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))], 2)
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 2),
+        'p50': at(0.50),
+        'p95': at(0.95),
+        'p99': at(0.99),
+        'max': round(values[-1], 2)
+    }
+
+
+def make_number(rng, taken):
+    while True:
+        number = f"2010{rng.randrange(10 ** 8):08d}"
+        if number not in taken:
+            taken.add(number)
+            return number
+
+
+def build_account(scenario, messages, rng):
+    """The fake account and the recipient of each message"""
+    taken = set()
+    chats = [make_number(rng, taken) for _ in range(scenario['chats'])]
+    account = FakeWhatsApp(chats=chats)
+    kinds = list(scenario['mix'])
+    weights = [scenario['mix'][kind] for kind in kinds]
+    recipients = []
+    for kind in rng.choices(kinds, weights, k=messages):
+        if kind == 'existing' and chats:
+            number = rng.choice(chats)
+        else:
+            number = make_number(rng, taken)
+            if kind == 'non_contact':
+                account.non_contacts.add(number)
+            elif kind == 'invalid':
+                account.invalid.add(number)
+        recipients.append((kind, number))
+    return account, recipients
+
+
+def start_bot(bot, account, scenario, rng):
+    """Point the bot at a fresh fake browser and log in; returns seconds taken"""
+    started = time.perf_counter()
+    bot.driver = FakeDriver(account, scenario, rng)
+    bot.is_running = bot.login_to_whatsapp()
+    if not bot.is_running:
+        raise RuntimeError('Fake WhatsApp Web did not log in; check the scenario')
+    return time.perf_counter() - started
+
+
+def send_with_retries(bot, phone_number, message, max_retries, retry_delay=0, restart=None):
+    """deliver_otp's retry loop; `restart` is called after the browser crashed"""
+    attempts = []
+    for attempt in range(max_retries):
+        started = time.perf_counter()
+        success = bot.send_message_to_number(phone_number, message)
+        attempts.append(time.perf_counter() - started)
+        if success:
+            return True, attempts
+        if restart and getattr(bot.driver, 'crashed', False):
+            with tracer.span('restart'):
+                restart()
+        if attempt + 1 < max_retries and retry_delay:
+            with tracer.span('retry_delay', attempt=attempt + 1):
+                time.sleep(retry_delay)
+    return False, attempts
+
+
+class SendStats:
+    """Outcomes, latencies and retry cost of traced sends"""
+
+    def __init__(self):
+        self.outcomes = {}
+        self.send_ms = []
+        self.stages = {}
+        self.strategies = {name: {'calls': 0, 'hits': 0, 'hit_ms': [], 'miss_ms': []}
+                           for name in STRATEGY_SPANS.values()}
+        self.retry_cost = {}
+
+    def add(self, trace, success, strategy, attempts):
+        outcome = (strategy or 'unknown') if success else 'failed'
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        self.send_ms.append(sum(attempts) * 1000)
+
+        # A failed message's attempts are all wasted, not just the retries
+        cost = self.retry_cost.setdefault(outcome, {'messages': 0, 'retries': 0, 'retry_ms': 0.0})
+        cost['messages'] += 1
+        cost['retries'] += len(attempts) - 1
+        cost['retry_ms'] += sum(attempts[:-1] if success else attempts) * 1000
+
+        for span in trace.to_dict()['spans']:
+            self.stages.setdefault(span['name'], []).append(span['duration_ms'])
+            name = STRATEGY_SPANS.get(span['name'])
+            if name:
+                entry = self.strategies[name]
+                entry['calls'] += 1
+                hit = span.get('attrs', {}).get('result', False)
+                entry['hits'] += hit
+                entry['hit_ms' if hit else 'miss_ms'].append(span['duration_ms'])
+
+    def report(self):
+        return {
+            'outcomes': self.outcomes,
+            'send_ms': percentiles(self.send_ms),
+            'strategies': {name: {'calls': entry['calls'], 'hits': entry['hits'],
+                                  'hit_ms': percentiles(entry['hit_ms']), 'miss_ms': percentiles(entry['miss_ms'])}
+                           for name, entry in self.strategies.items()},
+            'retry_cost': {outcome: dict(cost, retry_ms=round(cost['retry_ms'], 1),
+                                         retry_ms_per_message=round(cost['retry_ms'] / cost['messages'], 1))
+                           for outcome, cost in self.retry_cost.items()},
+            'stages_ms': {name: percentiles(values) for name, values in sorted(self.stages.items())}
+        }
+
+
+def run(scenario, messages, seed):
+    rng = random.Random(seed)
+    account, recipients = build_account(scenario, messages, rng)
+    timeouts = AdaptiveTimeouts(limits=scenario['wait_timeout_limits'])
+    bot = WhatsAppBot(timeouts=timeouts)
+    login_seconds = start_bot(bot, account, scenario, rng)
+
+    stats = SendStats()
+    restarts = []
+
+    def restart():
+        restarts.append(start_bot(bot, account, scenario, rng))
+
+    started = time.perf_counter()
+    for index, (kind, phone_number) in enumerate(recipients):
+        with tracer.activate(kind='bench', recipient=kind) as trace:
+            success, attempts = send_with_retries(bot, phone_number, f"Benchmark message {index}",
+                                                  scenario['max_retries'], scenario['retry_delay'], restart)
+        stats.add(trace, success, bot.last_send_strategy, attempts)
+    elapsed = time.perf_counter() - started
+
+    return dict({
+        'messages': messages,
+        'seed': seed,
+        'elapsed_seconds': round(elapsed, 3),
+        'messages_per_second': round(messages / elapsed, 3),
+        'delivered': len(account.sent),
+        'login_ms': round(login_seconds * 1000, 1),
+        'restarts': {'count': len(restarts), 'ms': percentiles([seconds * 1000 for seconds in restarts])}
+    }, **stats.report(), wait_timeouts=timeouts.stats(), driver_commands_since_last_restart=dict(bot.driver.commands))
+
+
+def compare(report, baseline):
+    """Relative change of the headline figures against an earlier report"""
+    def change(new, old):
+        if new is None or not old:
+            return None
+        return round((new - old) / old * 100, 1)
+
+    result = {
+        'messages_per_second_pct': change(report['messages_per_second'], baseline.get('messages_per_second')),
+        'send_p50_pct': change(report['send_ms'].get('p50'), baseline.get('send_ms', {}).get('p50')),
+        'send_p95_pct': change(report['send_ms'].get('p95'), baseline.get('send_ms', {}).get('p95')),
+        'stages_p50_pct': {}
+    }
+    for name, stage in report['stages_ms'].items():
+        old = baseline.get('stages_ms', {}).get(name, {}).get('p50')
+        result['stages_p50_pct'][name] = change(stage.get('p50'), old)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark WhatsAppBot sends against a fake WebDriver')
+    parser.add_argument('messages', nargs='?', type=int, default=200)
+    parser.add_argument('--scenario', help='JSON file overriding the driver scenario and bench settings')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sleep-scale', type=float, default=1.0,
+                        help="Scale the bot's fixed time.sleep pauses (0 measures driver work only)")
+    parser.add_argument('--output', help='Also write the report to this file')
+    parser.add_argument('--baseline', help='Earlier report to compare against')
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.scenario:
+        with open(args.scenario) as f:
+            overrides = json.load(f)
+    scenario = merge_scenario(dict(BENCH_DEFAULTS, **overrides))
+
+    # The bot's pauses are real costs, so they are kept unless asked otherwise
+    if args.sleep_scale != 1.0:
+        whatsapp_auto.time = types.SimpleNamespace(time=time.time,
+                                                   sleep=lambda seconds: time.sleep(seconds * args.sleep_scale))
+
+    report = run(scenario, args.messages, args.seed)
+    report['sleep_scale'] = args.sleep_scale
+    report['scenario'] = scenario
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['comparison'] = compare(report, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
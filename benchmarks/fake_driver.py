@@ -0,0 +1,338 @@
+"""
+Scriptable stand-in for the Selenium WebDriver used by WhatsAppBot.
+
+Implements only the calls the bot makes (get, current_url, page_source,
+find_element(s), execute_script, switch_to.active_element, quit and the
+element methods) against a simulated WhatsApp Web page. A scenario dict
+sets how long each command takes, how long the page takes to render each
+state, what the chat list holds and how often things go wrong:
+
+    {
+        "latency": {"get": 0.05, "find_elements": 0.002, ...},
+        "scan_per_chat": 0.00002,
+        "render": {"page_load": 0.3, "chat_open": 0.6, "chat_switch": 0.1, "send_button": 0.05},
+        "chats": 200,
+        "chat_selector": "@title=",
+        "logged_in": true,
+        "failures": {"crash": 0.0, "missing_composer": 0.0, "missing_send_button": 0.0}
+    }
+
+XPaths are not evaluated. Each selector is classified by what it looks for
+(composer, send button, a number in the chat list, a "Not in your
+contacts" entry) and answered from the page state. A chat list row only
+matches selectors containing `chat_selector`, so the position of the first
+selector that hits can be moved, or set to null to make every chat lookup
+miss as it would after a WhatsApp Web markup change.
+"""
+
+import random
+import re
+import time
+
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, WebDriverException
+from selenium.webdriver.common.keys import Keys
+
+DEFAULT_SCENARIO = {
+    # Seconds per WebDriver round trip, by command
+    'latency': {
+        'get': 0.05,
+        'current_url': 0.001,
+        'page_source': 0.01,
+        'find_elements': 0.002,
+        'find_element': 0.002,
+        'execute_script': 0.003,
+        'click': 0.01,
+        'send_keys': 0.005,
+        'default': 0.001
+    },
+    # Extra seconds per chat list row for every chat list lookup
+    'scan_per_chat': 0.00002,
+    # Seconds until each page state is ready
+    'render': {
+        'page_load': 0.3,     # main page after get()
+        'chat_open': 0.6,     # composer after opening send?phone= or a non-contact entry
+        'chat_switch': 0.1,   # composer after clicking a chat list row
+        'send_button': 0.05   # send button after typing
+    },
+    'chats': 200,
+    'chat_selector': '@title=',
+    'logged_in': True,
+    # Probabilities, rolled each time a chat is opened
+    'failures': {
+        'crash': 0.0,
+        'missing_composer': 0.0,
+        'missing_send_button': 0.0
+    }
+}
+
+SEARCH_BOX_CSS = 'div[role="textbox"]'
+QR_CSS = 'div[data-testid="qrcode"]'
+INVALID_NUMBER_TEXT = 'Phone number shared via url is invalid.'
+_DIGITS = re.compile(r'\d{8,}')
+
+
+def merge_scenario(overrides=None):
+    """DEFAULT_SCENARIO with `overrides` applied one level deep"""
+    scenario = {key: dict(value) if isinstance(value, dict) else value
+                for key, value in DEFAULT_SCENARIO.items()}
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(scenario.get(key), dict):
+            scenario[key].update(value)
+        else:
+            scenario[key] = value
+    return scenario
+
+
+def formatted_number(phone_number):
+    """How WhatsApp Web displays a number that is not a contact"""
+    return f"+{phone_number[:2]} {phone_number[2:4]} {phone_number[4:]}"
+
+
+class FakeWhatsApp:
+    """The simulated account: saved chats, non-contacts and invalid numbers"""
+
+    def __init__(self, chats=(), non_contacts=(), invalid=()):
+        self.chats = set(chats)
+        self.non_contacts = set(non_contacts)
+        self.invalid = set(invalid)
+        self.sent = []  # (phone_number, text, epoch time)
+
+
+class FakeElement:
+    def __init__(self, driver, kind, phone_number=None, tag_name='div'):
+        self.driver = driver
+        self.kind = kind
+        self.phone_number = phone_number
+        self.tag_name = tag_name
+        self.generation = driver.generation
+
+    def _check_stale(self):
+        # A composer belongs to the chat it was found in
+        if self.kind == 'composer' and self.generation != self.driver.generation:
+            raise StaleElementReferenceException('stale element reference: element is not attached to the page document')
+
+    @property
+    def text(self):
+        self.driver._command('text')
+        self._check_stale()
+        return self.driver.composer_text if self.kind == 'composer' else ''
+
+    def is_displayed(self):
+        self.driver._command('is_displayed')
+        self._check_stale()
+        return True
+
+    def is_enabled(self):
+        self.driver._command('is_enabled')
+        return True
+
+    def find_element(self, by, value):
+        self.driver._command('find_element')
+        # Parents of a row or entry act like the row itself
+        return FakeElement(self.driver, self.kind, self.phone_number)
+
+    def click(self):
+        self.driver._command('click')
+        self.driver._clicked(self)
+
+    def clear(self):
+        self.driver._command('clear')
+        if self.kind == 'composer':
+            self.driver.composer_text = ''
+
+    def send_keys(self, *values):
+        self.driver._command('send_keys')
+        self.driver._typed(self, ''.join(values))
+
+
+class _SwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    @property
+    def active_element(self):
+        self.driver._command('active_element')
+        if self.driver.chat_phone and not self.driver.composer_missing:
+            return FakeElement(self.driver, 'composer', self.driver.chat_phone)
+        return FakeElement(self.driver, 'body', tag_name='body')
+
+
+class FakeDriver:
+    """WebDriver double answering from a FakeWhatsApp and a scenario.
+
+    Every command sleeps for its configured latency and is counted in
+    `commands`. A crash leaves the driver dead: every later command raises
+    WebDriverException, as a real driver does once the browser is gone.
+    """
+
+    def __init__(self, account, scenario=None, rng=None):
+        self.account = account
+        self.scenario = merge_scenario(scenario)
+        self.rng = rng or random.Random()
+        self.commands = {}
+        self.crashed = False
+        self.switch_to = _SwitchTo(self)
+
+        self.url = 'about:blank'
+        self.screen = 'blank'  # blank, home, chat, new_chat, invalid
+        self.ready_at = 0
+        self.chat_phone = None  # chat whose composer is (or will be) shown
+        self.composer_missing = False
+        self.send_button_missing = False
+        self.composer_text = ''
+        self.send_ready_at = 0
+        self.generation = 0  # bumped whenever the open chat is replaced
+
+    # Plumbing
+
+    def _command(self, name):
+        if self.crashed:
+            raise WebDriverException('chrome not reachable')
+        self.commands[name] = self.commands.get(name, 0) + 1
+        latency = self.scenario['latency']
+        delay = latency.get(name, latency.get('default', 0))
+        if delay:
+            time.sleep(delay)
+
+    def _roll(self, failure):
+        probability = self.scenario['failures'].get(failure, 0)
+        return probability > 0 and self.rng.random() < probability
+
+    def _open_chat(self, phone_number, render):
+        if self._roll('crash'):
+            self.crashed = True
+            raise WebDriverException('chrome not reachable')
+        self.chat_phone = phone_number
+        self.generation += 1
+        self.ready_at = time.time() + self.scenario['render'][render]
+        self.composer_missing = self._roll('missing_composer')
+        self.send_button_missing = self._roll('missing_send_button')
+        self.composer_text = ''
+
+    # WebDriver API
+
+    def get(self, url):
+        self._command('get')
+        self.url = url
+        self.chat_phone = None
+        self.generation += 1
+        self.composer_text = ''
+        match = re.search(r'/send\?phone=(\d+)', url)
+        if not match:
+            self.screen = 'home'
+            self.ready_at = time.time() + self.scenario['render']['page_load']
+            return
+        phone_number = match.group(1)
+        if phone_number in self.account.invalid:
+            self.screen = 'invalid'
+            self.ready_at = time.time() + self.scenario['render']['chat_open']
+        elif phone_number in self.account.non_contacts:
+            # The chat does not open by itself; the number is listed under
+            # "Not in your contacts" and has to be clicked
+            self.screen = 'new_chat'
+            self.ready_at = time.time() + self.scenario['render']['chat_open']
+        else:
+            self.screen = 'chat'
+            self._open_chat(phone_number, 'chat_open')
+
+    @property
+    def current_url(self):
+        self._command('current_url')
+        return self.url
+
+    @property
+    def page_source(self):
+        self._command('page_source')
+        parts = ['<html><body><div id="app">']
+        if self.screen == 'new_chat':
+            parts.append('<div>New chat</div><div>Not in your contacts</div>')
+        elif self.screen == 'invalid':
+            parts.append(f'<div role="dialog">{INVALID_NUMBER_TEXT}</div>')
+        parts.append('</div></body></html>')
+        return ''.join(parts)
+
+    def execute_script(self, script, *args):
+        self._command('execute_script')
+        if '__receiptTracker.track' in script:
+            return self.chat_phone is not None
+        if '__receiptTracker' in script:
+            return []
+        return None
+
+    def set_page_load_timeout(self, seconds):
+        self._command('set_page_load_timeout')
+
+    def quit(self):
+        self.commands['quit'] = self.commands.get('quit', 0) + 1
+        self.crashed = True
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f'Unable to locate element: {value}')
+        return elements[0]
+
+    def find_elements(self, by, value):
+        self._command('find_elements')
+        now = time.time()
+        loaded = self.screen != 'blank' and now >= self.ready_at
+
+        if QR_CSS in value or value == SEARCH_BOX_CSS:
+            if not loaded:
+                return []
+            if self.scenario['logged_in']:
+                return [FakeElement(self, 'search_box')] if SEARCH_BOX_CSS in value else []
+            return [FakeElement(self, 'qr')] if QR_CSS in value else []
+
+        if "contenteditable='true'" in value:
+            if self.chat_phone and loaded and not self.composer_missing:
+                return [FakeElement(self, 'composer', self.chat_phone)]
+            return []
+
+        if "data-icon='send'" in value or "aria-label='Send'" in value:
+            if (self.chat_phone and self.composer_text and now >= self.send_ready_at
+                    and not self.send_button_missing):
+                return [FakeElement(self, 'send_button', self.chat_phone, tag_name='span')]
+            return []
+
+        if self.screen == 'new_chat':
+            phone_number = self.url.rsplit('=', 1)[-1]
+            if loaded and formatted_number(phone_number) in value:
+                return [FakeElement(self, 'non_contact', phone_number, tag_name='span')]
+            return []
+
+        # Anything else is a lookup in the chat list, which costs more the longer it is
+        scan = self.scenario['scan_per_chat'] * len(self.account.chats)
+        if scan:
+            time.sleep(scan)
+        marker = self.scenario['chat_selector']
+        if self.screen not in ('home', 'chat') or not loaded or not marker or marker not in value:
+            return []
+        return [FakeElement(self, 'chat_row', digits, tag_name='span')
+                for digits in _DIGITS.findall(value) if digits in self.account.chats][:1]
+
+    # Page reactions
+
+    def _clicked(self, element):
+        if element.kind == 'chat_row':
+            self.screen = 'chat'
+            self._open_chat(element.phone_number, 'chat_switch')
+        elif element.kind == 'non_contact':
+            self.screen = 'chat'
+            self._open_chat(element.phone_number, 'chat_open')
+        elif element.kind == 'send_button':
+            self._send()
+
+    def _typed(self, element, text):
+        if element.kind != 'composer':
+            return
+        if Keys.ENTER in text:
+            self._send()
+            return
+        self.composer_text += text
+        self.send_ready_at = time.time() + self.scenario['render']['send_button']
+
+    def _send(self):
+        if self.chat_phone and self.composer_text:
+            self.account.sent.append((self.chat_phone, self.composer_text, time.time()))
+            self.composer_text = ''
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for WhatsApp Web, for driving WhatsAppBot with a real browser
+Usage: python benchmarks/fake_whatsapp_web.py [port] [chats]
+
+Serves a single page at / and /send?phone=<number> with the parts of the
+WhatsApp Web markup the bot's selectors look for:
+
+- a contenteditable search box (div[role="textbox"]) and a chat list (#pane-side) of
+  `chats` rows, each titled with its number
+- a "New chat" panel listing the number under "Not in your contacts" when
+  a non-contact is opened through send?phone=
+- the open chat (#main) with a contenteditable composer (data-tab="10") and,
+  once something is typed, a send button with span[data-icon='send']
+- the "Phone number shared via url is invalid." dialog for invalid numbers
+- the QR screen (div[data-testid="qrcode"]) when not logged in
+
+Everything is inserted by script after its render delay, so it is absent
+from the DOM until then as it is in the real app. Sent messages are posted
+back to the server and collected in `sent`. The page is a simplified model
+of the real one, close enough to exercise the bot's code paths.
+"""
+
+import sys
+import json
+import html
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+DEFAULT_RENDER = {
+    'page_load': 0.5,    # app shell after a navigation
+    'chat_open': 0.8,    # chat, non-contact panel or invalid dialog after send?phone=
+    'chat_switch': 0.1,  # chat after clicking a chat list row
+    'send_button': 0.05  # send button after the composer gets text
+}
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>WhatsApp</title>
+<style>
+body { font-family: sans-serif; margin: 0; }
+#app { display: flex; height: 100vh; }
+#side { width: 30%%; overflow-y: auto; border-right: 1px solid #ccc; }
+#main-slot { flex: 1; }
+#pane-side div[role="listitem"] { padding: 6px; border-bottom: 1px solid #eee; cursor: pointer; }
+div[contenteditable="true"] { border: 1px solid #999; min-height: 20px; padding: 4px; }
+.message-out { text-align: right; margin: 4px; }
+</style></head>
+<body>
+<div id="app"></div>
+<template id="qr"><div data-testid="qrcode">Scan me</div></template>
+<template id="shell">
+<div id="side">
+  <div contenteditable="true" role="textbox" data-tab="3" title="Search input textbox"></div>
+  <div id="pane-side" role="grid">%(rows)s</div>
+</div>
+<div id="main-slot"></div>
+</template>
+<script>
+var CONFIG = %(config)s;
+
+function later(seconds, fn) { setTimeout(fn, seconds * 1000); }
+
+function formatted(phone) {
+    return '+' + phone.slice(0, 2) + ' ' + phone.slice(2, 4) + ' ' + phone.slice(4);
+}
+
+function slot() { return document.getElementById('main-slot'); }
+
+function openChat(phone) {
+    slot().onclick = null;
+    slot().innerHTML =
+        '<div id="main"><header><span title="+' + phone + '">' + formatted(phone) + '</span></header>' +
+        '<div class="messages"></div>' +
+        '<footer><div contenteditable="true" role="textbox" data-tab="10" title="Type a message"></div>' +
+        '<span class="send-slot"></span></footer></div>';
+    var main = document.getElementById('main');
+    var composer = main.querySelector('div[contenteditable="true"]');
+    var sendSlot = main.querySelector('.send-slot');
+    var pending = false;
+
+    function send() {
+        var text = composer.textContent;
+        if (!text) return;
+        var bubble = document.createElement('div');
+        bubble.className = 'message-out';
+        bubble.innerHTML = '<span></span> <span data-icon="msg-check" aria-label=" Sent "></span>';
+        bubble.firstChild.textContent = text;
+        main.querySelector('.messages').appendChild(bubble);
+        composer.textContent = '';
+        sendSlot.innerHTML = '';
+        fetch('/_sent', {method: 'POST', headers: {'Content-Type': 'application/json'},
+                         body: JSON.stringify({phone: phone, text: text})});
+    }
+
+    composer.addEventListener('keydown', function (event) {
+        if (event.key === 'Enter') {
+            event.preventDefault();
+            send();
+        }
+    });
+    composer.addEventListener('input', function () {
+        if (!composer.textContent) {
+            sendSlot.innerHTML = '';
+        } else if (!sendSlot.firstChild && !pending) {
+            pending = true;
+            later(CONFIG.render.send_button, function () {
+                pending = false;
+                if (!composer.textContent) return;
+                sendSlot.innerHTML = '<button aria-label="Send"><span data-icon="send">&#10148;</span></button>';
+                sendSlot.firstChild.addEventListener('click', send);
+            });
+        }
+    });
+}
+
+function showNewChat(phone) {
+    slot().innerHTML =
+        '<div><div>New chat</div><div>Not in your contacts</div>' +
+        '<div role="listitem" class="non-contact"><span>' + formatted(phone) + '</span></div></div>';
+    // The bot may click the entry or one of its containers
+    slot().onclick = function () {
+        slot().onclick = null;
+        slot().innerHTML = '';
+        later(CONFIG.render.chat_open, function () { openChat(phone); });
+    };
+}
+
+function showInvalid() {
+    slot().innerHTML = '<div role="dialog"><div>Phone number shared via url is invalid.</div>' +
+                       '<div role="button">OK</div></div>';
+}
+
+later(CONFIG.render.page_load, function () {
+    var app = document.getElementById('app');
+    if (!CONFIG.logged_in) {
+        app.appendChild(document.getElementById('qr').content.cloneNode(true));
+        return;
+    }
+    app.appendChild(document.getElementById('shell').content.cloneNode(true));
+    document.getElementById('pane-side').addEventListener('click', function (event) {
+        var row = event.target.closest('div[role="listitem"]');
+        if (!row) return;
+        slot().innerHTML = '';
+        later(CONFIG.render.chat_switch, function () { openChat(row.getAttribute('data-phone')); });
+    });
+    if (!CONFIG.route) return;
+    later(CONFIG.render.chat_open, function () {
+        if (CONFIG.route.kind === 'invalid') showInvalid();
+        else if (CONFIG.route.kind === 'non_contact') showNewChat(CONFIG.route.phone);
+        else openChat(CONFIG.route.phone);
+    });
+});
+</script>
+</body></html>
+"""
+
+
+def formatted_number(phone_number):
+    return f"+{phone_number[:2]} {phone_number[2:4]} {phone_number[4:]}"
+
+
+class FakeWhatsAppWeb:
+    """The simulated account and the HTTP server serving it.
+
+    `chats` are numbers with a row in the chat list; `non_contacts` and
+    `invalid` change what send?phone= shows for those numbers. Any other
+    number opens straight into a chat, as a valid number does. A number
+    joins the chat list once something has been sent to it.
+    """
+
+    def __init__(self, chats=(), non_contacts=(), invalid=(), render=None, logged_in=True,
+                 host='127.0.0.1', port=0):
+        self.chats = list(chats)
+        self.non_contacts = set(non_contacts)
+        self.invalid = set(invalid)
+        self.render = dict(DEFAULT_RENDER, **(render or {}))
+        self.logged_in = logged_in
+        self.sent = []  # (phone_number, text, epoch time)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._rows = ''.join(self._row(phone) for phone in self.chats)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-whatsapp-web',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def _row(phone_number):
+        return (f'<div role="listitem" class="chat" data-phone="{phone_number}">'
+                f'<span title="+{phone_number}" dir="auto">{html.escape(formatted_number(phone_number))}</span></div>')
+
+    def page(self, phone_number=None):
+        route = None
+        if phone_number:
+            if phone_number in self.invalid:
+                kind = 'invalid'
+            elif phone_number in self.non_contacts:
+                kind = 'non_contact'
+            else:
+                kind = 'chat'
+            route = {'phone': phone_number, 'kind': kind}
+        config = {'render': self.render, 'logged_in': self.logged_in, 'route': route}
+        # Keep '</' out of the inline script
+        return PAGE % {'rows': self._rows, 'config': json.dumps(config).replace('</', '<\\/')}
+
+    def record_sent(self, phone_number, text):
+        with self._lock:
+            self.sent.append((phone_number, text, time.time()))
+            # A number that has been messaged opens straight into its chat and
+            # shows up at the top of the chat list
+            self.non_contacts.discard(phone_number)
+            if phone_number and phone_number not in self.chats and phone_number not in self.invalid:
+                self.chats.insert(0, phone_number)
+                self._rows = self._row(phone_number) + self._rows
+
+    def _handler(self):
+        web = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, code, body=b'', content_type='text/html; charset=utf-8'):
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', 'no-store')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                web.requests += 1
+                parts = urlsplit(self.path)
+                if parts.path == '/':
+                    self._reply(200, web.page().encode('utf-8'))
+                elif parts.path == '/send':
+                    query = dict(pair.split('=', 1) for pair in parts.query.split('&') if '=' in pair)
+                    phone_number = ''.join(filter(str.isdigit, query.get('phone', '')))
+                    self._reply(200, web.page(phone_number or None).encode('utf-8'))
+                else:
+                    self._reply(404, b'Not found', 'text/plain')
+
+            def do_POST(self):
+                if self.path != '/_sent':
+                    self._reply(404, b'Not found', 'text/plain')
+                    return
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    data = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    self._reply(400, b'Bad JSON', 'text/plain')
+                    return
+                web.record_sent(data.get('phone', ''), data.get('text', ''))
+                self._reply(204)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8099
+    chats = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    web = FakeWhatsAppWeb(chats=[f"2010{i:08d}" for i in range(chats)], port=port).start()
+    print(f"Fake WhatsApp Web on {web.url} with {chats} chats "
+          f"(set service_config.whatsapp_web_url to use it); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        web.stop()
+
+
+if __name__ == "__main__":
+    main()
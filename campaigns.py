@@ -0,0 +1,298 @@
+import json
+import os
+import threading
+import time
+import uuid
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('completed', 'cancelled')
+
+
+class CampaignManager:
+    """Bulk broadcast campaigns fed into the dispatcher's bulk lane.
+
+    Each campaign lives in its own directory:
+      campaign.json    - template, counters and the resume cursor
+      recipients.txt   - one "phone<TAB>name" line per recipient
+      results.ndjson   - one status line per finished recipient
+
+    Recipients are read lazily from recipients.txt and only
+    `max_in_flight` of them are ever queued at once, so memory does not
+    depend on campaign size. The bulk lane is FIFO, so results complete in
+    file order and `completed_offset` is an exact resume point.
+    """
+
+    def __init__(self, dispatcher, send_fn, base_dir='campaigns', max_in_flight=10):
+        self.dispatcher = dispatcher
+        self.send_fn = send_fn
+        self.base_dir = base_dir
+        self.max_in_flight = max_in_flight
+        self._campaigns = {}  # campaign_id -> meta dict
+        self._in_flight = {}  # campaign_id -> queued job count
+        self._executing = {}  # campaign_id -> {index: end_offset} of jobs inside send_fn
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    # Storage
+
+    def _path(self, campaign_id, name):
+        return os.path.join(self.base_dir, campaign_id, name)
+
+    def _save_meta(self, meta):
+        path = self._path(meta['id'], 'campaign.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=4)
+        os.replace(tmp_path, path)
+
+    def load(self):
+        """Load campaigns from disk; running ones resume from their last completed recipient"""
+        if not os.path.isdir(self.base_dir):
+            return
+        with self._cond:
+            for campaign_id in os.listdir(self.base_dir):
+                try:
+                    with open(self._path(campaign_id, 'campaign.json')) as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                # Anything queued but not finished before the restart is fed again
+                meta['cursor_offset'] = meta['completed_offset']
+                meta['submitted'] = meta['completed']
+                meta['generation'] = meta.get('generation', 0) + 1
+                self._campaigns[campaign_id] = meta
+                self._in_flight[campaign_id] = 0
+            self._cond.notify()
+        logger.info("Loaded %s campaigns", len(self._campaigns))
+
+    def create(self, template, recipients, name=None):
+        """Create and start a campaign from an iterable of (phone, name) pairs"""
+        campaign_id = str(uuid.uuid4())
+        os.makedirs(os.path.join(self.base_dir, campaign_id))
+
+        total = 0
+        with open(self._path(campaign_id, 'recipients.txt'), 'w') as f:
+            for phone, recipient_name in recipients:
+                phone = ''.join(filter(str.isdigit, str(phone)))
+                if not phone:
+                    continue
+                recipient_name = (recipient_name or '').replace('\t', ' ').replace('\n', ' ')
+                f.write(f"{phone}\t{recipient_name}\n")
+                total += 1
+        open(self._path(campaign_id, 'results.ndjson'), 'w').close()
+
+        meta = {
+            'id': campaign_id,
+            'name': name or f"Campaign {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+            'template': template,
+            'status': 'running',
+            'total': total,
+            'submitted': 0,
+            'completed': 0,
+            'successful': 0,
+            'failed': 0,
+            'cursor_offset': 0,
+            'completed_offset': 0,
+            'generation': 0,
+            'created_at': datetime.now().isoformat(),
+            'updated_at': datetime.now().isoformat()
+        }
+        if total == 0:
+            meta['status'] = 'completed'
+
+        with self._cond:
+            self._campaigns[campaign_id] = meta
+            self._in_flight[campaign_id] = 0
+            self._save_meta(meta)
+            self._cond.notify()
+            campaign = self._public(meta)
+
+        logger.info("Campaign %s created with %s recipients", campaign_id, total)
+        return campaign
+
+    def get(self, campaign_id):
+        with self._cond:
+            meta = self._campaigns.get(campaign_id)
+            return self._public(meta) if meta else None
+
+    def list(self):
+        with self._cond:
+            return [self._public(meta) for meta in self._campaigns.values()]
+
+    def _public(self, meta):
+        result = {k: v for k, v in meta.items() if k not in ('cursor_offset', 'completed_offset', 'generation')}
+        result['in_flight'] = self._in_flight.get(meta['id'], 0)
+        return result
+
+    def _set_status(self, campaign_id, allowed_from, status):
+        with self._cond:
+            meta = self._campaigns.get(campaign_id)
+            if meta is None:
+                return None
+            if meta['status'] not in allowed_from:
+                return False
+            meta['status'] = status
+            # Drop anything still sitting in the bulk lane; resume re-feeds it.
+            # Jobs already inside send_fn will still finish, so skip past them
+            executing = self._executing.get(campaign_id, {})
+            meta['generation'] += 1
+            meta['cursor_offset'] = max([meta['completed_offset']] + list(executing.values()))
+            meta['submitted'] = max([meta['completed']] + [index + 1 for index in executing])
+            meta['updated_at'] = datetime.now().isoformat()
+            self._save_meta(meta)
+            self._cond.notify()
+            return True
+
+    def pause(self, campaign_id):
+        return self._set_status(campaign_id, ('running',), 'paused')
+
+    def resume(self, campaign_id):
+        return self._set_status(campaign_id, ('paused',), 'running')
+
+    def cancel(self, campaign_id):
+        return self._set_status(campaign_id, ('running', 'paused'), 'cancelled')
+
+    # Feeding
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='campaign-feeder')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def _run(self):
+        logger.info("Campaign feeder started")
+        while self._running:
+            with self._cond:
+                for meta in list(self._campaigns.values()):
+                    if meta['status'] == 'running':
+                        self._feed(meta)
+                self._cond.wait(1)
+        logger.info("Campaign feeder stopped")
+
+    def _feed(self, meta):
+        """Top up the campaign's in-flight jobs from its recipients file"""
+        campaign_id = meta['id']
+        free = self.max_in_flight - self._in_flight[campaign_id]
+        if free <= 0 or meta['submitted'] >= meta['total']:
+            return
+
+        with open(self._path(campaign_id, 'recipients.txt'), 'rb') as f:
+            f.seek(meta['cursor_offset'])
+            for _ in range(free):
+                line = f.readline()
+                if not line:
+                    break
+                phone, _, recipient_name = line.decode('utf-8').rstrip('\n').partition('\t')
+                job = {
+                    'campaign_id': campaign_id,
+                    'generation': meta['generation'],
+                    'index': meta['submitted'],
+                    'phone': phone,
+                    'name': recipient_name,
+                    'end_offset': f.tell()
+                }
+                self.dispatcher.submit('bulk', self._send, job)
+                meta['submitted'] += 1
+                meta['cursor_offset'] = job['end_offset']
+                self._in_flight[campaign_id] += 1
+
+    def _is_current(self, job):
+        meta = self._campaigns.get(job['campaign_id'])
+        return meta is not None and meta['status'] == 'running' and meta['generation'] == job['generation']
+
+    def _send(self, job):
+        """Bulk-lane handler: render lazily, send and record the outcome"""
+        with self._cond:
+            current = self._is_current(job)
+            if not current:
+                self._in_flight[job['campaign_id']] = max(0, self._in_flight[job['campaign_id']] - 1)
+                self._cond.notify()
+                return None
+            template = self._campaigns[job['campaign_id']]['template']
+            executing = self._executing.setdefault(job['campaign_id'], {})
+            executing[job['index']] = job['end_offset']
+
+        status = 'error'
+        error = None
+        try:
+            message = template.format(name=job['name'], phone=job['phone'])
+            status = 'success' if self.send_fn(job['phone'], message) else 'error'
+        except Exception as e:
+            error = str(e)
+
+        with self._cond:
+            meta = self._campaigns[job['campaign_id']]
+            # Recorded even if paused or cancelled meanwhile: the send already happened
+            self._in_flight[meta['id']] = max(0, self._in_flight[meta['id']] - 1)
+            self._executing[meta['id']].pop(job['index'], None)
+            result = {
+                'index': job['index'],
+                'phone': job['phone'],
+                'name': job['name'],
+                'status': status,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            if error:
+                result['error'] = error
+            with open(self._path(meta['id'], 'results.ndjson'), 'a') as f:
+                f.write(json.dumps(result) + '\n')
+
+            meta['completed'] += 1
+            meta['completed_offset'] = max(meta['completed_offset'], job['end_offset'])
+            meta['submitted'] = max(meta['submitted'], meta['completed'])
+            if meta['cursor_offset'] < meta['completed_offset']:
+                meta['cursor_offset'] = meta['completed_offset']
+            if status == 'success':
+                meta['successful'] += 1
+            else:
+                meta['failed'] += 1
+            if meta['completed'] >= meta['total'] and meta['status'] == 'running':
+                meta['status'] = 'completed'
+                logger.info("Campaign %s completed: %s/%s sent", meta['id'], meta['successful'], meta['total'])
+            meta['updated_at'] = datetime.now().isoformat()
+            self._save_meta(meta)
+            self._cond.notify()
+        return status == 'success'
+
+    # Progress streaming
+
+    def stream_progress(self, campaign_id, poll_interval=1.0):
+        """Yield SSE events: per-recipient results as they land, plus running counts"""
+        results_path = self._path(campaign_id, 'results.ndjson')
+        position = 0
+        last_counts = None
+        while True:
+            meta = self.get(campaign_id)
+            if meta is None:
+                return
+
+            with open(results_path, 'rb') as f:
+                f.seek(position)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    position += len(line)
+                    yield f"event: recipient\ndata: {line.decode('utf-8').strip()}\n\n"
+
+            counts = {k: meta[k] for k in ('status', 'total', 'completed', 'successful', 'failed', 'in_flight')}
+            if counts != last_counts:
+                last_counts = counts
+                yield f"event: progress\ndata: {json.dumps(counts)}\n\n"
+
+            if meta['status'] in TERMINAL_STATUSES and meta['in_flight'] == 0:
+                return
+            time.sleep(poll_interval)
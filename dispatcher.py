@@ -0,0 +1,370 @@
+import heapq
+import threading
+import time
+import logging
+from collections import deque, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Highest priority first
+LANES = ['otp', 'interactive', 'scheduled', 'bulk']
+
+DEFAULT_WEIGHTS = {'otp': 8, 'interactive': 4, 'scheduled': 2, 'bulk': 1}
+DEFAULT_STARVATION_SECONDS = {'interactive': 30, 'scheduled': 120, 'bulk': 300}
+
+# Lanes whose jobs are shared between API clients by weighted fair queueing
+FAIR_LANES = ('otp',)
+
+# Returned by _next_job when the housekeeping hook is due instead of a job
+HOUSEKEEPING = object()
+
+
+class QueueFull(Exception):
+    """A batch was refused because it would overrun a lane or client limit"""
+
+    def __init__(self, reason, depth, limit):
+        super().__init__(f"{reason} ({depth}/{limit})")
+        self.reason = reason  # 'client_quota' or 'queue_full'
+        self.depth = depth
+        self.limit = limit
+
+
+class SendJob:
+    """A unit of browser work queued on one lane"""
+
+    def __init__(self, lane, handler, payload, release_at=None, client=None, weight=1):
+        self.lane = lane
+        self.handler = handler
+        self.payload = payload
+        self.client = client
+        self.weight = weight
+        self.finish_tag = None
+        self.enqueued_at = time.time()
+        self.release_at = release_at if release_at is not None else self.enqueued_at
+        self.started_at = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Block until the job has run; returns False on timeout"""
+        return self.done.wait(timeout)
+
+
+class LaneStats:
+    def __init__(self, sample_size=1000, initial_service_estimate=5.0, ewma_alpha=0.2):
+        self.enqueued = 0
+        self.served = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits = deque(maxlen=sample_size)
+        self.service_total = 0.0
+        self.ewma_alpha = ewma_alpha
+        self.service_estimate = initial_service_estimate  # EWMA of recent service times
+
+    def record_wait(self, wait):
+        self.served += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.recent_waits.append(wait)
+
+    def record_service(self, duration):
+        self.service_total += duration
+        if self.served <= 1:
+            # The first real sample replaces the configured guess outright
+            self.service_estimate = duration
+        else:
+            self.service_estimate += self.ewma_alpha * (duration - self.service_estimate)
+
+    def snapshot(self, depth):
+        waits = sorted(self.recent_waits)
+
+        def quantile(q):
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))], 3)
+
+        return {
+            'depth': depth,
+            'enqueued': self.enqueued,
+            'served': self.served,
+            'failed': self.failed,
+            'wait_avg': round(self.wait_total / self.served, 3) if self.served else 0.0,
+            'wait_p50': quantile(0.50),
+            'wait_p99': quantile(0.99),
+            'wait_max': round(self.wait_max, 3),
+            'service_avg': round(self.service_total / self.served, 3) if self.served else 0.0,
+            'service_estimate': round(self.service_estimate, 3),
+            'drain_per_minute': round(60.0 / self.service_estimate, 1) if self.service_estimate > 0 else None
+        }
+
+
+class SendDispatcher:
+    """Single worker that owns the browser and serves prioritized lanes.
+
+    Every send goes through here so only one thread ever drives the
+    WebDriver. Jobs are plain callables run on the worker thread; lanes
+    only decide the order they run in.
+
+    policy='strict' always serves the highest non-empty lane, except that a
+    non-OTP job waiting longer than its lane's starvation threshold jumps
+    ahead of the other non-OTP lanes. policy='weighted' uses smooth weighted
+    round-robin across ready lanes with the same starvation rule. Non-OTP
+    lanes are paced by the shared rate limiter; OTPs only draw it down.
+
+    Within a fair lane, jobs are ordered by self-clocked fair queueing:
+    each client's jobs get virtual finish tags spaced 1/weight apart,
+    starting no earlier than the tag currently in service, so a client
+    bursting thousands of requests only delays others by its weight share.
+
+    `housekeeping`, when set, is called on the worker thread between jobs
+    (or while idle) at most every `housekeeping_interval` seconds, for
+    short browser chores that must not race a send.
+    """
+
+    def __init__(self, rate_limiter=None, policy='strict', weights=None, starvation_seconds=None,
+                 max_tracked_clients=1000, housekeeping=None, housekeeping_interval=2.0):
+        self.rate_limiter = rate_limiter
+        self.policy = policy
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.starvation_seconds = dict(DEFAULT_STARVATION_SECONDS, **(starvation_seconds or {}))
+        self._lanes = {lane: [] for lane in LANES}  # heap of (sort_key, seq, job)
+        self._stats = {lane: LaneStats() for lane in LANES}
+        self.max_tracked_clients = max_tracked_clients
+        self._virtual_time = 0.0
+        self._client_finish = {}  # client -> last virtual finish tag
+        self._client_depth = {}  # client -> queued jobs in fair lanes
+        self._client_stats = OrderedDict()  # client -> LaneStats, least recently active first
+        self._current_weight = {lane: 0 for lane in LANES}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self.current_job = None
+        self.housekeeping = housekeeping
+        self.housekeeping_interval = housekeeping_interval
+        self._housekeeping_due = 0.0
+
+    def submit(self, lane, handler, payload, release_at=None, client=None, weight=1):
+        """Queue handler(payload) on a lane and return the SendJob"""
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown lane: {lane}")
+        job = SendJob(lane, handler, payload, release_at, client, weight)
+        with self._cond:
+            self._push(job)
+            self._cond.notify()
+        return job
+
+    def submit_many(self, lane, handler, payloads, release_at=None, client=None, weight=1,
+                    capacity=None, quota=None, on_admit=None):
+        """Queue a batch of jobs on one lane under a single lock acquisition.
+
+        With `capacity` (lane depth) or `quota` (the client's queued jobs)
+        given, the whole batch is refused with QueueFull if it would exceed
+        them, checked under the same lock as the push. `on_admit(payloads)`
+        runs once the batch is admitted, before any of its jobs can start.
+        """
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown lane: {lane}")
+        jobs = [SendJob(lane, handler, payload, release_at, client, weight) for payload in payloads]
+        with self._cond:
+            client_depth = self._client_depth.get(client, 0)
+            if quota is not None and client_depth + len(jobs) > quota:
+                raise QueueFull('client_quota', client_depth, quota)
+            if capacity is not None and len(self._lanes[lane]) + len(jobs) > capacity:
+                raise QueueFull('queue_full', len(self._lanes[lane]), capacity)
+            if on_admit:
+                on_admit(payloads)
+            for job in jobs:
+                self._push(job)
+            self._cond.notify()
+        return jobs
+
+    def _push(self, job):
+        self._seq += 1
+        sort_key = job.release_at
+        if job.lane in FAIR_LANES:
+            start = max(self._virtual_time, self._client_finish.get(job.client, 0.0))
+            job.finish_tag = start + 1.0 / max(job.weight, 0.001)
+            self._client_finish[job.client] = job.finish_tag
+            self._client_depth[job.client] = self._client_depth.get(job.client, 0) + 1
+            self._client_stat(job.client).enqueued += 1
+            sort_key = job.finish_tag
+        heapq.heappush(self._lanes[job.lane], (sort_key, self._seq, job))
+        self._stats[job.lane].enqueued += 1
+
+    def _client_stat(self, client):
+        stats = self._client_stats.get(client)
+        if stats is None:
+            stats = self._client_stats[client] = LaneStats(sample_size=200)
+            # Forget the least recently active idle clients
+            while len(self._client_stats) > self.max_tracked_clients:
+                idle = next((c for c in self._client_stats if not self._client_depth.get(c)), None)
+                if idle is None:
+                    break
+                del self._client_stats[idle]
+        else:
+            self._client_stats.move_to_end(client)
+        return stats
+
+    def _pop(self, lane):
+        job = heapq.heappop(self._lanes[lane])[2]
+        if lane in FAIR_LANES:
+            self._virtual_time = job.finish_tag
+            self._client_depth[job.client] -= 1
+            if not self._client_depth[job.client]:
+                del self._client_depth[job.client]
+                # An idle client's tag is behind virtual time anyway
+                if self._client_finish.get(job.client, 0.0) <= self._virtual_time:
+                    self._client_finish.pop(job.client, None)
+        return job
+
+    def client_depth(self, client):
+        with self._cond:
+            return self._client_depth.get(client, 0)
+
+    def client_stats(self):
+        with self._cond:
+            return {client: stats.snapshot(self._client_depth.get(client, 0))
+                    for client, stats in self._client_stats.items()}
+
+    def depth(self, lane=None):
+        with self._cond:
+            if lane:
+                return len(self._lanes[lane])
+            return sum(len(jobs) for jobs in self._lanes.values())
+
+    def estimate_wait(self, lane, extra_jobs=0, client=None, weight=1):
+        """Seconds until a job submitted now on `lane` would start running.
+
+        Counts the job on the browser plus everything queued on this lane and
+        the lanes above it, each at that lane's recent service time. On a
+        fair lane with a client given, only jobs whose finish tags come
+        before the new job's tag are counted.
+        """
+        now = time.time()
+        with self._cond:
+            wait = 0.0
+            current = self.current_job
+            if current is not None:
+                estimate = self._stats[current.lane].service_estimate
+                wait += max(0.0, estimate - (now - current.started_at))
+            for other in LANES[:LANES.index(lane)]:
+                wait += len(self._lanes[other]) * self._stats[other].service_estimate
+
+            ahead = len(self._lanes[lane])
+            if lane in FAIR_LANES and client is not None:
+                start = max(self._virtual_time, self._client_finish.get(client, 0.0))
+                tag = start + (extra_jobs + 1) / max(weight, 0.001)
+                ahead = sum(1 for _, _, job in self._lanes[lane] if job.finish_tag <= tag)
+            wait += (ahead + extra_jobs) * self._stats[lane].service_estimate
+            return wait
+
+    def service_estimate(self, lane):
+        return self._stats[lane].service_estimate
+
+    def stats(self):
+        with self._cond:
+            return {lane: self._stats[lane].snapshot(len(self._lanes[lane])) for lane in LANES}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='send-dispatcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def _ready_lanes(self, now):
+        return [lane for lane in LANES if self._lanes[lane] and self._lanes[lane][0][2].release_at <= now]
+
+    def _pick_lane(self, ready, now):
+        if 'otp' in ready:
+            return 'otp'
+
+        # Starvation protection: the longest-starved lane goes next
+        starved = [lane for lane in ready
+                   if now - self._lanes[lane][0][2].release_at >= self.starvation_seconds.get(lane, float('inf'))]
+        if starved:
+            return max(starved, key=lambda lane: now - self._lanes[lane][0][2].release_at)
+
+        if self.policy == 'weighted':
+            total = 0
+            for lane in ready:
+                self._current_weight[lane] += self.weights[lane]
+                total += self.weights[lane]
+            lane = max(ready, key=lambda lane: self._current_weight[lane])
+            self._current_weight[lane] -= total
+            return lane
+
+        return ready[0]
+
+    def _wait(self, timeout, now):
+        if self.housekeeping:
+            until_housekeeping = max(0.0, self._housekeeping_due - now)
+            timeout = until_housekeeping if timeout is None else min(timeout, until_housekeeping)
+        self._cond.wait(timeout)
+
+    def _next_job(self):
+        """Block until a job may run; returns None when stopping and
+        HOUSEKEEPING when the housekeeping hook is due"""
+        with self._cond:
+            while self._running:
+                now = time.time()
+                if self.housekeeping and now >= self._housekeeping_due:
+                    self._housekeeping_due = now + self.housekeeping_interval
+                    return HOUSEKEEPING
+                ready = self._ready_lanes(now)
+                if ready:
+                    lane = self._pick_lane(ready, now)
+                    if lane == 'otp' or not self.rate_limiter or self.rate_limiter.try_consume():
+                        if lane == 'otp' and self.rate_limiter:
+                            self.rate_limiter.consume()
+                        return self._pop(lane)
+                    # Out of budget: sleep until a token, or until an OTP arrives
+                    self._wait(max(0.05, self.rate_limiter.time_until_token()), now)
+                    continue
+
+                releases = [jobs[0][2].release_at for jobs in self._lanes.values() if jobs]
+                self._wait(min(releases) - now if releases else None, now)
+        return None
+
+    def _run(self):
+        logger.info("Send dispatcher started")
+        while self._running:
+            job = self._next_job()
+            if job is None:
+                break
+            if job is HOUSEKEEPING:
+                try:
+                    self.housekeeping()
+                except Exception as e:
+                    logger.error("Error in dispatcher housekeeping: %s", e)
+                continue
+            job.started_at = time.time()
+            self.current_job = job
+            try:
+                job.result = job.handler(job.payload)
+            except Exception as e:
+                job.error = e
+                self._stats[job.lane].failed += 1
+                logger.error("Error in %s job: %s", job.lane, e)
+            finally:
+                self.current_job = None
+                with self._cond:
+                    finished_at = time.time()
+                    self._stats[job.lane].record_wait(job.started_at - job.release_at)
+                    self._stats[job.lane].record_service(finished_at - job.started_at)
+                    if job.lane in FAIR_LANES and job.client in self._client_stats:
+                        self._client_stats[job.client].record_wait(job.started_at - job.release_at)
+                        self._client_stats[job.client].record_service(finished_at - job.started_at)
+                job.done.set()
+        logger.info("Send dispatcher stopped")
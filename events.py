@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import deque
+
+
+class EventHub:
+    """Versioned in-memory event log for push consumers.
+
+    Every published event gets a monotonically increasing version. Readers
+    ask for everything after the last version they saw and block until
+    something new arrives, so SSE streams and long-poll clients cost
+    nothing while idle and can resume with Last-Event-ID.
+    """
+
+    def __init__(self, maxlen=10000):
+        self._events = deque(maxlen=maxlen)  # (version, topic, data, published_at)
+        self._version = 0
+        self._cond = threading.Condition()
+
+    @property
+    def version(self):
+        return self._version
+
+    def publish(self, topic, data):
+        with self._cond:
+            self._version += 1
+            self._events.append((self._version, topic, data, time.time()))
+            self._cond.notify_all()
+            return self._version
+
+    def oldest_version(self):
+        with self._cond:
+            return self._events[0][0] if self._events else self._version + 1
+
+    def since(self, version, topics=None):
+        """Events newer than `version`, optionally restricted to some topics"""
+        with self._cond:
+            return self._collect(version, topics)
+
+    def _collect(self, version, topics):
+        if not self._events or self._events[-1][0] <= version:
+            return []
+        # Versions are contiguous, so the start index is a subtraction away
+        start = max(0, version - self._events[0][0] + 1)
+        return [event for event in list(self._events)[start:]
+                if topics is None or event[1] in topics]
+
+    def wait(self, version, timeout=None, topics=None):
+        """Block until events newer than `version` exist (or timeout); returns them"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                events = self._collect(version, topics)
+                if events:
+                    return events
+                if self._events and self._events[-1][0] > version:
+                    # Newer events exist but none match the topics; skip past them
+                    version = self._events[-1][0]
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
@@ -0,0 +1,149 @@
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """Wall-clock stack sampler across all threads.
+
+    Every `interval` seconds it reads the current frame of each thread
+    (sys._current_frames) and counts the stack. Nothing is hooked into the
+    threads being sampled, so the cost to them is the GIL hand-off at each
+    sample; at the default 100 Hz that is well under 1%. Only one profile
+    runs at a time.
+    """
+
+    def __init__(self, max_seconds=60, max_depth=64):
+        self.max_seconds = max_seconds
+        self.max_depth = max_depth
+        self._busy = threading.Lock()
+
+    def run(self, seconds, interval=0.01):
+        """Sample for `seconds`; returns a Counter of stacks (root first, thread name on top)"""
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError('A profile is already running')
+        try:
+            own_ident = threading.get_ident()
+            stacks = Counter()
+            samples = 0
+            deadline = time.monotonic() + min(seconds, self.max_seconds)
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < self.max_depth:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f'thread-{ident}'))
+                    stacks[tuple(reversed(stack))] += 1
+                samples += 1
+                time.sleep(interval)
+            return stacks, samples
+        finally:
+            self._busy.release()
+
+    @staticmethod
+    def collapsed(stacks):
+        """Brendan Gregg's collapsed format: 'thread;outer;...;inner count' per line.
+
+        Loads directly into flamegraph.pl, speedscope or inferno.
+        """
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
+
+    @staticmethod
+    def top_functions(stacks, limit=30):
+        """Functions by samples where they were executing (self) and anywhere on the stack (total)"""
+        own, total = Counter(), Counter()
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack[1:]):
+                total[label] += count
+        return [{'function': label, 'self': own[label], 'total': count}
+                for label, count in total.most_common(limit)]
+
+
+class CallTimer:
+    """Deterministic per-function timings, switched on for a limited window.
+
+    measure() wraps one operation (a bot send) in cProfile while the switch
+    is on, and is a no-op otherwise. cProfile only hooks the thread that
+    enables it, so only the sends themselves pay the overhead. Timings
+    accumulate across sends until reset.
+    """
+
+    def __init__(self):
+        self.active_until = 0
+        self.measured = 0
+        self._stats = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return time.time() < self.active_until
+
+    def start(self, seconds, reset=True):
+        with self._lock:
+            if reset:
+                self._stats = None
+                self.measured = 0
+            self.active_until = time.time() + seconds
+
+    def stop(self):
+        self.active_until = 0
+
+    @contextmanager
+    def measure(self):
+        if not self.active:
+            yield
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler already owns this thread
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+                self.measured += 1
+
+    def report(self, limit=50, match=None):
+        """Functions by cumulative time, optionally only those whose file or name contains `match`"""
+        with self._lock:
+            if self._stats is None:
+                return []
+            entries = list(self._stats.stats.items())
+        rows = []
+        for (filename, line, name), (_, calls, own_time, cumulative, _) in entries:
+            label = f"{os.path.basename(filename)}:{line}({name})"
+            if match and match not in label:
+                continue
+            rows.append({
+                'function': label,
+                'calls': calls,
+                'own_ms': round(own_time * 1000, 3),
+                'cumulative_ms': round(cumulative * 1000, 3),
+                'per_call_ms': round(cumulative * 1000 / calls, 3) if calls else None
+            })
+        rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+        return rows[:limit]
@@ -0,0 +1,44 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket shared by every sender that draws on the WhatsApp rate budget"""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, rate_per_minute // 6))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate_per_minute):
+        with self._lock:
+            self._refill()
+            self.rate = rate_per_minute / 60.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self):
+        """Take a token unconditionally (priority traffic); the balance may go negative"""
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+
+    def try_consume(self):
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def time_until_token(self):
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1 or self.rate <= 0:
+                return 0.0
+            return (1 - self.tokens) / self.rate
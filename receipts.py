@@ -0,0 +1,119 @@
+import threading
+import time
+import logging
+from collections import deque, OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_STATES = ['pending', 'sent', 'delivered', 'read']
+
+
+class ReceiptTracker:
+    """Follows sent messages through WhatsApp's sent/delivered/read ticks.
+
+    The watching happens inside the page (see WhatsAppBot.track_delivery);
+    poll() only drains what the observer recorded, one script call between
+    sends, so tracking never holds up the send queue. track() and poll()
+    touch the browser and must run on the dispatcher thread; stats() is
+    safe from any thread.
+
+    on_update receives a list of (key, fields) with fields such as
+    {'delivery': 'delivered', 'delivered_at': ..., 'time_to_delivered': 4.2}.
+    Messages still on the pending clock after `timeout` seconds are
+    reported as 'unconfirmed'; later stages just stop being watched.
+    """
+
+    def __init__(self, on_update, timeout=300, max_tracked=5000, sample_size=1000):
+        self.on_update = on_update
+        self.timeout = timeout
+        self.max_tracked = max_tracked
+        self.counts = {'tracked': 0, 'sent': 0, 'delivered': 0, 'read': 0, 'unconfirmed': 0}
+        self._latencies = {state: deque(maxlen=sample_size) for state in RECEIPT_STATES[1:]}
+        self._pending = OrderedDict()  # key -> {'phone', 'state', 'sent_at'}
+        self._lock = threading.Lock()
+
+    def track(self, bot, key, phone_number, sent_at=None):
+        """Start watching the message just sent; False if the page could not tag it"""
+        if not bot.track_delivery(key, phone_number):
+            return False
+        expired = []
+        with self._lock:
+            self._pending[key] = {'phone': phone_number, 'state': 'pending', 'sent_at': sent_at or time.time()}
+            self.counts['tracked'] += 1
+            while len(self._pending) > self.max_tracked:
+                expired.append(self._pending.popitem(last=False))
+        self._expire(expired)
+        return True
+
+    def poll(self, bot):
+        """Apply receipt changes recorded in the page since the last poll"""
+        if not self._pending:
+            return
+
+        now = time.time()
+        with self._lock:
+            expired = [(key, entry) for key, entry in self._pending.items() if now - entry['sent_at'] > self.timeout]
+            for key, _ in expired:
+                del self._pending[key]
+
+        events = bot.read_delivery_receipts(forget=[key for key, _ in expired])
+        if events is None:
+            # The page was reloaded and took the observer with it; without the
+            # bubbles only the chat list can still show these receipts
+            for key, entry in list(self._pending.items()):
+                bot.track_delivery(key, entry['phone'], tag_bubble=False)
+            events = bot.read_delivery_receipts() or []
+
+        updates = []
+        with self._lock:
+            for event in events:
+                entry = self._pending.get(event['key'])
+                if entry is None or event['state'] not in RECEIPT_STATES:
+                    continue
+                rank = RECEIPT_STATES.index(event['state'])
+                reached = RECEIPT_STATES[RECEIPT_STATES.index(entry['state']) + 1:rank + 1]
+                if not reached:
+                    continue
+                at = event['at'] / 1000.0
+                latency = round(max(0.0, at - entry['sent_at']), 3)
+                fields = {'delivery': event['state']}
+                # A jump straight to delivered or read implies the skipped stages
+                for state in reached:
+                    self.counts[state] += 1
+                    self._latencies[state].append(latency)
+                    fields[f'{state}_at'] = datetime.fromtimestamp(at).strftime('%Y-%m-%d %H:%M:%S')
+                    fields[f'time_to_{state}'] = latency
+                entry['state'] = event['state']
+                if event['state'] == 'read':
+                    del self._pending[event['key']]
+                updates.append((event['key'], fields))
+        updates.extend(self._expire(expired, notify=False))
+
+        if updates:
+            self.on_update(updates)
+
+    def _expire(self, expired, notify=True):
+        updates = []
+        for key, entry in expired:
+            if entry['state'] == 'pending':
+                logger.warning("No sent receipt for %s to %s after %ss", key, entry['phone'], self.timeout)
+                self.counts['unconfirmed'] += 1
+                updates.append((key, {'delivery': 'unconfirmed'}))
+        if notify and updates:
+            self.on_update(updates)
+        return updates
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts, watching=len(self._pending))
+            for state, samples in self._latencies.items():
+                latencies = sorted(samples)
+
+                def quantile(q):
+                    if not latencies:
+                        return None
+                    return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+                stats[f'time_to_{state}'] = {'p50': quantile(0.50), 'p90': quantile(0.90), 'p99': quantile(0.99)}
+        return stats
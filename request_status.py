@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class RequestStatusStore:
+    """Bounded in-memory view of recent OTP requests and their current status.
+
+    config['otp_history'] stays the durable record of finished requests;
+    this store also knows about requests that are still queued or sending,
+    and answers status lookups without touching config.json.
+
+    Every status change is passed to the registered listeners (outside the
+    lock) so push consumers never need to poll.
+    """
+
+    # Fields kept for internal routing, never returned to API callers
+    PRIVATE_FIELDS = ('callback_url',)
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self.superseded = 0
+        self._entries = OrderedDict()
+        self._pending_by_phone = {}  # phone -> request_id of the newest still-queued OTP
+        self._lock = threading.Lock()
+        self.listeners = []
+
+    def _emit(self, records):
+        for record in records:
+            for listener in self.listeners:
+                listener(record)
+
+    @classmethod
+    def public(cls, record):
+        return {k: v for k, v in record.items() if k not in cls.PRIVATE_FIELDS}
+
+    def create(self, otp_request, status='queued', coalesce=False):
+        """Track a new request.
+
+        With coalesce=True, an older request for the same phone that is
+        still queued is marked 'superseded' and recorded in 'supersedes'.
+        """
+        record = {
+            'request_id': otp_request['request_id'],
+            'phone_number': otp_request['phone_number'],
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'status': status,
+            'retries': 0
+        }
+        if otp_request.get('callback_url'):
+            record['callback_url'] = otp_request['callback_url']
+        phone_number = record['phone_number']
+        changed = []
+        with self._lock:
+            if coalesce:
+                previous = self._entries.get(self._pending_by_phone.get(phone_number))
+                if previous and previous['status'] == 'queued':
+                    previous['status'] = 'superseded'
+                    previous['superseded_by'] = record['request_id']
+                    record['supersedes'] = previous['request_id']
+                    self.superseded += 1
+                    changed.append(dict(previous))
+            self._pending_by_phone[phone_number] = record['request_id']
+            self._entries[record['request_id']] = record
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                if self._pending_by_phone.get(evicted['phone_number']) == evicted['request_id']:
+                    del self._pending_by_phone[evicted['phone_number']]
+            changed.append(dict(record))
+        self._emit(changed)
+        return dict(record)
+
+    def mark_sending(self, request_id):
+        """Move a queued request to 'sending'; False if it has been superseded"""
+        with self._lock:
+            record = self._entries.get(request_id)
+            if record is None:
+                return True
+            if record['status'] == 'superseded':
+                return False
+            record['status'] = 'sending'
+            if self._pending_by_phone.get(record['phone_number']) == request_id:
+                del self._pending_by_phone[record['phone_number']]
+            snapshot = dict(record)
+        self._emit([snapshot])
+        return True
+
+    def update(self, request_id, **fields):
+        with self._lock:
+            record = self._entries.get(request_id)
+            if record is None:
+                return None
+            status_changed = 'status' in fields and fields['status'] != record['status']
+            record.update(fields)
+            snapshot = dict(record)
+        if status_changed:
+            self._emit([snapshot])
+        return snapshot
+
+    def get(self, request_id):
+        with self._lock:
+            record = self._entries.get(request_id)
+            return dict(record) if record else None
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class IdempotencyCache:
+    """TTL cache of Idempotency-Key -> (request_id, fingerprint)"""
+
+    def __init__(self, ttl_seconds=900, max_entries=100000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.duplicates_suppressed = 0
+        self.conflicts = 0
+        self._entries = OrderedDict()  # key -> (expires_at, request_id, fingerprint)
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        while self._entries:
+            key, (expires_at, _, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def claim(self, key, request_id, fingerprint):
+        """Atomically claim `key` for request_id.
+
+        Returns (request_id, is_new). When the key is already held, the
+        original request_id comes back with is_new=False. A key reused with
+        a different fingerprint raises ValueError.
+        """
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            existing = self._entries.get(key)
+            if existing:
+                _, existing_id, existing_fingerprint = existing
+                if existing_fingerprint != fingerprint:
+                    self.conflicts += 1
+                    raise ValueError('Idempotency-Key was already used with a different request')
+                self.duplicates_suppressed += 1
+                return existing_id, False
+            self._entries[key] = (now + self.ttl_seconds, request_id, fingerprint)
+            return request_id, True
+
+    def release(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
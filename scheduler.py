@@ -0,0 +1,247 @@
+import heapq
+import hashlib
+import threading
+import time
+import calendar
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_TYPES = ('one_time', 'daily', 'weekly', 'monthly')
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def _parse_time(value):
+    """Parse 'HH:MM' or 'HH:MM:SS' into (hour, minute, second)"""
+    parts = [int(p) for p in value.split(':')]
+    while len(parts) < 3:
+        parts.append(0)
+    return parts[0], parts[1], parts[2]
+
+
+def compute_next_fire(schedule_item, after):
+    """Return the first datetime strictly after `after` at which the schedule fires, or None"""
+    schedule_type = schedule_item['schedule_type']
+
+    if schedule_type == 'one_time':
+        dt = datetime.fromisoformat(schedule_item['datetime'])
+        return dt if dt > after else None
+
+    hour, minute, second = _parse_time(schedule_item['time'])
+
+    if schedule_type == 'daily':
+        candidate = after.replace(hour=hour, minute=minute, second=second, microsecond=0)
+        if candidate <= after:
+            candidate += timedelta(days=1)
+        return candidate
+
+    if schedule_type == 'weekly':
+        weekdays = {WEEKDAYS.index(day.lower()) for day in schedule_item['days']}
+        base = after.replace(hour=hour, minute=minute, second=second, microsecond=0)
+        for offset in range(8):
+            candidate = base + timedelta(days=offset)
+            if candidate.weekday() in weekdays and candidate > after:
+                return candidate
+        return None
+
+    if schedule_type == 'monthly':
+        day_of_month = int(schedule_item['day_of_month'])
+        year, month = after.year, after.month
+        for _ in range(13):
+            # Months shorter than day_of_month fire on their last day
+            day = min(day_of_month, calendar.monthrange(year, month)[1])
+            candidate = datetime(year, month, day, hour, minute, second)
+            if candidate > after:
+                return candidate
+            month += 1
+            if month > 12:
+                year, month = year + 1, 1
+        return None
+
+    raise ValueError(f"Unknown schedule type: {schedule_type}")
+
+
+def spread_offset(schedule_id, fire_time, window):
+    """Deterministic jitter in [0, window) seconds for one firing of a schedule.
+
+    The same schedule firing at the same instant always lands on the same
+    offset, so restarts and retries do not reshuffle the spread.
+    """
+    if window <= 0:
+        return 0.0
+    digest = hashlib.sha1(f"{schedule_id}|{fire_time.isoformat()}".encode()).digest()
+    fraction = int.from_bytes(digest[:8], 'big') / float(1 << 64)
+    return fraction * window
+
+
+def smoothing_window(batch_size, rate_per_minute, max_window):
+    """Window wide enough to release `batch_size` sends within the rate budget, capped at `max_window`"""
+    if rate_per_minute <= 0:
+        return float(max_window)
+    return min(float(max_window), batch_size * 60.0 / rate_per_minute)
+
+
+class ScheduleEngine:
+    """Min-heap of next-fire times with second precision.
+
+    Removal is lazy: every entry carries a generation number and stale heap
+    items are discarded when they reach the top, so add/remove/fire are all
+    O(log n) regardless of how many schedules exist.
+    """
+
+    def __init__(self, fire_callback, persist_callback=None, misfire_grace=3600):
+        self.fire_callback = fire_callback
+        self.persist_callback = persist_callback
+        self.misfire_grace = misfire_grace
+        self._heap = []
+        self._entries = {}  # schedule_id -> (generation, schedule_item, next_fire)
+        self._generation = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, schedule_items):
+        """Register all active schedules, honouring persisted next_run state"""
+        now = datetime.now()
+        updates = []
+        with self._cond:
+            for schedule_item in schedule_items:
+                if schedule_item.get('status') != 'active':
+                    continue
+                try:
+                    next_fire = None
+                    if schedule_item.get('next_run'):
+                        next_fire = datetime.fromisoformat(schedule_item['next_run'])
+                        if next_fire < now - timedelta(seconds=self.misfire_grace):
+                            # Missed while the service was down, beyond the grace window
+                            next_fire = compute_next_fire(schedule_item, now)
+                    else:
+                        created_at = datetime.fromisoformat(schedule_item['created_at'])
+                        next_fire = compute_next_fire(schedule_item, min(created_at, now))
+                        if next_fire and next_fire < now - timedelta(seconds=self.misfire_grace):
+                            next_fire = compute_next_fire(schedule_item, now)
+                except Exception as e:
+                    logger.error("Error loading schedule %s: %s", schedule_item.get('id'), e)
+                    continue
+
+                if next_fire is None:
+                    updates.append((schedule_item['id'], None, 'missed'))
+                    continue
+                self._push(schedule_item, next_fire)
+                if schedule_item.get('next_run') != next_fire.isoformat():
+                    updates.append((schedule_item['id'], next_fire.isoformat(), 'active'))
+            self._cond.notify()
+
+        if updates:
+            self._persist(updates)
+        logger.info("Schedule engine loaded %s active schedules", len(self._entries))
+
+    def add(self, schedule_item, next_fire=None):
+        """Register (or replace) a schedule and wake the timer thread"""
+        if next_fire is None:
+            next_fire = compute_next_fire(schedule_item, datetime.now())
+        if next_fire is None:
+            return None
+        with self._cond:
+            self._push(schedule_item, next_fire)
+            self._cond.notify()
+        schedule_item['next_run'] = next_fire.isoformat()
+        return next_fire
+
+    def remove(self, schedule_id):
+        with self._cond:
+            removed = self._entries.pop(schedule_id, None) is not None
+            self._cond.notify()
+        return removed
+
+    def next_fire_time(self, schedule_id):
+        entry = self._entries.get(schedule_id)
+        return entry[2] if entry else None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='schedule-engine')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def _push(self, schedule_item, next_fire):
+        self._generation += 1
+        self._entries[schedule_item['id']] = (self._generation, schedule_item, next_fire)
+        heapq.heappush(self._heap, (next_fire.timestamp(), self._generation, schedule_item['id']))
+
+    def _pop_due(self):
+        """Pop every live entry that is due; block until one is, or until woken"""
+        while self._running:
+            while self._heap:
+                fire_ts, generation, schedule_id = self._heap[0]
+                entry = self._entries.get(schedule_id)
+                if entry and entry[0] == generation:
+                    break
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                self._cond.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                self._cond.wait(delay)
+                continue
+
+            due = []
+            now_ts = time.time()
+            while self._heap and self._heap[0][0] <= now_ts:
+                fire_ts, generation, schedule_id = heapq.heappop(self._heap)
+                entry = self._entries.get(schedule_id)
+                if entry and entry[0] == generation:
+                    due.append(entry)
+            if due:
+                return due
+        return []
+
+    def _run(self):
+        logger.info("Schedule engine started")
+        while self._running:
+            with self._cond:
+                due = self._pop_due()
+                updates = []
+                for _, schedule_item, fire_time in due:
+                    next_fire = compute_next_fire(schedule_item, fire_time)
+                    if next_fire is None:
+                        # Left 'active' in storage: the fire callback marks it
+                        # completed once the send has actually run
+                        self._entries.pop(schedule_item['id'], None)
+                    else:
+                        self._push(schedule_item, next_fire)
+                        updates.append((schedule_item['id'], next_fire.isoformat(), 'active'))
+
+            if due:
+                try:
+                    self.fire_callback([(schedule_item, fire_time) for _, schedule_item, fire_time in due])
+                except Exception as e:
+                    logger.error("Error firing %s schedules: %s", len(due), e)
+
+            if updates:
+                self._persist(updates)
+        logger.info("Schedule engine stopped")
+
+    def _persist(self, updates):
+        if not self.persist_callback:
+            return
+        try:
+            self.persist_callback(updates)
+        except Exception as e:
+            logger.error("Error persisting schedule state: %s", e)
@@ -0,0 +1,153 @@
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from tracing import tracer
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+
+
+class RequestContextFilter(logging.Filter):
+    """Tag records with the request whose send is running on the emitting thread"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            trace = tracer.current()
+            record.request_id = trace.trace_id if trace else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _AsyncHandler(QueueHandler):
+    """Hands records to the listener thread without ever blocking the caller"""
+
+    def __init__(self, pipeline):
+        super().__init__(pipeline.queue)
+        self.pipeline = pipeline
+
+    def prepare(self, record):
+        # Merge the arguments now, while they still hold the values being
+        # logged; JSON encoding, tracebacks and file I/O happen on the listener
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.pipeline.count('dropped')
+            return
+        self.pipeline.count(record.levelname)
+
+
+class _TimedListener(QueueListener):
+    def __init__(self, pipeline, *handlers):
+        super().__init__(pipeline.queue, *handlers, respect_handler_level=True)
+        self.pipeline = pipeline
+
+    def start(self):
+        # As QueueListener.start, with the thread named for thread dumps and profiles
+        self._thread = threading.Thread(target=self._monitor, name='log-writer', daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def handle(self, record):
+        started = time.perf_counter()
+        super().handle(record)
+        self.pipeline.handled(time.perf_counter() - started)
+
+
+class LogPipeline:
+    """Queue-based logging: callers enqueue, one listener thread writes.
+
+    The listener owns the only rotating file handler (plus stderr), so a
+    slow disk or a rotation never holds up a request or a send. Records
+    are dropped and counted, rather than waited on, if the queue is full.
+    Record counts by level, drops and the time the listener spends per
+    record are kept for /metrics.
+    """
+
+    def __init__(self, path='whatsapp_otp_service.log', max_bytes=10485760, backup_count=5, queue_size=10000):
+        self.queue = queue.Queue(queue_size)
+        self.counts = {}
+        self.handle_count = 0
+        self.handle_seconds = 0.0
+        self.handle_seconds_max = 0.0
+        self.on_handled = None  # optional callback receiving each record's handling time
+        self._lock = threading.Lock()
+
+        self.file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+        self.stream_handler = logging.StreamHandler()
+        self.handler = _AsyncHandler(self)
+        self.handler.addFilter(RequestContextFilter())
+        self.listener = _TimedListener(self, self.file_handler, self.stream_handler)
+        self.set_format(True)
+
+    def install(self, level=logging.INFO):
+        """Replace the root logger's handlers with the queue and start the listener"""
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(level)
+        self.listener.start()
+
+    def stop(self):
+        """Write out everything still queued"""
+        if self.listener.running:
+            self.listener.stop()
+
+    def set_format(self, json_output):
+        formatter = JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT)
+        self.file_handler.setFormatter(formatter)
+        self.stream_handler.setFormatter(formatter)
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def handled(self, seconds):
+        with self._lock:
+            self.handle_count += 1
+            self.handle_seconds += seconds
+            self.handle_seconds_max = max(self.handle_seconds_max, seconds)
+        if self.on_handled:
+            self.on_handled(seconds)
+
+    def stats(self):
+        with self._lock:
+            records = {level: count for level, count in self.counts.items() if level != 'dropped'}
+            return {
+                'records': records,
+                'dropped': self.counts.get('dropped', 0),
+                'queue_depth': self.queue.qsize(),
+                'handled': self.handle_count,
+                'handler_avg_ms': round(self.handle_seconds / self.handle_count * 1000, 3) if self.handle_count else None,
+                'handler_max_ms': round(self.handle_seconds_max * 1000, 3)
+            }
@@ -45,6 +45,41 @@ def test_send_otp():
         print(f"❌ JSON decode error: {e}")
         return None
 
+def test_send_otp_batch():
+    """Test sending a batch of OTPs with one invalid item"""
+    print("🔄 Testing batch OTP sending...")
+    
+    url = f"{API_BASE_URL}/api/send-otp/batch"
+    data = {
+        "requests": [
+            {"phone_number": TEST_PHONE_NUMBER, "otp_code": TEST_OTP_CODE},
+            {"phone_number": "123", "otp_code": TEST_OTP_CODE}
+        ]
+    }
+    
+    try:
+        response = requests.post(url, json=data, timeout=10)
+        result = response.json()
+        
+        print(f"📤 Response Status: {response.status_code}")
+        print(f"📤 Response: {json.dumps(result, indent=2)}")
+        
+        results = result.get("results", [])
+        if (response.status_code == 200 and len(results) == 2
+                and results[0].get("request_id") and results[1].get("status") == "error"):
+            print("✅ Batch OTP sending test PASSED")
+            return results[0].get("request_id")
+        else:
+            print("❌ Batch OTP sending test FAILED")
+            return None
+            
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Request error: {e}")
+        return None
+    except json.JSONDecodeError as e:
+        print(f"❌ JSON decode error: {e}")
+        return None
+
 def test_otp_status(request_id):
     """Test checking OTP status"""
     if not request_id:
@@ -116,7 +151,12 @@ def test_invalid_requests():
         # Invalid phone number
         {"phone_number": "123", "otp_code": "123456"},
         # Empty OTP
-        {"phone_number": "1234567890", "otp_code": ""}
+        {"phone_number": "1234567890", "otp_code": ""},
+        # Non-finite or out of range TTLs
+        {"phone_number": "1234567890", "otp_code": "123456", "ttl_seconds": "inf"},
+        {"phone_number": "1234567890", "otp_code": "123456", "ttl_seconds": "nan"},
+        {"phone_number": "1234567890", "otp_code": "123456", "ttl_seconds": 0},
+        {"phone_number": "1234567890", "otp_code": "123456", "ttl_seconds": 10 ** 9}
     ]
     
     for i, data in enumerate(test_cases, 1):
@@ -186,6 +226,10 @@ def main():
     request_id = test_send_otp()
     print("\n" + "-" * 30)
     
+    # Test batch OTP sending
+    test_send_otp_batch()
+    print("\n" + "-" * 30)
+    
     # Wait a bit then test status
     if request_id:
         print("⏳ Waiting 3 seconds before checking status...")
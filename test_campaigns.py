@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Checks for the campaign manager's pause/resume bookkeeping
+Usage: python test_campaigns.py (or pytest)
+
+The dispatcher stand-in runs the bulk lane on one worker thread in FIFO
+order, as SendDispatcher does.
+"""
+
+import queue
+import tempfile
+import threading
+import time
+
+from campaigns import CampaignManager
+
+
+class BulkLane:
+    def __init__(self):
+        self.jobs = queue.Queue()
+        worker = threading.Thread(target=self._work)
+        worker.daemon = True
+        worker.start()
+
+    def submit(self, lane, handler, payload):
+        self.jobs.put((handler, payload))
+
+    def _work(self):
+        while True:
+            handler, payload = self.jobs.get()
+            handler(payload)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_pause_resume_during_send_does_not_resend():
+    sent = []
+    sending = threading.Event()
+    release = threading.Event()
+
+    def send_fn(phone, message):
+        sent.append(phone)
+        if len(sent) == 1:
+            sending.set()
+            release.wait(5)
+        return True
+
+    manager = CampaignManager(BulkLane(), send_fn, base_dir=tempfile.mkdtemp(), max_in_flight=10)
+    manager.start()
+    try:
+        campaign = manager.create('Hi {name}', [('111', 'A'), ('222', 'B'), ('333', 'C')])
+        assert sending.wait(5)
+        # The first recipient is inside send_fn while the campaign is paused and resumed
+        assert manager.pause(campaign['id'])
+        assert manager.resume(campaign['id'])
+        time.sleep(0.2)
+        release.set()
+        wait_for(lambda: manager.get(campaign['id'])['status'] == 'completed')
+    finally:
+        manager.stop()
+
+    assert sorted(sent) == ['111', '222', '333']
+    result = manager.get(campaign['id'])
+    assert (result['completed'], result['successful']) == (3, 3)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Checks for the schedule engine and its spreading helpers
+Usage: python test_scheduler.py (or pytest)
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from scheduler import ScheduleEngine, compute_next_fire, smoothing_window
+
+
+def one_time_schedule(seconds_from_now):
+    due = datetime.now() + timedelta(seconds=seconds_from_now)
+    return {
+        'id': 'one-time',
+        'schedule_type': 'one_time',
+        'datetime': due.isoformat(),
+        'status': 'active',
+        'created_at': datetime.now().isoformat()
+    }
+
+
+def test_unknown_schedule_type_is_rejected():
+    try:
+        compute_next_fire({'schedule_type': 'hourly', 'time': '10:00'}, datetime.now())
+    except ValueError:
+        return
+    assert False, 'expected ValueError'
+
+
+def test_one_time_schedule_is_not_completed_by_the_engine():
+    fired = threading.Event()
+    persisted = []
+    engine = ScheduleEngine(lambda batch: fired.set(), persisted.extend)
+    engine.start()
+    try:
+        assert engine.add(one_time_schedule(0.2)) is not None
+        assert fired.wait(5)
+    finally:
+        engine.stop()
+    # Completion is up to the fire callback, once the send has run
+    assert len(engine) == 0
+    assert persisted == []
+
+
+def test_smoothing_window_is_capped_by_the_configured_window():
+    # 30 sends at 60/min would need 30s; a 5s window is honoured as given
+    assert smoothing_window(30, 60, 5) == 5.0
+    assert smoothing_window(3, 60, 60) == 3.0
+    assert smoothing_window(3, 0, 10) == 10.0
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Checks for WhatsAppBot's element lookups against a small fake page
+Usage: python test_whatsapp_auto.py (or pytest)
+
+The fake page answers XPaths with a tiny matcher for the attribute
+predicates the bot's selectors use, returning matches in document order
+as a browser does. On WhatsApp Web the sidebar search box is a
+contenteditable textbox that comes before the chat composer.
+"""
+
+import re
+
+from whatsapp_auto import COMPOSER_XPATHS, first_displayed, composer_cleared
+
+_PREDICATE = re.compile(r"@([\w-]+)='([^']*)'")
+
+
+class PageElement:
+    def __init__(self, name, in_main=False, **attrs):
+        self.name = name
+        self.in_main = in_main
+        self.attrs = {key.replace('_', '-'): value for key, value in attrs.items()}
+        self.text = ''
+
+    def matches(self, xpath):
+        if "@id='main'" in xpath:
+            if not self.in_main:
+                return False
+            xpath = xpath.split("@id='main']", 1)[1]
+        if 'contains(@class' in xpath and 'message-input' not in self.attrs.get('class', ''):
+            return False
+        return all(self.attrs.get(key) == value for key, value in _PREDICATE.findall(xpath))
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+
+class PageDriver:
+    def __init__(self, elements):
+        self.elements = elements  # in document order
+
+    def find_elements(self, by, xpath):
+        return [element for element in self.elements if any(element.matches(part) for part in xpath.split(' | '))]
+
+
+def search_box():
+    return PageElement('search', contenteditable='true', role='textbox', data_tab='3')
+
+
+def composer():
+    return PageElement('composer', in_main=True, contenteditable='true', role='textbox', data_tab='10')
+
+
+def test_composer_chosen_over_search_box():
+    driver = PageDriver([search_box(), composer()])
+    assert first_displayed(COMPOSER_XPATHS)(driver).name == 'composer'
+
+
+def test_search_box_alone_is_not_a_chat():
+    driver = PageDriver([search_box()])
+    assert first_displayed(COMPOSER_XPATHS)(driver) is False
+
+
+def test_composer_cleared_watches_the_composer():
+    box, chat = search_box(), composer()
+    box.text = 'typed into search'
+    driver = PageDriver([box, chat])
+    assert composer_cleared(driver)
+    chat.text = 'OTP 123456'
+    assert not composer_cleared(driver)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,97 @@
+import threading
+from collections import deque
+
+# name -> (initial, floor, ceiling) in seconds. The initial value is used
+# until enough successful waits have been seen to trust the distribution.
+DEFAULT_WAITS = {
+    'page_load': (60, 10, 120),    # WhatsApp Web shell after opening the site
+    'chat_open': (10, 2, 30),      # composer appearing after opening a chat URL
+    'chat_switch': (5, 0.5, 20),   # chat replacing the open one after clicking a chat or contact
+    'composer': (3, 0.5, 10),      # message box in an already open chat
+    'send_button': (6, 0.5, 20),   # send button becoming clickable after typing
+    'message_sent': (2, 0.2, 5),   # composer emptying after the send click
+}
+
+
+class AdaptiveTimeout:
+    """Timeout for one kind of wait, learned from its successful latencies.
+
+    The timeout is `multiplier` times the `quantile` of recent successes,
+    clamped to [floor, ceiling]. A wait that times out doubles the next
+    timeout (up to the ceiling) until one succeeds again, so a page that is
+    slow but healthy still gets through on the retry.
+    """
+
+    def __init__(self, name, initial, floor, ceiling, quantile=0.99, multiplier=2.0,
+                 min_samples=20, sample_size=200):
+        self.name = name
+        self.initial = initial
+        self.floor = floor
+        self.ceiling = ceiling
+        self.quantile = quantile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.successes = 0
+        self.timeouts = 0
+        self._backoff = 1.0
+        self._samples = deque(maxlen=sample_size)
+        self._lock = threading.Lock()
+
+    def _quantile(self, q):
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def timeout(self):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                base = self.initial
+            else:
+                base = self._quantile(self.quantile) * self.multiplier
+            return min(self.ceiling, max(self.floor, base * self._backoff))
+
+    def record_success(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.successes += 1
+            self._backoff = 1.0
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+            self._backoff = min(self._backoff * 2, 16.0)
+
+    def snapshot(self):
+        timeout = self.timeout()
+        with self._lock:
+            return {
+                'timeout': round(timeout, 2),
+                'samples': len(self._samples),
+                'p50': round(self._quantile(0.50), 3) if self._samples else None,
+                'p99': round(self._quantile(0.99), 3) if self._samples else None,
+                'successes': self.successes,
+                'timeouts': self.timeouts
+            }
+
+
+class AdaptiveTimeouts:
+    """The bot's named waits, shared across browser restarts"""
+
+    def __init__(self, quantile=0.99, multiplier=2.0, limits=None):
+        self.waits = {}
+        self.configure(quantile, multiplier, limits)
+
+    def configure(self, quantile=0.99, multiplier=2.0, limits=None):
+        """Apply settings; `limits` maps a wait name to [floor, ceiling]"""
+        for name, (initial, floor, ceiling) in DEFAULT_WAITS.items():
+            floor, ceiling = (limits or {}).get(name, (floor, ceiling))
+            wait = self.waits.get(name)
+            if wait is None:
+                wait = self.waits[name] = AdaptiveTimeout(name, initial, floor, ceiling)
+            wait.floor, wait.ceiling = floor, ceiling
+            wait.quantile, wait.multiplier = quantile, multiplier
+
+    def timeout(self, name):
+        return self.waits[name].timeout()
+
+    def stats(self):
+        return {name: wait.snapshot() for name, wait in self.waits.items()}
@@ -0,0 +1,263 @@
+import functools
+import heapq
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Span:
+    def __init__(self, trace, name, depth, attrs):
+        self.trace = trace
+        self.name = name
+        self.depth = depth
+        self.attrs = attrs
+        self.start = time.time()
+        self.end_time = None
+
+    def end(self, **attrs):
+        """Close the span; later calls are ignored"""
+        if self.end_time is not None:
+            return
+        self.attrs.update(attrs)
+        self.end_time = time.time()
+        if self in self.trace._stack:
+            self.trace._stack.remove(self)
+
+    def to_dict(self, origin):
+        end_time = self.end_time if self.end_time is not None else time.time()
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'start_ms': round((self.start - origin) * 1000, 1),
+            'duration_ms': round((end_time - self.start) * 1000, 1),
+            **({'attrs': self.attrs} if self.attrs else {})
+        }
+
+
+class Trace:
+    """Spans for one send, in start order, with nesting depth.
+
+    A trace is only ever touched by one thread at a time: the API thread
+    while the request is accepted, then the dispatcher thread once the
+    send runs.
+    """
+
+    def __init__(self, kind, **attrs):
+        self.trace_id = None
+        self.kind = kind
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.finished_at = None
+        self.spans = []
+        self._stack = []
+
+    def start_span(self, name, **attrs):
+        span = Span(self, name, len(self._stack), attrs)
+        self.spans.append(span)
+        self._stack.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name, **attrs):
+        span = self.start_span(name, **attrs)
+        try:
+            yield span
+        except Exception as e:
+            span.attrs['error'] = str(e)
+            raise
+        finally:
+            span.end()
+
+    def add_span(self, name, start, end, **attrs):
+        """Record an interval measured elsewhere, such as time spent queued"""
+        span = Span(self, name, len(self._stack), attrs)
+        span.start, span.end_time = start, end
+        self.spans.append(span)
+        return span
+
+    def last_end(self):
+        ends = [span.end_time for span in self.spans if span.end_time is not None]
+        return max(ends) if ends else None
+
+    @property
+    def duration(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+    def summary(self):
+        return {
+            'trace_id': self.trace_id,
+            'kind': self.kind,
+            'started_at': round(self.started_at, 3),
+            'duration_ms': round(self.duration * 1000, 1),
+            **self.attrs
+        }
+
+    def to_dict(self):
+        result = self.summary()
+        result['spans'] = [span.to_dict(self.started_at) for span in list(self.spans)]
+        return result
+
+
+class Tracer:
+    """Per-send span tracing with a ring buffer and a slowest-N list.
+
+    Bot code calls tracer.span(...) freely; it records into whatever trace
+    is active on the current thread and costs a thread-local lookup when
+    none is. Finished traces land in a ring buffer of `max_traces`, and
+    the `slowest` longest ones are also kept with full span breakdowns
+    regardless of how old they are.
+    """
+
+    def __init__(self, max_traces=2000, slowest=50, max_open=10000):
+        self.max_traces = max_traces
+        self.slowest_size = slowest
+        self.max_open = max_open
+        self._open = OrderedDict()  # trace_id -> Trace accepted but not yet sent
+        self._active = {}  # trace_id -> Trace whose send is running
+        self._finished = OrderedDict()  # trace_id -> Trace, oldest first
+        self._slowest = []  # min-heap of (duration, seq, Trace)
+        self._seq = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def begin(self, trace_id, trace):
+        """Park a trace started on an API thread until its send runs"""
+        trace.trace_id = trace_id
+        with self._lock:
+            self._open[trace_id] = trace
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return trace
+
+    def current(self):
+        return getattr(self._local, 'trace', None)
+
+    @contextmanager
+    def activate(self, trace_id=None, kind='send', queued_at=None, **attrs):
+        """Make a trace current on this thread and finish it on exit.
+
+        Picks up the trace parked under trace_id, or starts a new one. The
+        gap since its last span (or since `queued_at`) is recorded as
+        'queue_wait'. Nested activations reuse the outer trace.
+        """
+        outer = self.current()
+        if outer is not None:
+            yield outer
+            return
+
+        with self._lock:
+            trace = self._open.pop(trace_id, None) if trace_id else None
+            if trace is None:
+                trace = Trace(kind)
+                trace.trace_id = trace_id or str(uuid.uuid4())
+                if queued_at:
+                    trace.started_at = min(trace.started_at, queued_at)
+            self._active[trace.trace_id] = trace
+        trace.attrs.update(attrs)
+
+        now = time.time()
+        gap_start = trace.last_end() or queued_at
+        if gap_start and gap_start < now:
+            trace.add_span('queue_wait', gap_start, now)
+
+        self._local.trace = trace
+        try:
+            yield trace
+        finally:
+            self._local.trace = None
+            self.finish(trace)
+
+    def finish(self, trace):
+        trace.finished_at = time.time()
+        with self._lock:
+            self._active.pop(trace.trace_id, None)
+            self._finished[trace.trace_id] = trace
+            self._finished.move_to_end(trace.trace_id)
+            while len(self._finished) > self.max_traces:
+                self._finished.popitem(last=False)
+            self._seq += 1
+            entry = (trace.duration, self._seq, trace)
+            if len(self._slowest) < self.slowest_size:
+                heapq.heappush(self._slowest, entry)
+            elif entry[0] > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def discard(self, trace_id):
+        with self._lock:
+            self._open.pop(trace_id, None)
+
+    def span(self, name, **attrs):
+        """Context manager recording a span in the current trace, if any"""
+        trace = self.current()
+        if trace is None:
+            return _NOOP_CONTEXT
+        return trace.span(name, **attrs)
+
+    def start_span(self, name, **attrs):
+        """A span closed explicitly with .end(), for loops that exit early"""
+        trace = self.current()
+        if trace is None:
+            return _NOOP_SPAN
+        return trace.start_span(name, **attrs)
+
+    def annotate(self, **attrs):
+        """Attach attributes to the current trace"""
+        trace = self.current()
+        if trace is not None:
+            trace.attrs.update(attrs)
+
+    def traced(self, name):
+        """Decorator wrapping a method in a span that records its result"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                trace = self.current()
+                if trace is None:
+                    return func(*args, **kwargs)
+                with trace.span(name) as span:
+                    result = func(*args, **kwargs)
+                    if isinstance(result, bool):
+                        span.attrs['result'] = result
+                    return result
+            return wrapper
+        return decorator
+
+    def get(self, trace_id):
+        with self._lock:
+            trace = self._finished.get(trace_id) or self._active.get(trace_id) or self._open.get(trace_id)
+            return trace.to_dict() if trace else None
+
+    def recent(self, limit=100, kind=None):
+        with self._lock:
+            traces = list(self._finished.values())
+        traces = [t for t in reversed(traces) if kind is None or t.kind == kind]
+        return [t.summary() for t in traces[:limit]]
+
+    def slowest(self):
+        with self._lock:
+            traces = [trace for _, _, trace in sorted(self._slowest, key=lambda entry: entry[0], reverse=True)]
+        return [trace.to_dict() for trace in traces]
+
+
+class _NoopSpan:
+    @property
+    def attrs(self):
+        return {}
+
+    def end(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+_NOOP_CONTEXT = _NOOP_SPAN
+
+# Shared by the app and the bot
+tracer = Tracer()
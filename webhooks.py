@@ -0,0 +1,177 @@
+import heapq
+import ipaddress
+import json
+import random
+import socket
+import threading
+import time
+import logging
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+def callback_target_error(url, allowed_hosts=(), resolve=True):
+    """Why `url` may not receive webhooks, or None if it may.
+
+    With `allowed_hosts` set only those hosts are accepted. Otherwise the
+    host must not be or resolve to a loopback, link-local, private or other
+    non-public address. With resolve=False only IP literals and localhost
+    are checked, which needs no DNS lookup.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return 'must be an http or https URL'
+    host = parts.hostname.lower().rstrip('.')
+    if allowed_hosts:
+        return None if host in allowed_hosts else 'host is not in webhook_allowed_hosts'
+    if host == 'localhost' or host.endswith('.localhost'):
+        return 'host is not public'
+
+    try:
+        addresses = [ipaddress.ip_address(host)]
+    except ValueError:
+        if not resolve:
+            return None
+        try:
+            infos = socket.getaddrinfo(host, parts.port or (443 if parts.scheme == 'https' else 80),
+                                       proto=socket.IPPROTO_TCP)
+        except (socket.gaierror, UnicodeError):
+            return 'host does not resolve'
+        addresses = [ipaddress.ip_address(info[4][0].split('%')[0]) for info in infos]
+    if not all(address.is_global for address in addresses):
+        return 'host is not public'
+    return None
+
+
+class WebhookNotifier:
+    """Small worker pool that POSTs status events to client callback URLs.
+
+    Events for the same URL are batched: a worker waits up to `linger`
+    seconds for more to accumulate and sends up to `batch_size` of them in
+    one request as {"events": [...]}. Failed batches are retried with
+    exponential backoff and jitter, up to `max_attempts` times.
+
+    Each worker has its own requests.Session. Targets are checked with
+    callback_target_error against `allowed_hosts` before every POST, and
+    redirects are not followed, so callbacks can't reach internal services.
+    """
+
+    def __init__(self, workers=4, batch_size=50, linger=0.2, max_attempts=5,
+                 backoff_base=1.0, timeout=5, allowed_hosts=()):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.allowed_hosts = allowed_hosts
+        self.delivered = 0
+        self.failed_attempts = 0
+        self.dropped = 0
+        self._pending = {}  # url -> list of events not yet handed to a worker
+        self._ready = deque()  # (ready_at, url) in arrival order
+        self._retries = []  # heap of (due_at, seq, url, events, attempt)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads = []
+
+    def notify(self, url, event):
+        with self._cond:
+            if url not in self._pending:
+                self._pending[url] = []
+                self._ready.append((time.time() + self.linger, url))
+            self._pending[url].append(event)
+            self._cond.notify()
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'webhook-{index}')
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=2):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def _next_batch(self):
+        with self._cond:
+            while self._running:
+                now = time.time()
+                if self._retries and self._retries[0][0] <= now:
+                    _, _, url, events, attempt = heapq.heappop(self._retries)
+                    return url, events, attempt
+                if self._ready and self._ready[0][0] <= now:
+                    _, url = self._ready.popleft()
+                    events = self._pending.pop(url)
+                    if len(events) > self.batch_size:
+                        # Leave the overflow for the next batch
+                        self._pending[url] = events[self.batch_size:]
+                        self._ready.append((now, url))
+                        events = events[:self.batch_size]
+                    return url, events, 1
+
+                due = [queue[0][0] for queue in (self._retries, self._ready) if queue]
+                self._cond.wait(max(0.01, min(due) - now) if due else None)
+        return None
+
+    def _run(self):
+        # Sessions aren't thread-safe, so each worker keeps its own connections
+        session = requests.Session()
+        while self._running:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            url, events, attempt = batch
+            # Checked again at delivery, as DNS may have changed since the request
+            blocked = callback_target_error(url, self.allowed_hosts)
+            if blocked:
+                with self._cond:
+                    self.dropped += len(events)
+                logger.warning("Dropping %s webhook events for %s: %s", len(events), url, blocked)
+                continue
+            try:
+                response = session.post(url, data=json.dumps({'events': events}),
+                                        headers={'Content-Type': 'application/json'},
+                                        timeout=self.timeout, allow_redirects=False)
+                if response.status_code < 300:
+                    with self._cond:
+                        self.delivered += len(events)
+                    continue
+                error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = str(e)
+
+            with self._cond:
+                self.failed_attempts += 1
+                if attempt >= self.max_attempts:
+                    self.dropped += len(events)
+                    logger.warning("Dropping %s webhook events for %s after %s attempts: %s", len(events), url, attempt, error)
+                    continue
+                delay = self.backoff_base * (2 ** (attempt - 1)) * (1 + random.random() * 0.2)
+                self._seq += 1
+                heapq.heappush(self._retries, (time.time() + delay, self._seq, url, events, attempt + 1))
+                self._cond.notify()
+            logger.info("Webhook delivery to %s failed (%s), retry %s in %.1fs", url, error, attempt, delay)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'delivered': self.delivered,
+                'failed_attempts': self.failed_attempts,
+                'dropped': self.dropped,
+                'backlog': sum(len(events) for events in self._pending.values()) +
+                sum(len(item[3]) for item in self._retries)
+            }
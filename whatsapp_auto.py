@@ -6,19 +6,152 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.edge.service import Service
 from selenium.webdriver.edge.options import Options
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
 import subprocess
 import os
 from urllib.parse import quote
 import logging
+from tracing import tracer
+from timeouts import AdaptiveTimeouts
 
 logger = logging.getLogger(__name__)
 
+WHATSAPP_WEB_URL = 'https://web.whatsapp.com'
+
+# Message composer in an open chat. Scoped to the chat pane (#main), as the
+# sidebar search box is a contenteditable textbox too and comes first in the DOM
+COMPOSER_XPATHS = [
+    "//div[@id='main']//div[@contenteditable='true'][@data-tab='10']",
+    "//div[@id='main']//div[@role='textbox'][@contenteditable='true']",
+    "//div[@id='main']//div[contains(@class, 'message-input')][@contenteditable='true']"
+]
+
+SEND_BUTTON_XPATHS = [
+    "//span[@data-icon='send']",
+    "//button[@aria-label='Send']",
+    "//span[@data-icon='send']/parent::button",
+    "//div[@role='button'][@aria-label='Send']",
+    "//button[contains(@class, 'compose-btn-send')]"
+]
+
+
+def first_displayed(xpaths, clickable=False):
+    """WebDriverWait condition: the first visible element matching the
+    XPaths, tried in list order so a more specific selector always wins.
+    One wait covers all of them instead of one wait per selector."""
+    def condition(driver):
+        for xpath in xpaths:
+            for element in driver.find_elements(By.XPATH, xpath):
+                if element.is_displayed() and (not clickable or element.is_enabled()):
+                    return element
+        return False
+    return condition
+
+
+def composer_cleared(driver):
+    """WebDriverWait condition: the open chat's composer is empty again,
+    which happens once WhatsApp Web has taken the message"""
+    composer = first_displayed(COMPOSER_XPATHS)(driver)
+    return composer is not False and not composer.text
+
+
+# Installed once per page load. A MutationObserver notices tick icon changes
+# and records each tracked message's progress (pending -> sent -> delivered
+# -> read) in the page, so nothing has to block waiting for receipts. The
+# message's own bubble is checked while its chat is open; after that the
+# chat list row, which shows the receipt of the last outgoing message.
+RECEIPT_TRACKER_JS = """
+if (!window.__receiptTracker) {
+    (function () {
+        var RANK = {pending: 0, sent: 1, delivered: 2, read: 3};
+        var tracked = {};
+        var events = [];
+        var scheduled = false;
+
+        function iconState(icon) {
+            if (!icon) return null;
+            var name = icon.getAttribute('data-icon') || '';
+            var label = (icon.getAttribute('aria-label') || '').toLowerCase();
+            if (name.indexOf('time') !== -1) return 'pending';
+            if (name.indexOf('dblcheck') !== -1) {
+                return (label.indexOf('read') !== -1 || name.indexOf('ack') !== -1) ? 'read' : 'delivered';
+            }
+            if (name.indexOf('check') !== -1) return 'sent';
+            return null;
+        }
+
+        function bubbleIcon(key) {
+            var bubble = document.querySelector('[data-receipt-key="' + key + '"]');
+            return bubble && bubble.querySelector('span[data-icon^="msg-"]');
+        }
+
+        function chatListIcon(phone) {
+            var titles = document.querySelectorAll('#pane-side span[title]');
+            for (var i = 0; i < titles.length; i++) {
+                if (titles[i].getAttribute('title').replace(/\\D/g, '') === phone) {
+                    var row = titles[i].closest('[role="listitem"], [role="row"]');
+                    return row && row.querySelector('span[data-icon^="status-"]');
+                }
+            }
+            return null;
+        }
+
+        function scan() {
+            scheduled = false;
+            var now = Date.now();
+            for (var key in tracked) {
+                var entry = tracked[key];
+                var state = iconState(bubbleIcon(key)) || iconState(chatListIcon(entry.phone));
+                if (state && RANK[state] > RANK[entry.state]) {
+                    entry.state = state;
+                    events.push({key: key, state: state, at: now});
+                    if (state === 'read') delete tracked[key];
+                }
+            }
+        }
+
+        new MutationObserver(function () {
+            if (!scheduled) {
+                scheduled = true;
+                setTimeout(scan, 250);
+            }
+        }).observe(document.body, {
+            subtree: true, childList: true, attributes: true,
+            attributeFilter: ['data-icon', 'aria-label']
+        });
+
+        window.__receiptTracker = {
+            track: function (key, phone, tagBubble) {
+                if (tagBubble) {
+                    var bubbles = document.querySelectorAll('#main div.message-out');
+                    if (!bubbles.length) return false;
+                    bubbles[bubbles.length - 1].setAttribute('data-receipt-key', key);
+                }
+                tracked[key] = {phone: phone, state: 'pending'};
+                scan();
+                return true;
+            },
+            drain: function (forget) {
+                (forget || []).forEach(function (key) { delete tracked[key]; });
+                var drained = events;
+                events = [];
+                return drained;
+            }
+        };
+    })();
+}
+"""
+
 class WhatsAppBot:
-    def __init__(self, headless=False):
+    def __init__(self, headless=False, timeouts=None, base_url=WHATSAPP_WEB_URL):
         self.driver = None
         self.wait = None
         self.is_running = False
         self.headless = headless  # For VPS deployment
+        self.timeouts = timeouts or AdaptiveTimeouts()  # Learned wait limits, may outlive this bot
+        self.last_send_strategy = None  # Which path delivered the last message
+        self.open_chat = None  # Number whose chat the last send left open
+        self.base_url = base_url.rstrip('/')  # WhatsApp Web, or a stand-in such as benchmarks/fake_whatsapp_web.py
         
     def kill_edge_processes(self):
         """Kill any existing Edge processes"""
@@ -30,6 +163,51 @@ class WhatsAppBot:
         except Exception:
             pass
         
+    def _wait_until(self, name, condition):
+        """WebDriverWait with the learned timeout for `name`.
+
+        Returns the condition's result, or None once the timeout passes.
+        Successful wait times feed back into the timeout.
+        """
+        wait = self.timeouts.waits[name]
+        timeout = wait.timeout()
+        started = time.time()
+        with tracer.span(f'wait.{name}', timeout=round(timeout, 2)) as span:
+            try:
+                result = WebDriverWait(self.driver, timeout, poll_frequency=0.2).until(condition)
+            except TimeoutException:
+                wait.record_timeout()
+                span.attrs['timed_out'] = True
+                logger.debug("Wait for %s timed out after %.1fs", name, timeout)
+                return None
+        wait.record_success(time.time() - started)
+        return result
+
+    def _is_in_chat(self):
+        """Wait for the message composer of a freshly opened chat"""
+        return self._wait_until('chat_open', first_displayed(COMPOSER_XPATHS)) is not None
+
+    def _current_composer(self):
+        """The composer showing right now, if any, without waiting"""
+        return first_displayed(COMPOSER_XPATHS)(self.driver) or None
+
+    def _wait_for_chat_switch(self, previous):
+        """After clicking a chat or contact, wait for its chat to open.
+
+        `previous` is the composer that was showing before the click. It has
+        to go stale first, so nothing is typed into the chat that was open.
+        """
+        def switched(driver):
+            if previous is not None:
+                try:
+                    previous.is_displayed()
+                    return False
+                except StaleElementReferenceException:
+                    pass
+            return first_displayed(COMPOSER_XPATHS)(driver)
+        return self._wait_until('chat_switch', switched) is not None
+
+    @tracer.traced('bot.setup_driver')
     def setup_driver(self):
         """Setup the Edge WebDriver with existing profile"""
         try:
@@ -81,11 +259,11 @@ class WhatsAppBot:
             # Set page load timeout
             self.driver.set_page_load_timeout(60)
             
-            logger.info(f"Edge driver setup completed {'(headless mode)' if self.headless else ''}")
+            logger.info("Edge driver setup completed %s", '(headless mode)' if self.headless else '')
             return self.driver
             
         except Exception as e:
-            logger.error(f"Error setting up Edge driver: {str(e)}")
+            logger.error("Error setting up Edge driver: %s", e)
             if self.driver:
                 try:
                     self.driver.quit()
@@ -94,17 +272,19 @@ class WhatsAppBot:
             self.driver = None
             raise
 
+    @tracer.traced('bot.login')
     def login_to_whatsapp(self):
         """Open WhatsApp Web with existing session"""
         try:
             logger.info("Opening WhatsApp Web...")
-            self.driver.get("https://web.whatsapp.com")
-            time.sleep(5)
+            self.driver.get(self.base_url)
             
             logger.info("Waiting for WhatsApp Web to load...")
-            initial_load = self.wait.until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, 'div[role="textbox"], div[data-testid="qrcode"]'))
-            )
+            initial_load = self._wait_until('page_load', EC.presence_of_element_located(
+                (By.CSS_SELECTOR, 'div[role="textbox"], div[data-testid="qrcode"]')))
+            if initial_load is None:
+                logger.error("WhatsApp Web did not load in time")
+                return False
             
             # Check if already logged in
             textbox = self.driver.find_elements(By.CSS_SELECTOR, 'div[role="textbox"]')
@@ -126,7 +306,7 @@ class WhatsAppBot:
                         logger.info("Successfully logged in to WhatsApp Web!")
                         return True
                 except Exception as e:
-                    logger.warning(f"Login timeout or error: {str(e)}")
+                    logger.warning("Login timeout or error: %s", e)
                     # For headless mode, we might need to use existing session
                     if self.headless:
                         logger.warning("Running in headless mode - ensure WhatsApp session is pre-authenticated")
@@ -137,9 +317,10 @@ class WhatsAppBot:
             return False
                 
         except Exception as e:
-            logger.error(f"Error connecting to WhatsApp Web: {str(e)}")
+            logger.error("Error connecting to WhatsApp Web: %s", e)
             return False
 
+    @tracer.traced('bot.send_message')
     def send_message_to_number(self, phone_number, message):
         """Send a message to a specific phone number"""
         try:
@@ -152,31 +333,43 @@ class WhatsAppBot:
             if not phone_number.startswith('20'):
                 phone_number = '20' + phone_number
                 
-            logger.info(f"Sending message to {phone_number}")
+            logger.info("Sending message to %s", phone_number)
+            self.last_send_strategy = None
             
             # Step 1: Try to find existing chat first
             success = self._send_to_existing_chat(phone_number, message)
             if success:
-                return True
+                self.last_send_strategy = 'existing_chat'
             
             # Step 2: Check if we're already on new chat screen with this contact visible
-            success = self._click_non_contact_if_visible(phone_number, message)
-            if success:
-                return True
+            if not success:
+                success = self._click_non_contact_if_visible(phone_number, message)
+                if success:
+                    self.last_send_strategy = 'visible_non_contact'
             
             # Step 3: Use clean URL method (phone only)
-            return self._send_to_new_chat(phone_number, message)
+            if not success:
+                success = self._send_to_new_chat(phone_number, message)
+                if success:
+                    self.last_send_strategy = 'new_chat_url'
+            
+            self.open_chat = phone_number if success else None
+            return success
                 
         except Exception as e:
-            logger.error(f"Error in send_message_to_number: {str(e)}")
+            logger.error("Error in send_message_to_number: %s", e)
+            self.open_chat = None
             return False
 
+    @tracer.traced('bot.visible_non_contact')
     def _click_non_contact_if_visible(self, phone_number, message):
         """Check if we're on new chat screen and click non-contact entry if visible"""
         try:
             # Check if we're on the new chat screen
-            current_url = self.driver.current_url
-            if "send" not in current_url and "New chat" not in self.driver.page_source:
+            with tracer.span('screen_check'):
+                current_url = self.driver.current_url
+                on_new_chat = "send" in current_url or "New chat" in self.driver.page_source
+            if not on_new_chat:
                 return False
             
             logger.info("Checking for visible non-contact entry...")
@@ -202,13 +395,15 @@ class WhatsAppBot:
                 f"//div[@role='listitem']//span[contains(text(), '+{phone_number}')]"
             ]
             
-            for selector in non_contact_selectors:
+            lookup = tracer.start_span('contact_lookup', selectors=len(non_contact_selectors))
+            for index, selector in enumerate(non_contact_selectors):
                 try:
                     contact_elements = self.driver.find_elements(By.XPATH, selector)
                     
                     for contact_element in contact_elements:
                         if contact_element and contact_element.is_displayed():
-                            logger.info(f"Found visible non-contact entry: {formatted_number}")
+                            lookup.end(misses=index)
+                            logger.info("Found visible non-contact entry: %s", formatted_number)
                             
                             # Try to click the contact or find its clickable parent
                             clickable_element = contact_element
@@ -224,27 +419,32 @@ class WhatsAppBot:
                             
                             # Click the element
                             try:
+                                previous = self._current_composer()
                                 clickable_element.click()
                                 logger.info("Clicked on non-contact entry successfully")
-                                time.sleep(2)
+                                if not self._wait_for_chat_switch(previous):
+                                    logger.debug("Chat did not open after clicking %s", formatted_number)
+                                    continue
                                 
                                 # Send the message
                                 return self._type_and_send_message(message)
                             except Exception as e:
-                                logger.debug(f"Click failed: {str(e)}")
+                                logger.debug("Click failed: %s", e)
                                 continue
                                 
                 except Exception as e:
-                    logger.debug(f"Selector failed: {selector} - {str(e)}")
+                    logger.debug("Selector failed: %s - %s", selector, e)
                     continue
             
+            lookup.end(misses=len(non_contact_selectors))
             logger.info("No visible non-contact entry found")
             return False
             
         except Exception as e:
-            logger.debug(f"Non-contact visibility check failed: {str(e)}")
+            logger.debug("Non-contact visibility check failed: %s", e)
             return False
 
+    @tracer.traced('bot.existing_chat')
     def _send_to_existing_chat(self, phone_number, message):
         """Try to send message to existing chat without page reload"""
         try:
@@ -252,8 +452,14 @@ class WhatsAppBot:
             current_url = self.driver.current_url
             if "/send" in current_url or "phone=" in current_url:
                 # Go back to main WhatsApp page first
-                self.driver.get("https://web.whatsapp.com/")
-                time.sleep(2)
+                with tracer.span('navigate_home'):
+                    self.driver.get(f"{self.base_url}/")
+                # The chat list is searched next, so wait for it to render
+                self._wait_until('page_load', EC.presence_of_element_located((By.CSS_SELECTOR, 'div[role="textbox"]')))
+                self.open_chat = None
+            
+            # The chat being left, unless it already is this number's
+            previous = None if self.open_chat == phone_number else self._current_composer()
             
             # Enhanced selectors for existing chats - including non-contact numbers
             chat_selectors = [
@@ -292,16 +498,18 @@ class WhatsAppBot:
                 f"//div[contains(text(), 'Not in your contacts')]//following-sibling::*//span[contains(text(), '{phone_number[-8:]}')]"
             ]
             
-            logger.info(f"Looking for existing chat with {phone_number} (including non-contacts)")
+            logger.info("Looking for existing chat with %s (including non-contacts)", phone_number)
             
-            for selector in chat_selectors:
+            lookup = tracer.start_span('chat_lookup', selectors=len(chat_selectors))
+            for index, selector in enumerate(chat_selectors):
                 try:
                     # Use a shorter wait time for existing chat detection
                     chat_elements = self.driver.find_elements(By.XPATH, selector)
                     
                     for chat_element in chat_elements:
                         if chat_element and chat_element.is_displayed():
-                            logger.info(f"Found existing chat (possibly non-contact), clicking...")
+                            lookup.end(misses=index)
+                            logger.info("Found existing chat (possibly non-contact), clicking...")
                             
                             # Click on the chat element or its parent container
                             try:
@@ -320,7 +528,9 @@ class WhatsAppBot:
                                     except:
                                         continue
                             
-                            time.sleep(1)
+                            if not self._wait_for_chat_switch(previous):
+                                logger.debug("Chat did not open after clicking it")
+                                continue
                             
                             # Send the message
                             success = self._type_and_send_message(message)
@@ -329,41 +539,41 @@ class WhatsAppBot:
                                 return True
                             
                 except Exception as e:
-                    logger.debug(f"Selector failed: {selector} - {str(e)}")
+                    logger.debug("Selector failed: %s - %s", selector, e)
                     continue
             
+            lookup.end(misses=len(chat_selectors))
             logger.info("No existing chat found (checked contacts and non-contacts)")
             return False  # No existing chat found
             
         except Exception as e:
-            logger.debug(f"Could not find existing chat: {str(e)}")
+            logger.debug("Could not find existing chat: %s", e)
             return False
 
+    @tracer.traced('bot.new_chat_url')
     def _send_to_new_chat(self, phone_number, message):
         """Send message to new chat - optimized approach"""
         try:
             # Clean URL with phone number only (no text to avoid mixing)
-            url = f"https://web.whatsapp.com/send?phone={phone_number}"
+            url = f"{self.base_url}/send?phone={phone_number}"
             
-            logger.info(f"Opening new chat URL: {url}")
-            self.driver.get(url)
+            logger.info("Opening new chat URL: %s", url)
+            with tracer.span('navigate'):
+                self.driver.get(url)
             
-            # Wait for WhatsApp to load
-            time.sleep(3)
-            
-            # Check if we're redirected to a chat or still on selection screen
-            current_url = self.driver.current_url
-            logger.info(f"Current URL after navigation: {current_url}")
-            
-            # If we're on a chat page, send the message directly
-            if "chat" in current_url or self._is_in_chat():
+            # Returns as soon as the chat is ready instead of sleeping a fixed time
+            if self._is_in_chat():
                 return self._type_and_send_message(message)
             
+            if logger.isEnabledFor(logging.INFO):
+                # current_url is a round trip to the browser
+                logger.info("Chat did not open, current URL: %s", self.driver.current_url)
+            
             # If we're still on selection screen, look for the contact in non-contacts
             return self._click_non_contact_if_visible(phone_number, message)
                 
         except Exception as e:
-            logger.error(f"Error in _send_to_new_chat: {str(e)}")
+            logger.error("Error in _send_to_new_chat: %s", e)
             return False
 
     def _open_new_chat_via_button(self, phone_number, message):
@@ -443,7 +653,7 @@ class WhatsAppBot:
             return False
             
         except Exception as e:
-            logger.debug(f"New chat button method failed: {str(e)}")
+            logger.debug("New chat button method failed: %s", e)
             return False
 
     def _open_new_chat_via_javascript(self, phone_number, message):
@@ -485,14 +695,14 @@ class WhatsAppBot:
             return self._type_and_send_message(message, from_url=False)
             
         except Exception as e:
-            logger.debug(f"JavaScript method failed: {str(e)}")
+            logger.debug("JavaScript method failed: %s", e)
             return False
 
     def _open_new_chat_via_url_optimized(self, phone_number, message):
         """Super optimized URL method - phone number only, then type message"""
         try:
             # Use JavaScript to navigate to phone number ONLY (no message in URL)
-            target_url = f"https://web.whatsapp.com/send?phone={phone_number}"
+            target_url = f"{self.base_url}/send?phone={phone_number}"
             
             script = f"""
             // Navigate to chat with phone number only
@@ -507,73 +717,39 @@ class WhatsAppBot:
             return self._type_and_send_message(message, from_url=False)
                 
         except Exception as e:
-            logger.error(f"Optimized URL method failed: {str(e)}")
+            logger.error("Optimized URL method failed: %s", e)
             return False
 
+    @tracer.traced('bot.type_and_send')
     def _type_and_send_message(self, message, from_url=False):
         """Type message and click send button - FAST VERSION"""
         try:
             # If message came from URL, it should already be in the input box
             if not from_url:
                 # Find message input box and type message
-                input_selectors = [
-                    "//div[@contenteditable='true'][@data-tab='10']",
-                    "//div[@role='textbox'][@contenteditable='true']",
-                    "//div[contains(@class, 'message-input')][@contenteditable='true']"
-                ]
-                
-                message_box = None
-                for selector in input_selectors:
-                    try:
-                        message_box = WebDriverWait(self.driver, 3).until(
-                            EC.presence_of_element_located((By.XPATH, selector))
-                        )
-                        if message_box.is_displayed():
-                            break
-                    except:
-                        continue
+                message_box = self._wait_until('composer', first_displayed(COMPOSER_XPATHS))
                 
                 if message_box:
                     # Clear and type message
-                    message_box.clear()
-                    message_box.send_keys(message)
+                    with tracer.span('typing', chars=len(message)):
+                        message_box.clear()
+                        message_box.send_keys(message)
                     logger.info("Message typed successfully")
                 else:
                     logger.error("Could not find message input box")
                     return False
             
-            # Wait for send button - FASTER detection with multiple attempts
-            send_selectors = [
-                "//span[@data-icon='send']",
-                "//button[@aria-label='Send']",
-                "//span[@data-icon='send']/parent::button",
-                "//div[@role='button'][@aria-label='Send']",
-                "//button[contains(@class, 'compose-btn-send')]"
-            ]
-            
-            # Try multiple times with shorter waits for faster response
-            max_attempts = 3
-            for attempt in range(max_attempts):
-                for selector in send_selectors:
-                    try:
-                        # Use shorter wait time but multiple attempts
-                        send_button = WebDriverWait(self.driver, 2).until(
-                            EC.element_to_be_clickable((By.XPATH, selector))
-                        )
-                        
-                        if send_button and send_button.is_displayed():
-                            send_button.click()
-                            logger.info("Send button clicked successfully")
-                            time.sleep(0.5)  # Shorter wait after sending
-                            return True
-                            
-                    except Exception as e:
-                        logger.debug(f"Send button attempt {attempt+1}: {selector} failed")
-                        continue
-                
-                # If no button found, wait a bit and try again
-                if attempt < max_attempts - 1:
-                    time.sleep(1)
+            # Wait for any of the send button variants to become clickable
+            send_button = self._wait_until('send_button', first_displayed(SEND_BUTTON_XPATHS, clickable=True))
+            if send_button:
+                try:
+                    send_button.click()
+                    logger.info("Send button clicked successfully")
+                    # Leave the chat only once the message has gone out
+                    self._wait_until('message_sent', composer_cleared)
+                    return True
+                except Exception as e:
+                    logger.debug("Send button click failed: %s", e)
             
             # Last resort: try pressing Enter key
             try:
@@ -588,9 +764,37 @@ class WhatsAppBot:
             return False
                 
         except Exception as e:
-            logger.error(f"Error typing and sending message: {str(e)}")
+            logger.error("Error typing and sending message: %s", e)
+            return False
+
+    def track_delivery(self, key, phone_number, tag_bubble=True):
+        """Start watching a sent message's receipt ticks under `key`.
+
+        With tag_bubble=True the newest outgoing bubble in the open chat is
+        taken to be the message, so call this straight after sending.
+        """
+        try:
+            phone_number = ''.join(filter(str.isdigit, phone_number))
+            if not phone_number.startswith('20'):
+                phone_number = '20' + phone_number
+            return bool(self.driver.execute_script(
+                RECEIPT_TRACKER_JS + "return window.__receiptTracker.track(arguments[0], arguments[1], arguments[2]);",
+                key, phone_number, tag_bubble))
+        except Exception as e:
+            logger.warning("Could not track delivery for %s: %s", key, e)
             return False
 
+    def read_delivery_receipts(self, forget=()):
+        """Drain receipt changes seen in the page as [{'key', 'state', 'at'}].
+
+        `at` is in epoch milliseconds. Returns None when the page has been
+        reloaded since tracking started, since the observer went with it.
+        """
+        return self.driver.execute_script(
+            "return window.__receiptTracker ? window.__receiptTracker.drain(arguments[0]) : null;",
+            list(forget))
+
+    @tracer.traced('bot.start')
     def start(self):
         """Initialize the bot and connect to WhatsApp Web"""
         try:
@@ -610,7 +814,7 @@ class WhatsAppBot:
                 return False
             
         except Exception as e:
-            logger.error(f"Error starting bot: {str(e)}")
+            logger.error("Error starting bot: %s", e)
             if self.driver:
                 try:
                     self.driver.quit()
@@ -628,7 +832,7 @@ class WhatsAppBot:
             self.is_running = False
             logger.info("Bot stopped successfully")
         except Exception as e:
-            logger.error(f"Error stopping bot: {str(e)}")
+            logger.error("Error stopping bot: %s", e)
 
 def main():
     # For testing